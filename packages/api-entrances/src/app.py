@@ -5,7 +5,7 @@ import json
 import io
 from flask import Flask, request, make_response, jsonify
 from src.utils import process_geojson_entrances
-from src.storage import upload_to_gcs, DEFAULT_BUCKET_NAME
+from src.storage import upload_json, DEFAULT_BUCKET_NAME
 
 app = Flask(__name__)
 
@@ -82,9 +82,9 @@ def process_entrances():
         # Process the GeoJSON to label entrances
         labeled_entrances = process_geojson_entrances(geojson_data)
         
-        # Upload to Google Cloud Storage
+        # Upload to Google Cloud Storage (or the local stand-in, see src/storage.py)
         upload_path = f"{title}/entrances.json"
-        public_url = upload_to_gcs(labeled_entrances, DEFAULT_BUCKET_NAME, upload_path)
+        public_url = upload_json(labeled_entrances, DEFAULT_BUCKET_NAME, upload_path)
         
         # Return success response with public URL
         result = {
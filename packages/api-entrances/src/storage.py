@@ -1,29 +1,199 @@
 """
-Google Cloud Storage utilities
+Object storage backends (Google Cloud Storage or a local directory) and upload utilities
 """
 import json
-from google.cloud import storage
+import os
+import tempfile
+import threading
+
+from google.api_core.exceptions import NotFound
+
+# A copy of the backends in packages/api/src/storage.py, since the two services are built separately.
+
+# gcs (default) talks to Cloud Storage; local stores objects under STORAGE_DIR/<bucket>/<name>,
+# which stands in for Cloud Storage in offline development and load tests
+DEFAULT_BACKEND = os.environ.get('STORAGE_BACKEND', 'gcs')
+DEFAULT_LOCAL_DIR = os.environ.get('STORAGE_DIR', os.path.join(tempfile.gettempdir(), 'campus-navigator-storage'))
+# Connections kept open to Cloud Storage per process, enough for every request thread
+DEFAULT_POOL_SIZE = int(os.environ.get('STORAGE_POOL_SIZE', 16))
+
+BACKENDS = ('gcs', 'local')
 
 # Define GCS bucket for storing processed JSON files
 DEFAULT_BUCKET_NAME = 'gu-campus-maps'
 
-def upload_to_gcs(data, bucket_name=DEFAULT_BUCKET_NAME, blob_path=None):
-    """Upload JSON data to Google Cloud Storage.
-    
+
+class GCSStorage:
+    """One bucket of Google Cloud Storage, through a single long-lived client.
+
+    The client, its credentials and its pool of keep-alive connections are
+    created on first use and reused by every call and thread, so only the
+    first call pays for the auth handshake and TLS setup.
+    """
+
+    def __init__(self, bucket_name, pool_size=DEFAULT_POOL_SIZE):
+        """
+        Args:
+            bucket_name (str): Name of the bucket
+            pool_size (int): Most connections kept open to Cloud Storage
+        """
+        self.bucket_name = bucket_name
+        self.pool_size = pool_size
+        self._bucket = None
+        self._lock = threading.Lock()
+
+    def generation(self, name):
+        """Version of an object, which changes whenever it is overwritten.
+
+        Returns:
+            str or None: The version, or None if the object does not exist
+        """
+        blob = self.bucket().get_blob(name)
+        return None if blob is None else str(blob.generation)
+
+    def read(self, name, generation=None):
+        """Contents of an object, optionally of one specific generation.
+
+        Raises:
+            FileNotFoundError: If the object (or that generation) does not exist
+        """
+        blob = self.bucket().blob(name, generation=None if generation is None else int(generation))
+        try:
+            return blob.download_as_bytes()
+        except NotFound:
+            raise FileNotFoundError(f"gs://{self.bucket_name}/{name} does not exist") from None
+
+    def write(self, name, data, content_type='application/octet-stream'):
+        """Store an object, replacing any previous version."""
+        self.bucket().blob(name).upload_from_string(data, content_type=content_type)
+
+    def url(self, name):
+        """Public URL of an object."""
+        return self.bucket().blob(name).public_url
+
+    def reset(self):
+        """Drop the client, e.g. in a forked worker, so the next call opens its own connections."""
+        with self._lock:
+            self._bucket = None
+
+    def bucket(self):
+        bucket = self._bucket
+        if bucket is None:
+            with self._lock:
+                if self._bucket is None:
+                    self._bucket = self._client().bucket(self.bucket_name)
+                bucket = self._bucket
+        return bucket
+
+    def _client(self):
+        import google.auth
+        from google.auth.transport.requests import AuthorizedSession
+        from google.cloud import storage
+        from requests.adapters import HTTPAdapter
+
+        credentials, project = google.auth.default()
+        session = AuthorizedSession(credentials)
+        # The default pool keeps 10 connections; size it for every request thread
+        # and retry connection errors instead of failing the request
+        session.mount('https://', HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size,
+                                              max_retries=3))
+        return storage.Client(project=project, credentials=credentials, _http=session)
+
+
+class LocalStorage:
+    """A directory that stands in for a Cloud Storage bucket.
+
+    Objects are files under root/bucket_name, and an object's generation is
+    its modification time in nanoseconds.
+    """
+
+    def __init__(self, bucket_name, root=DEFAULT_LOCAL_DIR):
+        """
+        Args:
+            bucket_name (str): Name of the bucket, used as a subdirectory of root
+            root (str): Directory holding the buckets
+        """
+        self.bucket_name = bucket_name
+        self.directory = os.path.join(root, bucket_name)
+
+    def path(self, name):
+        path = os.path.normpath(os.path.join(self.directory, name))
+        if not path.startswith(os.path.normpath(self.directory) + os.sep):
+            raise ValueError(f"Object name {name!r} is outside the bucket")
+        return path
+
+    def generation(self, name):
+        try:
+            return str(os.stat(self.path(name)).st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    def read(self, name, generation=None):
+        # Old generations are not kept, so asking for one that was replaced fails like in GCS
+        if generation is not None and self.generation(name) != str(generation):
+            raise FileNotFoundError(f"{self.path(name)} generation {generation} does not exist")
+        with open(self.path(name), 'rb') as file:
+            return file.read()
+
+    def write(self, name, data, content_type='application/octet-stream'):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def url(self, name):
+        return 'file://' + self.path(name)
+
+    def reset(self):
+        pass
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_storage(bucket_name, backend=None):
+    """The process-wide storage backend for a bucket, as chosen by STORAGE_BACKEND.
+
+    Every caller gets the same instance, so a process keeps one GCS client per bucket.
+
+    Args:
+        bucket_name (str): Name of the bucket
+        backend (str): 'gcs' or 'local', defaults to STORAGE_BACKEND
+
+    Returns:
+        GCSStorage or LocalStorage
+    """
+    backend = backend or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown storage backend {backend!r}; choose from {list(BACKENDS)}")
+    key = (backend, bucket_name)
+    with _backends_lock:
+        storage = _backends.get(key)
+        if storage is None:
+            storage = _backends[key] = GCSStorage(bucket_name) if backend == 'gcs' else LocalStorage(bucket_name)
+        return storage
+
+
+def upload_json(data, bucket_name=DEFAULT_BUCKET_NAME, blob_path=None):
+    """Upload JSON data to the configured storage backend.
+
     Args:
         data: The data to upload (will be converted to JSON)
-        bucket_name (str): The name of the GCS bucket
+        bucket_name (str): The name of the bucket
         blob_path (str): The path within the bucket where the file should be stored
-        
+
     Returns:
         str: Public URL of the uploaded file
     """
-    client = storage.Client()
-    bucket = client.bucket(bucket_name)
-    blob = bucket.blob(blob_path)
-    
-    # Convert data to JSON string and upload
-    json_data = json.dumps(data, indent=2)
-    blob.upload_from_string(json_data, content_type='application/json')
-    
-    return blob.public_url
+    storage = get_storage(bucket_name)
+    storage.write(blob_path, json.dumps(data, indent=2), content_type='application/json')
+    return storage.url(blob_path)
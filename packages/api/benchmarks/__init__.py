@@ -0,0 +1,3 @@
+"""
+Routing benchmarks over the campus grid
+"""
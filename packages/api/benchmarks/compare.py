@@ -0,0 +1,88 @@
+"""
+Compare two benchmark result files, e.g. from the base and head of a change
+"""
+import argparse
+import json
+import sys
+
+DEFAULT_THRESHOLD = 0.10
+
+
+def compare_results(base, head, threshold=DEFAULT_THRESHOLD):
+    """Match the rows of two result files and flag regressions.
+
+    Latency regressions are p50 slowdowns beyond the threshold. Nodes expanded
+    and path costs are deterministic, so any increase in expansions beyond the
+    threshold, or any change in the routes found or their total cost, is flagged too.
+
+    Args:
+        base (dict): Results written by benchmarks.run for the baseline
+        head (dict): Results for the change being checked
+        threshold (float): Relative change treated as significant
+
+    Returns:
+        tuple: (rows, problems) where rows are (key, base row, head row) and
+            problems are human-readable strings
+    """
+    problems = []
+    for field in ('grid_checksum', 'seed', 'pairs_per_category'):
+        if base['meta'].get(field) != head['meta'].get(field):
+            problems.append(f"{field} differs ({base['meta'].get(field)} vs {head['meta'].get(field)}), "
+                            "so the corpora are not the same")
+
+    def keyed(results):
+        return {(row['engine'], row['padding'], row['category']): row for row in results['results']}
+
+    base_rows, head_rows = keyed(base), keyed(head)
+    rows = []
+    for key in sorted(base_rows.keys() & head_rows.keys()):
+        old, new = base_rows[key], head_rows[key]
+        rows.append((key, old, new))
+        label = '/'.join(str(part) for part in key)
+        if _change(old['latency_ms']['p50'], new['latency_ms']['p50']) > threshold:
+            problems.append(f"{label}: p50 latency {old['latency_ms']['p50']:.3f} -> {new['latency_ms']['p50']:.3f} ms")
+        if _change(old['nodes_expanded']['mean'], new['nodes_expanded']['mean']) > threshold:
+            problems.append(f"{label}: mean nodes expanded {old['nodes_expanded']['mean']:.0f} -> "
+                            f"{new['nodes_expanded']['mean']:.0f}")
+        if old['found'] != new['found']:
+            problems.append(f"{label}: routes found {old['found']} -> {new['found']}")
+        elif abs(old['total_cost'] - new['total_cost']) > 1e-3 * max(1.0, old['total_cost']):
+            problems.append(f"{label}: total path cost {old['total_cost']} -> {new['total_cost']}")
+    return rows, problems
+
+
+def _change(old, new):
+    return (new - old) / old if old else 0.0
+
+
+def main():
+    """Print a side-by-side comparison; exit with status 1 if anything regressed."""
+    parser = argparse.ArgumentParser(description="Compare two routing benchmark result files.")
+    parser.add_argument("base", help="Results of the baseline")
+    parser.add_argument("head", help="Results of the change")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative slowdown treated as a regression (default: 0.10)")
+    args = parser.parse_args()
+
+    with open(args.base, 'r', encoding='utf-8') as file:
+        base = json.load(file)
+    with open(args.head, 'r', encoding='utf-8') as file:
+        head = json.load(file)
+    rows, problems = compare_results(base, head, args.threshold)
+
+    print(f"base {base['meta'].get('commit')}  head {head['meta'].get('commit')}")
+    print(f"{'engine':<8} {'pad':>3} {'category':<17} {'p50 ms':>17} {'change':>7} {'p99 ms':>17} {'expanded':>7}")
+    for (engine, padding, category), old, new in rows:
+        p50 = f"{old['latency_ms']['p50']:.3f} -> {new['latency_ms']['p50']:.3f}"
+        p99 = f"{old['latency_ms']['p99']:.3f} -> {new['latency_ms']['p99']:.3f}"
+        print(f"{engine:<8} {padding:>3} {category:<17} {p50:>17} "
+              f"{_change(old['latency_ms']['p50'], new['latency_ms']['p50']):>+7.1%} {p99:>17} "
+              f"{_change(old['nodes_expanded']['mean'], new['nodes_expanded']['mean']):>+7.1%}")
+
+    for problem in problems:
+        print(f"REGRESSION {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
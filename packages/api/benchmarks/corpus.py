@@ -0,0 +1,117 @@
+"""
+Seeded origin/destination corpus over a map version
+"""
+import os
+import random
+from collections import namedtuple
+
+import numpy as np
+
+from routing_engine.jps import mask_checksum
+from routing_engine.map_bundle import load_config
+
+from src.grid_cache import GridCache
+from src.map_version import SERVED_PADDINGS, MapVersion
+
+DEFAULT_GRID = os.path.join(os.path.dirname(__file__), '..', '..', 'data-processing', 'grid_config.json')
+DEFAULT_SEED = 0
+DEFAULT_PAIRS = 10
+
+# Kinds of pairs, classified in this order:
+#   unreachable       start and goal lie in different connected regions
+#   short             at most SHORT_CELLS apart (chessboard distance)
+#   long              at least LONG_CELLS apart
+#   through_building  in between, and the straight line between them crosses a building
+# Pairs in between whose straight line is clear are not used.
+CATEGORIES = ('short', 'long', 'through_building', 'unreachable')
+SHORT_CELLS = 40
+LONG_CELLS = 250
+
+# Candidate pairs drawn per requested pair before giving up on a category
+_ATTEMPTS_PER_PAIR = 2000
+
+Pair = namedtuple('Pair', ['category', 'padding', 'start', 'goal'])
+
+
+def load_map_version(path=DEFAULT_GRID):
+    """Build a MapVersion from a grid config or bundle on disk, with any sidecars next to it.
+
+    Sidecars are looked up like GridCache does, e.g. grid_config.jps.npz for grid_config.json.
+    """
+    base = path.rsplit('.', 1)[0]
+    sidecars = {}
+    for suffix in GridCache.sidecar_suffixes:
+        sidecar_path = base + suffix
+        if suffix in GridCache.mapped_suffixes and os.path.exists(sidecar_path):
+            sidecars[suffix] = sidecar_path
+        elif os.path.exists(sidecar_path):
+            with open(sidecar_path, 'rb') as file:
+                sidecars[suffix] = file.read()
+    return MapVersion(load_config(path), os.path.basename(path), sidecars)
+
+
+def grid_checksum(map_version):
+    """Checksum of the unpadded blocked mask, so results over different grids are never compared."""
+    return mask_checksum(map_version.engine.blocked(0))
+
+
+def build_corpus(map_version, pairs_per_category=DEFAULT_PAIRS, paddings=SERVED_PADDINGS, seed=DEFAULT_SEED):
+    """Draw origin/destination pairs of every category for every padding level.
+
+    The same grid, seed and arguments always give the same corpus. Categories
+    that are rare on a grid (e.g. unreachable pairs without padding) may end
+    up with fewer pairs than requested.
+
+    Args:
+        map_version (MapVersion): Map to draw cells from
+        pairs_per_category (int): Pairs wanted per category and padding level
+        paddings (tuple): Padding levels to draw pairs for
+        seed (int): Seed of the random generator
+
+    Returns:
+        list: Pair tuples, grouped by padding and then category
+    """
+    rng = random.Random(seed)
+    engine = map_version.engine
+    buildings = engine.blocked(0)
+    rows, cols = map_version.obstacle_distance.shape
+
+    corpus = []
+    for padding in paddings:
+        free = np.flatnonzero(map_version.obstacle_distance.ravel() > padding).tolist()
+        found = {category: [] for category in CATEGORIES}
+        for _ in range(_ATTEMPTS_PER_PAIR * pairs_per_category):
+            if all(len(pairs) >= pairs_per_category for pairs in found.values()):
+                break
+            start = divmod(rng.choice(free), cols)
+            if len(found['short']) < pairs_per_category and rng.random() < 0.5:
+                # Nearby goals are drawn directly, since uniform pairs are rarely this close
+                goal = (start[0] + rng.randint(-SHORT_CELLS, SHORT_CELLS),
+                        start[1] + rng.randint(-SHORT_CELLS, SHORT_CELLS))
+                if not (0 <= goal[0] < rows and 0 <= goal[1] < cols) or \
+                        map_version.obstacle_distance[goal] <= padding:
+                    continue
+            else:
+                goal = divmod(rng.choice(free), cols)
+            if goal == start:
+                continue
+
+            category = _classify(map_version, buildings, start, goal, padding)
+            if category is not None and len(found[category]) < pairs_per_category:
+                found[category].append(Pair(category, padding, start, goal))
+        for category in CATEGORIES:
+            corpus.extend(found[category])
+    return corpus
+
+
+def _classify(map_version, buildings, start, goal, padding):
+    if not map_version.components.connected(start, goal, padding):
+        return 'unreachable'
+    span = max(abs(start[0] - goal[0]), abs(start[1] - goal[1]))
+    if span <= SHORT_CELLS:
+        return 'short'
+    if span >= LONG_CELLS:
+        return 'long'
+    if not map_version.engine.line_of_sight(buildings, start, goal):
+        return 'through_building'
+    return None
@@ -0,0 +1,330 @@
+"""
+Differential check of the routing engines against the reference A*
+"""
+import argparse
+import json
+import logging
+import math
+import random
+import sys
+from collections import Counter, namedtuple
+
+import numpy as np
+
+from routing_engine.distance_transform import obstacle_distance
+from routing_engine.hpa import HierarchicalSearch
+from routing_engine.jps import JumpPointSearch
+from routing_engine.landmarks import LandmarkSearch
+from routing_engine.reference import a_star
+from routing_engine.search import GridSearch
+from routing_engine.theta import ThetaStarSearch
+
+from benchmarks.corpus import DEFAULT_GRID, DEFAULT_PAIRS, DEFAULT_SEED, build_corpus, load_map_version
+from src.map_version import SERVED_PADDINGS
+
+# Relative difference in path length tolerated between a candidate and the reference
+DEFAULT_TOLERANCE = 1e-4
+# Engines that trade optimality for speed, with how much longer than the shortest
+# path their routes may be. HPA* stays within about 6% on short random-grid routes and
+# within a few tenths of a percent on the campus grid.
+ENGINE_SUBOPTIMALITY = {'hpa': 0.10}
+# Engines whose paths are waypoints joined by straight segments instead of 8-connected steps
+ANY_ANGLE_ENGINES = {'theta'}
+DEFAULT_RANDOM_GRIDS = 200
+
+# Build each candidate engine over a fresh GridSearch, so failures can be replayed on shrunk grids
+ENGINE_FACTORIES = {
+    'astar': lambda grid_search: grid_search,
+    'jps': JumpPointSearch,
+    'hpa': HierarchicalSearch,
+    'alt': LandmarkSearch,
+    'theta': ThetaStarSearch,
+}
+
+Mismatch = namedtuple('Mismatch', ['engine', 'kind', 'detail', 'grid', 'padding', 'start', 'goal'])
+Mismatch.__doc__ = """A pair on which a candidate disagrees with the reference.
+
+kind is 'reachability', 'cost', 'infeasible' or 'error'; grid is a list of rows (1 = obstacle).
+"""
+
+
+def path_length(path):
+    return sum(math.dist(a, b) for a, b in zip(path, path[1:]))
+
+
+def reference_path(grid, distance, start, goal, padding):
+    """Path of the reference a_star."""
+    return a_star(grid, start, goal, custom_padding=padding, distance=distance.tolist())
+
+
+def check_pair(engine, distance, start, goal, padding, expected, tolerance=DEFAULT_TOLERANCE, suboptimality=0.0,
+               any_angle=False):
+    """Compare one candidate search with the reference path.
+
+    Args:
+        engine: Object with a search(start, goal, padding) method returning a SearchResult
+        distance (np.ndarray): Obstacle distance transform of the grid
+        start (tuple): (row, col) of the start cell
+        goal (tuple): (row, col) of the goal cell
+        padding (int): Padding level of the search
+        expected (list): Reference path, empty if it found none
+        tolerance (float): Relative path length difference accepted
+        suboptimality (float): How much longer than the reference path a candidate path may
+            be, for engines that are not exact. Shorter paths are only accepted from any-angle engines.
+        any_angle (bool): The candidate returns waypoints (see ANY_ANGLE_ENGINES). Each segment
+            longer than a step must then have line of sight at the padding, and the path may be shorter than the
+            reference, though never shorter than the straight line from start to goal.
+
+    Returns:
+        tuple: (kind, detail) of the first problem found, or None if the candidate agrees
+    """
+    try:
+        result = engine.search(start, goal, padding)
+    except Exception as error:  # Any crash on a valid query is a failure of the engine
+        return 'error', f'{type(error).__name__}: {error}'
+    path = result.path
+
+    if bool(path) != bool(expected):
+        return 'reachability', f'reference {"found" if expected else "found no"} path, candidate ' \
+                               f'{"found" if path else "found no"} path'
+    if not path:
+        return None
+
+    if path[0] != start or path[-1] != goal:
+        return 'infeasible', f'path runs from {path[0]} to {path[-1]}'
+    rows, cols = distance.shape
+    for cell in path:
+        if not (0 <= cell[0] < rows and 0 <= cell[1] < cols) or distance[cell] <= padding:
+            return 'infeasible', f'path enters blocked cell {cell}'
+    for a, b in zip(path, path[1:]):
+        span = max(abs(a[0] - b[0]), abs(a[1] - b[1]))
+        if any_angle and span > 1:
+            # Single steps may cut an obstacle corner diagonally, like in every grid engine
+            if not engine.grid.line_of_sight(engine.grid.blocked(padding), a, b):
+                return 'infeasible', f'segment from {a} to {b} is blocked'
+        elif span != 1:
+            return 'infeasible', f'path jumps from {a} to {b}'
+
+    length, expected_length = path_length(path), path_length(expected)
+    shortest = math.dist(start, goal) if any_angle else expected_length
+    if length < shortest * (1 - tolerance) or length > expected_length * (1 + suboptimality + tolerance):
+        return 'cost', f'length {length:.4f} vs reference {expected_length:.4f}'
+    if result.cost is not None and not math.isclose(result.cost, length, rel_tol=tolerance):
+        return 'cost', f'reported cost {result.cost:.4f} but path length {length:.4f}'
+    return None
+
+
+def shrink(mismatch, tolerance=DEFAULT_TOLERANCE):
+    """Reduce a mismatch to a small grid that still fails the same way.
+
+    The grid is cropped to a window around the pair, the endpoints are pulled
+    towards each other and obstacles are removed in ever smaller chunks, until
+    none of these changes anything. Each step is kept only if the candidate
+    still fails with the same kind of mismatch.
+
+    Returns:
+        Mismatch: The smallest failing case found
+    """
+    def failure(grid, start, goal):
+        distance = obstacle_distance(grid)
+        if distance[start] <= mismatch.padding or distance[goal] <= mismatch.padding:
+            return None
+        engine = ENGINE_FACTORIES[mismatch.engine](GridSearch(distance))
+        expected = reference_path(grid, distance, start, goal, mismatch.padding)
+        problem = check_pair(engine, distance, start, goal, mismatch.padding, expected, tolerance,
+                             ENGINE_SUBOPTIMALITY.get(mismatch.engine, 0.0), mismatch.engine in ANY_ANGLE_ENGINES)
+        return problem if problem is not None and problem[0] == mismatch.kind else None
+
+    grid, start, goal = [list(row) for row in mismatch.grid], mismatch.start, mismatch.goal
+    detail = mismatch.detail
+
+    def crop(grid, start, goal, detail):
+        # The smallest window around the pair that still fails
+        for margin in (64, 32, 16, 8, 4, 2, 1, 0):
+            rows, cols = len(grid), len(grid[0])
+            top, left = max(min(start[0], goal[0]) - margin, 0), max(min(start[1], goal[1]) - margin, 0)
+            bottom = min(max(start[0], goal[0]) + margin + 1, rows)
+            right = min(max(start[1], goal[1]) + margin + 1, cols)
+            if (bottom - top, right - left) == (rows, cols):
+                continue
+            cropped = [row[left:right] for row in grid[top:bottom]]
+            moved_start, moved_goal = (start[0] - top, start[1] - left), (goal[0] - top, goal[1] - left)
+            problem = failure(cropped, moved_start, moved_goal)
+            if problem is not None:
+                grid, start, goal, detail = cropped, moved_start, moved_goal, problem[1]
+        return grid, start, goal, detail
+
+    def toward(cell, other, step, axes):
+        return tuple(a + max(-step, min(step, b - a)) if axis in axes else a
+                     for axis, (a, b) in enumerate(zip(cell, other)))
+
+    def pull(grid, start, goal, detail):
+        # Move the endpoints towards each other, in halving steps, while the failure persists
+        step = max(abs(start[0] - goal[0]), abs(start[1] - goal[1])) // 2
+        while step >= 1:
+            moved = False
+            candidates = [(start, toward(goal, start, step, axes)) for axes in ((0, 1), (0,), (1,))] + \
+                [(toward(start, goal, step, axes), goal) for axes in ((0, 1), (0,), (1,))]
+            for pulled_start, pulled_goal in candidates:
+                if pulled_start == pulled_goal or (pulled_start, pulled_goal) == (start, goal):
+                    continue
+                problem = failure(grid, pulled_start, pulled_goal)
+                if problem is not None:
+                    start, goal, detail, moved = pulled_start, pulled_goal, problem[1], True
+                    break
+            if not moved:
+                step //= 2
+        return start, goal, detail
+
+    def clear(grid, start, goal, detail):
+        # Remove obstacles in halving chunks while the failure persists
+        obstacles = [(row, col) for row, cells in enumerate(grid) for col, cell in enumerate(cells) if cell]
+        chunk = len(obstacles)
+        while chunk >= 1 and obstacles:
+            kept, removed_any = [], False
+            for i in range(0, len(obstacles), chunk):
+                part = obstacles[i:i + chunk]
+                for row, col in part:
+                    grid[row][col] = 0
+                problem = failure(grid, start, goal)
+                if problem is not None:
+                    detail, removed_any = problem[1], True
+                else:
+                    for row, col in part:
+                        grid[row][col] = 1
+                    kept.extend(part)
+            obstacles = kept
+            if not removed_any:
+                chunk //= 2
+        return detail
+
+    # Each pass can unlock the others (e.g. a cleared obstacle lets an endpoint move), so repeat until stable
+    grid, start, goal, detail = crop(grid, start, goal, detail)
+    while True:
+        before = (start, goal, [list(row) for row in grid])
+        start, goal, detail = pull(grid, start, goal, detail)
+        grid, start, goal, detail = crop(grid, start, goal, detail)
+        detail = clear(grid, start, goal, detail)
+        if (start, goal, grid) == before:
+            break
+
+    return mismatch._replace(grid=grid, start=start, goal=goal, detail=detail)
+
+
+def render_grid(mismatch):
+    """The grid of a mismatch as text: # obstacle, . free, S start, G goal."""
+    lines = []
+    for row, cells in enumerate(mismatch.grid):
+        line = ['#' if cell else '.' for cell in cells]
+        if row == mismatch.start[0]:
+            line[mismatch.start[1]] = 'S'
+        if row == mismatch.goal[0]:
+            line[mismatch.goal[1]] = 'G'
+        lines.append(''.join(line))
+    return '\n'.join(lines)
+
+
+def random_cases(count, seed):
+    """Small random grids with a few pairs each, for broad coverage of corner cases.
+
+    Yields:
+        tuple: (grid, padding, start, goal)
+    """
+    rng = random.Random(seed)
+    for _ in range(count):
+        rows, cols = rng.randint(8, 48), rng.randint(8, 48)
+        density = rng.uniform(0.05, 0.4)
+        grid = [[1 if rng.random() < density else 0 for _ in range(cols)] for _ in range(rows)]
+        distance = obstacle_distance(grid)
+        for padding in (0, 1):
+            free = np.argwhere(distance > padding)
+            if len(free) < 2:
+                continue
+            for _ in range(3):
+                start, goal = (tuple(int(x) for x in free[rng.randrange(len(free))]) for _ in range(2))
+                yield grid, padding, start, goal
+
+
+def run_differential(cases, engine_names, tolerance=DEFAULT_TOLERANCE):
+    """Replay cases against the reference and every candidate engine.
+
+    Args:
+        cases: Iterable of (grid, padding, start, goal); consecutive cases on
+            the same grid object share its engines
+        engine_names (list): Keys of ENGINE_FACTORIES
+        tolerance (float): Relative path length difference accepted
+
+    Returns:
+        tuple: (Counter of checked pairs per engine, list of Mismatch)
+    """
+    checked, mismatches = Counter(), []
+    current, engines, distance = None, None, None
+    for grid, padding, start, goal in cases:
+        if grid is not current:
+            current, distance = grid, obstacle_distance(grid)
+            grid_search = GridSearch(distance)
+            engines = {name: ENGINE_FACTORIES[name](grid_search) for name in engine_names}
+        expected = reference_path(grid, distance, start, goal, padding)
+        for name, engine in engines.items():
+            checked[name] += 1
+            problem = check_pair(engine, distance, start, goal, padding, expected, tolerance,
+                                 ENGINE_SUBOPTIMALITY.get(name, 0.0), name in ANY_ANGLE_ENGINES)
+            if problem is not None:
+                mismatches.append(Mismatch(name, problem[0], problem[1], grid, padding, start, goal))
+    return checked, mismatches
+
+
+def main():
+    """Check every candidate engine; print minimal repros and exit with status 1 on any mismatch."""
+    parser = argparse.ArgumentParser(description="Check routing engines against the reference A*.")
+    parser.add_argument("grid_config", nargs='?', default=DEFAULT_GRID,
+                        help="Grid config or map bundle to draw the campus corpus from")
+    parser.add_argument("--engines", nargs='+', default=sorted(ENGINE_FACTORIES),
+                        choices=sorted(ENGINE_FACTORIES), help="Candidate engines (default: all)")
+    parser.add_argument("--pairs", type=int, default=DEFAULT_PAIRS,
+                        help="Campus pairs per category and padding, 0 to skip the campus grid")
+    parser.add_argument("--random-grids", type=int, default=DEFAULT_RANDOM_GRIDS,
+                        help="Small random grids to check as well")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Seed of both corpora")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Relative path length difference accepted")
+    parser.add_argument("--max-repros", type=int, default=5, help="Mismatches to shrink per engine and kind")
+    parser.add_argument("--output", help="Write the mismatches and their repros as JSON")
+    args = parser.parse_args()
+    # Every random grid builds its own landmark tables, which is expected here
+    logging.getLogger('routing_engine.landmarks').setLevel(logging.ERROR)
+
+    cases = list(random_cases(args.random_grids, args.seed))
+    if args.pairs > 0:
+        map_version = load_map_version(args.grid_config)
+        grid = np.asarray(map_version.grid, dtype=np.uint8).tolist()
+        cases.extend((grid, pair.padding, pair.start, pair.goal)
+                     for pair in build_corpus(map_version, args.pairs, SERVED_PADDINGS, args.seed))
+    print(f"Checking {len(cases)} pairs against the reference A* with {', '.join(args.engines)}")
+
+    checked, mismatches = run_differential(cases, args.engines, args.tolerance)
+    for name in args.engines:
+        failed = Counter(mismatch.kind for mismatch in mismatches if mismatch.engine == name)
+        summary = ', '.join(f'{count} {kind}' for kind, count in sorted(failed.items())) or 'ok'
+        print(f"{name:<6} {checked[name]:>6} pairs  {summary}")
+
+    repros, shrunk = [], Counter()
+    for mismatch in mismatches:
+        if shrunk[mismatch.engine, mismatch.kind] >= args.max_repros:
+            continue
+        shrunk[mismatch.engine, mismatch.kind] += 1
+        repro = shrink(mismatch, args.tolerance)
+        repros.append(repro)
+        print(f"\n{repro.engine} {repro.kind} at padding {repro.padding}, {repro.start} -> {repro.goal}: "
+              f"{repro.detail}\n{render_grid(repro)}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump({'checked': dict(checked), 'mismatches': len(mismatches),
+                       'repros': [dict(repro._asdict(), grid=render_grid(repro).split('\n')) for repro in repros]},
+                      file, indent=2)
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
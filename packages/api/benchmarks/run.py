@@ -0,0 +1,187 @@
+"""
+Time every routing engine over the seeded corpus and write the results as JSON
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+from routing_engine.landmarks import LandmarkSearch, load_landmark_tables
+
+from benchmarks.corpus import (CATEGORIES, DEFAULT_GRID, DEFAULT_PAIRS, DEFAULT_SEED, build_corpus,
+                               grid_checksum, load_map_version)
+from src.map_version import SERVED_PADDINGS
+
+RESULTS_VERSION = 1
+DEFAULT_REPEAT = 3
+# Engines the API does not serve, only timed when named with --engines
+BENCHMARK_ONLY_ENGINES = ('alt',)
+
+
+def benchmark_engines(map_version, grid_config):
+    """The served engines of a map version, plus the benchmark-only ones.
+
+    ALT uses the landmark tables of <grid_config>.alt.npz when they match the
+    grid, and otherwise builds them here, before any search is timed.
+    """
+    engines = dict(map_version.engines)
+    tables_path = grid_config.rsplit('.', 1)[0] + '.alt.npz'
+    stored = load_landmark_tables(tables_path) if os.path.exists(tables_path) else None
+    engines['alt'] = LandmarkSearch(map_version.engine, stored)
+    for padding in SERVED_PADDINGS:
+        engines['alt'].tables(padding)
+    return engines
+
+
+def run_benchmark(map_version, corpus, engine_names, repeat=DEFAULT_REPEAT, memory=True, engines=None):
+    """Search every pair of the corpus with every engine.
+
+    Each pair is searched repeat times and its fastest time is kept, which
+    filters out scheduler noise. Memory is measured separately under
+    tracemalloc, which slows searches down several times over, so only the
+    pair with the largest open set of each group is traced.
+
+    Args:
+        map_version (MapVersion): Map the corpus was drawn from, already warmed
+        corpus (list): Pair tuples from build_corpus
+        engine_names (list): Keys of engines
+        repeat (int): Timed searches per pair
+        memory (bool): Also record the peak memory allocated by a search of each group
+        engines (dict): Engines by name, map_version.engines by default (see benchmark_engines)
+
+    Returns:
+        list: One summary dict per engine, padding and category
+    """
+    groups = {}
+    for pair in corpus:
+        groups.setdefault((pair.padding, pair.category), []).append(pair)
+
+    engines = engines or map_version.engines
+    results = []
+    for engine_name in engine_names:
+        engine = engines[engine_name]
+        for (padding, category), pairs in groups.items():
+            latencies, expanded, peaks, costs = [], [], [], []
+            for pair in pairs:
+                best = float('inf')
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    result = engine.search(pair.start, pair.goal, pair.padding)
+                    best = min(best, time.perf_counter() - started)
+                latencies.append(best * 1e3)
+                expanded.append(result.nodes_expanded)
+                peaks.append(result.open_peak)
+                costs.append(result.cost)
+
+            allocated = None
+            if memory:
+                largest = pairs[peaks.index(max(peaks))]
+                tracemalloc.start()
+                engine.search(largest.start, largest.goal, largest.padding)
+                allocated = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+                tracemalloc.stop()
+
+            found = [cost for cost in costs if cost is not None]
+            results.append({
+                'engine': engine_name,
+                'padding': padding,
+                'category': category,
+                'pairs': len(pairs),
+                'found': len(found),
+                'total_cost': round(sum(found), 4),
+                'latency_ms': _summary(latencies),
+                'nodes_expanded': _summary(expanded),
+                'open_set_peak': _summary(peaks),
+                'peak_alloc_kb': allocated,
+            })
+    return results
+
+
+def _summary(values):
+    values = np.asarray(values, dtype=float)
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {'mean': round(float(values.mean()), 4), 'p50': round(float(p50), 4), 'p90': round(float(p90), 4),
+            'p99': round(float(p99), 4), 'max': round(float(values.max()), 4)}
+
+
+def _git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                               text=True, check=True).stdout.strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    """Run the benchmark and write results that benchmarks.compare can diff."""
+    parser = argparse.ArgumentParser(description="Benchmark the routing engines on the campus grid.")
+    parser.add_argument("grid_config", nargs='?', default=DEFAULT_GRID,
+                        help="Grid config or map bundle; sidecars next to it are loaded too")
+    parser.add_argument("--engines", nargs='+',
+                        help=f"Engines to run (default: all served grid engines; also {', '.join(BENCHMARK_ONLY_ENGINES)})")
+    parser.add_argument("--paddings", nargs='+', type=int, default=list(SERVED_PADDINGS),
+                        help="Padding levels to draw pairs for")
+    parser.add_argument("--pairs", type=int, default=DEFAULT_PAIRS, help="Pairs per category and padding")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Seed of the corpus")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Timed searches per pair")
+    parser.add_argument("--no-memory", action='store_true', help="Skip the tracemalloc pass")
+    parser.add_argument("--output", default='benchmark.json', help="Where to write the results")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    map_version = load_map_version(args.grid_config).warm()
+    load_seconds = time.perf_counter() - started
+    engine_names = args.engines or sorted(map_version.engines)
+    known = sorted(map_version.engines) + list(BENCHMARK_ONLY_ENGINES)
+    unknown = set(engine_names) - set(known)
+    if unknown:
+        parser.error(f"Unknown engines {sorted(unknown)}; choose from {known}")
+    engines = map_version.engines
+    if set(engine_names) & set(BENCHMARK_ONLY_ENGINES):
+        engines = benchmark_engines(map_version, args.grid_config)
+
+    corpus = build_corpus(map_version, args.pairs, tuple(args.paddings), args.seed)
+    print(f"Corpus of {len(corpus)} pairs; running {', '.join(engine_names)}")
+    results = run_benchmark(map_version, corpus, engine_names, args.repeat, not args.no_memory, engines)
+
+    output = {
+        'version': RESULTS_VERSION,
+        'meta': {
+            'commit': _git_commit(),
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'grid': os.path.normpath(args.grid_config),
+            'grid_checksum': grid_checksum(map_version),
+            'seed': args.seed,
+            'pairs_per_category': args.pairs,
+            'repeat': args.repeat,
+            'load_seconds': round(load_seconds, 3),
+            # ru_maxrss is in KB on Linux
+            'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        },
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(output, file, indent=2)
+
+    print(f"{'engine':<8} {'pad':>3} {'category':<17} {'found':>7} {'p50 ms':>9} {'p99 ms':>9} {'expanded':>9}")
+    for row in sorted(results, key=lambda row: (row['padding'], CATEGORIES.index(row['category']), row['engine'])):
+        print(f"{row['engine']:<8} {row['padding']:>3} {row['category']:<17} {row['found']:>3}/{row['pairs']:<3} "
+              f"{row['latency_ms']['p50']:>9.3f} {row['latency_ms']['p99']:>9.3f} "
+              f"{row['nodes_expanded']['mean']:>9.0f}")
+    print(f"Saved results to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
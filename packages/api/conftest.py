@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests run against the routing-engine checkout next to this package, whether or not it is pip-installed
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'routing-engine'))
@@ -0,0 +1,47 @@
+"""
+Gunicorn settings: the map is loaded once in the master and shared by forked workers
+"""
+import gc
+import logging
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+
+# Searches hold the GIL, so requests only run in parallel across worker processes.
+# Threads let one worker overlap a search with slow clients and storage calls.
+workers = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+# Each worker starts its own /batch pool of BATCH_WORKERS processes on first use.
+# src/batch.py defaults that to the cores divided by WEB_CONCURRENCY, so a host runs
+# about one search process per core; set BATCH_WORKERS=1 to search in the worker itself.
+os.environ.setdefault('WEB_CONCURRENCY', str(workers))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+
+# Import main (and with it the grid cache) in the master, before forking
+preload_app = True
+
+
+def when_ready(server):
+    """Load the map version and all its indexes once, before the first worker is forked."""
+    from main import grid_cache
+
+    try:
+        map_version = grid_cache.preload()
+        server.log.info("Preloaded %r for all workers", map_version)
+    except Exception:
+        # Workers fall back to loading the grid themselves on their first request
+        logging.getLogger(__name__).exception("Could not preload the grid")
+
+
+def pre_fork(server, worker):
+    # Move everything the master allocated out of the collector's reach, so
+    # collections in workers never write to (and so copy) the shared pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from main import closure_manager, grid_cache
+
+    grid_cache.after_fork()
+    closure_manager.after_fork()
@@ -1,286 +1,657 @@
-import heapq
-import math
-import json
-from flask import Flask, request, make_response, jsonify
-from google.cloud import storage
+import hmac
+import os
+import time
+from flask import Flask, request, make_response, jsonify, g
+from routing_engine.estimates import cell_size, walking_minutes
+from routing_engine.polyline import DEFAULT_PRECISION, encode_polyline, simplify_path
+from src.batch import BatchRouter
+from src.closures import SEARCHED, ClosureManager
+from src.grid_cache import GridCache
+from src.map_version import DEFAULT_PADDING, SERVED_PADDINGS
+from src.metrics import COUNT_BUCKETS, Registry
+from src.route_cache import RouteCache
 
 app = Flask(__name__)
 
+# Grid config is loaded once per process and refreshed in the background
+grid_cache = GridCache()
+
+# Finished routes by snapped cells, dropped whenever the grid version changes
+route_cache = RouteCache()
+
+# Temporary closures laid over the grid, shared by every worker through storage.
+# Cached routes a closure cuts are repaired around it instead of searched again.
+closure_manager = ClosureManager(grid_cache, route_cache)
+
+# Bearer token that POST and DELETE /closures require, since a closure changes routing for
+# every user. Closure edits are refused while it is unset; listing closures stays public.
+CLOSURES_TOKEN = os.environ.get('CLOSURES_TOKEN', '')
+
+# Searches of /batch requests run on a pool of worker processes
+batch_router = BatchRouter()
+BATCH_MAX_PAIRS = int(os.environ.get('BATCH_MAX_PAIRS', 200))
+
+# /matrix runs one search per location, so the number of locations is capped
+MATRIX_MAX_LOCATIONS = int(os.environ.get('MATRIX_MAX_LOCATIONS', 25))
+
+# Per-process latency and search-effort metrics, scraped from /metrics
+metrics = Registry()
+REQUEST_SECONDS = metrics.histogram('routing_request_seconds', 'Time to handle a request, by endpoint and status',
+                                    ('endpoint', 'status'))
+STAGE_SECONDS = metrics.histogram('routing_stage_seconds', 'Time spent in each stage of a single-route request',
+                                  ('stage',))
+NODES_EXPANDED = metrics.histogram('routing_nodes_expanded', 'Nodes expanded per route search', ('engine',),
+                                   COUNT_BUCKETS)
+OPEN_SET_PEAK = metrics.histogram('routing_open_set_peak', 'Largest open set size per route search', ('engine',),
+                                  COUNT_BUCKETS)
+PATH_CELLS = metrics.histogram('routing_path_cells', 'Length in cells of the routes returned', (), COUNT_BUCKETS)
+ROUTE_SOURCES = metrics.counter('routing_routes_total', 'Single routes by where they came from: table, cache or search',
+                                ('source',))
+CACHE_ENTRIES = metrics.gauge('routing_route_cache_entries', 'Routes held in the route cache')
+
 # Global padding variable
 # This creates a small buffer around all obstacles to allow for smoother pathfinding
-padding = 2
+padding = DEFAULT_PADDING
 
-def euclidean_distance(a, b):
-    """Calculate Euclidean distance between two points."""
-    return math.sqrt((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2)
+# Values of the format request field: every cell as [lat, lng] pairs, or the
+# turn points of the path as an encoded polyline
+RESPONSE_FORMATS = ('coordinates', 'polyline')
 
-def apply_padding(grid, padding_value):
-    """Create a new grid with padding around obstacles."""
-    if padding_value <= 0:
-        return grid
+# Adjustment reported when a point is snapped, by snap_to target
+SNAP_MESSAGES = {
+    'free': 'moved from obstacle to nearest valid point',
+    'entrance': 'moved to nearest entrance',
+    'hallway': 'moved to nearest hallway',
+}
+CLOSURE_MESSAGE = 'moved out of a closure'
 
-    rows, cols = len(grid), len(grid[0])
-    padded_grid = [[0 for _ in range(cols)] for _ in range(rows)]
-    
-    # First copy the original obstacles
-    for i in range(rows):
-        for j in range(cols):
-            if grid[i][j] == 1:
-                padded_grid[i][j] = 1
-    
-    # Then add padding around obstacles
-    for i in range(rows):
-        for j in range(cols):
-            if grid[i][j] == 1:
-                # Mark cells within padding_value distance as obstacles
-                for di in range(-padding_value, padding_value + 1):
-                    for dj in range(-padding_value, padding_value + 1):
-                        ni, nj = i + di, j + dj
-                        if 0 <= ni < rows and 0 <= nj < cols:
-                            padded_grid[ni][nj] = 1
-    
-    return padded_grid
+# Engines whose paths are any-angle waypoints rather than 8-connected cells
+ANY_ANGLE_ENGINES = ('theta',)
+# Engines whose routes may be somewhat longer than the shortest one
+APPROXIMATE_ENGINES = ('hpa',)
 
-def a_star(grid, start, end, custom_padding=None):
-    """Performs A* pathfinding algorithm to find the shortest path from start to end."""
-    global padding
-    
-    # Apply padding around obstacles
-    pad_value = custom_padding if custom_padding is not None else padding
-    if pad_value > 0:
-        working_grid = apply_padding(grid, pad_value)
-    else:
-        working_grid = grid
-    
-    rows, cols = len(working_grid), len(working_grid[0])
-    
-    # Ensure start and end positions are not within padded areas
-    if working_grid[start[0]][start[1]] == 1 or working_grid[end[0]][end[1]] == 1:
-        return []  # Start or end position is not traversable
-    
-    open_set = []  # Priority queue for A* search
-    heapq.heappush(open_set, (0, start))  # (cost, (x, y))
-    
-    came_from = {}  # Stores the path
-    g_score = {start: 0}  # Cost from start to current node
-    f_score = {start: euclidean_distance(start, end)}  # Estimated cost from start to end
-    
-    directions = [(-1, 0), (1, 0), (0, -1), (0, 1), (1, 1), (1, -1), (-1, 1), (-1, -1)]  # Up, Down, Left, Right, Diagonals
-    
-    while open_set:
-        _, current = heapq.heappop(open_set)
-        
-        if current == end:
-            path = []
-            while current in came_from:
-                path.append(current)
-                current = came_from[current]
-            path.append(start)
-            return path[::-1]  # Return reversed path
-        
-        for dx, dy in directions:
-            neighbor = (current[0] + dx, current[1] + dy)
-            
-            if 0 <= neighbor[0] < rows and 0 <= neighbor[1] < cols and working_grid[neighbor[0]][neighbor[1]] == 0:
-                tentative_g_score = g_score[current] + euclidean_distance(current, neighbor)
-                
-                if neighbor not in g_score or tentative_g_score < g_score[neighbor]:
-                    came_from[neighbor] = current
-                    g_score[neighbor] = tentative_g_score
-                    f_score[neighbor] = tentative_g_score + euclidean_distance(neighbor, end)
-                    heapq.heappush(open_set, (f_score[neighbor], neighbor))
-    
-    return []  # No path found
-
-def lat_lng_to_grid(lat, lng, config):
-    """Convert lat-long to grid coordinates."""
-    row_size = (config['lat_max'] - config['lat_min']) / config['rows']
-    col_size = (config['lng_max'] - config['lng_min']) / config['cols']
-    row = int((config['lat_max'] - lat) / row_size)
-    col = int((lng - config['lng_min']) / col_size)
-    return row, col
-
-def grid_to_lat_lng(row, col, config):
-    """Convert grid coordinates to lat-long (center of cell)."""
-    row_size = (config['lat_max'] - config['lat_min']) / config['rows']
-    col_size = (config['lng_max'] - config['lng_min']) / config['cols']
-    lat = config['lat_max'] - (row + 0.5) * row_size
-    lng = config['lng_min'] + (col + 0.5) * col_size
-    return lat, lng
-
-def download_grid_config(bucket_name, file_name):
-    """Download and parse grid_config.json from Cloud Storage."""
-    client = storage.Client()
-    bucket = client.bucket(bucket_name)
-    blob = bucket.blob(file_name)
-    return json.loads(blob.download_as_text())
-
-def find_nearest_valid_point(grid, row, col, max_row, max_col):
-    """Find the nearest valid (non-obstacle) point in the grid."""
-    # Start with small search radius and expand
-    for radius in range(1, max(max_row, max_col)):
-        # Search in a square pattern around the point
-        for i in range(-radius, radius + 1):
-            for j in range(-radius, radius + 1):
-                # Only check points on the perimeter of the square
-                if abs(i) == radius or abs(j) == radius:
-                    new_row, new_col = row + i, col + j
-                    # Check if within bounds and not an obstacle
-                    if (0 <= new_row < max_row and 0 <= new_col < max_col and 
-                            grid[new_row][new_col] == 0):
-                        return new_row, new_col
-    # If no valid point found, return None
-    return None, None
+def resolve_point(map_version, lat, lng, snap_to, overlay=None):
+    """Convert a lat-long to a grid cell a search can start or end on.
+
+    Points outside the grid are moved inside its bounds, and points on an
+    obstacle (or every point, when snapping to entrances or hallways) are
+    moved to the nearest target cell of snap_to. Points in a closure of
+    overlay are then moved to the nearest target cell outside every closure.
+
+    Returns:
+        tuple: ((row, col), adjustment) where adjustment describes how the point
+            was moved or is None, or (None, None) if there is no cell to snap to
+    """
+    config = map_version.config
+    row, col = map_version.georeference.lat_lng_to_cell(lat, lng)
+    adjustment = None
+
+    # Check if the point is within grid bounds
+    if not (0 <= row < config['rows'] and 0 <= col < config['cols']):
+        # Find nearest valid point within grid
+        row = max(0, min(row, config['rows'] - 1))
+        col = max(0, min(col, config['cols'] - 1))
+        adjustment = 'moved inside grid bounds'
+
+    # Check if the point is an obstacle, or snap it to the nearest entrance/hallway if asked to
+    if snap_to != 'free' or config['grid'][row][col] == 1:
+        new_row, new_col = map_version.snap_indexes[snap_to].nearest(row, col)
+        if new_row is None:
+            return None, None
+        if (new_row, new_col) != (row, col):
+            adjustment = SNAP_MESSAGES[snap_to]
+        row, col = new_row, new_col
+
+    if overlay is not None and overlay.closed[row, col]:
+        row, col = overlay.nearest_open(row, col, map_version.snap_targets[snap_to])
+        if row is None:
+            return None, None
+        adjustment = CLOSURE_MESSAGE
+
+    return (row, col), adjustment
+
+def route_from_path(map_version, start, end, path_padding, path):
+    """Build the cacheable part of a response from a search result.
+
+    Returns:
+        dict: 'path' as [lat, lng] pairs, and 'debug_info' when the route could
+            not be found at the default padding (None otherwise)
+    """
+    route = {
+        'path': map_version.georeference.cells_to_lat_lng(path).tolist(),
+        'debug_info': None,
+        # Kept so the polyline format can be built from the cells later
+        'cells': path,
+        'padding': path_padding
+    }
+    if path_padding != padding:
+        distance = map_version.obstacle_distance
+        route['debug_info'] = {
+            'start_is_obstacle_in_padded': bool(distance[start] <= padding),
+            'end_is_obstacle_in_padded': bool(distance[end] <= padding),
+            'padding_used': padding
+        }
+        # A path exists once the padding is dropped
+        if path:
+            route['debug_info']['path_found_without_padding'] = True
+    return route
+
+def path_fields(map_version, route, response_format, cache_key=None):
+    """The entries of a response that carry a route's path, in the requested format.
+
+    Cached routes are shared by every request thread, so route is never changed.
+    The polyline of a route cached under cache_key is built once and cached
+    with a copy of the route.
+    """
+    if response_format != 'polyline':
+        return {'format': 'coordinates', 'path': route['path']}
+    polyline = route.get('polyline')
+    if polyline is None:
+        cells = route['cells']
+        if cells:
+            cells = simplify_path(map_version.engine, cells, route['padding'])
+        polyline = encode_polyline(map_version.georeference.cells_to_lat_lng(cells).tolist())
+        if cache_key is not None:
+            route_cache.replace(map_version.version, cache_key, dict(route, polyline=polyline), expected=route)
+    return {'format': 'polyline', 'polyline': polyline, 'precision': DEFAULT_PRECISION}
+
+def mesh_path_fields(path, response_format):
+    """Like path_fields, for a navigation mesh path that already has only its turn points."""
+    if response_format != 'polyline':
+        return {'format': 'coordinates', 'path': path}
+    return {'format': 'polyline', 'polyline': encode_polyline(path), 'precision': DEFAULT_PRECISION}
+
+def find_route(map_version, engine_name, start, end, overlay=None):
+    """Search for a route between two snapped cells (see route_from_path), around the closures of overlay."""
+    # Pick the first padding level at which both points share a connected component,
+    # so unreachable pairs are rejected without running a search at all
+    components = map_version.components if overlay is None else overlay.components
+    path_padding = components.first_connected_padding(start, end, SERVED_PADDINGS)
+    path = []
+    if path_padding is not None:
+        engine = map_version.engines[engine_name]
+        with STAGE_SECONDS.time('search'):
+            if overlay is None:
+                result = engine.search(start, end, path_padding)
+            else:
+                result = overlay.search(engine, start, end, path_padding)
+        path = result.path
+        NODES_EXPANDED.observe(result.nodes_expanded, engine_name)
+        OPEN_SET_PEAK.observe(result.open_peak, engine_name)
+    route = route_from_path(map_version, start, end, path_padding, path)
+    if overlay is not None:
+        # Searched again rather than repaired once the closures change, see src/closures.py
+        route['closure_state'] = SEARCHED
+    elif path and engine_name in APPROXIMATE_ENGINES:
+        route['approximate'] = True
+    return route
+
+def table_route(map_version, engine_name, start, end, overlay=None):
+    """Route between two entrances from the precomputed route table (see route_from_path).
+
+    The table holds 8-connected cell paths, so it only answers engines that return those.
+
+    Returns:
+        dict or None: The route, or None if there is no table, engine_name returns any-angle
+            waypoints, either cell is not one of its entrances or the stored route crosses a closure of overlay
+    """
+    if map_version.route_table is None or engine_name in ANY_ANGLE_ENGINES:
+        return None
+    stored = map_version.route_table.route(start, end)
+    if stored is None:
+        return None
+    path, path_padding = stored
+    if overlay is not None and overlay.crosses(path, path_padding):
+        return None
+    return route_from_path(map_version, start, end, path_padding, path)
+
+def cached_route(map_version, cache_key, overlay=None):
+    """Route from the route cache, or None on a miss.
+
+    Cached routes are repaired when closures change; one stored by a request
+    that raced with the change and crosses a closure is treated as a miss.
+    """
+    route = route_cache.get(map_version.version, cache_key)
+    if route is not None and overlay is not None and route['cells'] and overlay.crosses(route['cells'],
+                                                                                          route['padding']):
+        return None
+    return route
+
+def find_mesh_route(navmesh, start_lat, start_lng, end_lat, end_lng):
+    """Any-angle route on the navigation mesh between two lat-longs.
+
+    Points inside a building are moved to the nearest point of the mesh.
+
+    Returns:
+        tuple: (path as [lat, lng] pairs, empty if there is none, adjustments)
+    """
+    adjustments = {}
+    located = []
+    for name, lat, lng in (('start_point', start_lat, start_lng), ('end_point', end_lat, end_lng)):
+        point = navmesh.lat_lng_to_utm(lat, lng)
+        nearest, triangle = navmesh.nearest(point)
+        if nearest != point:
+            adjustments[name] = SNAP_MESSAGES['free']
+        located.append((nearest, triangle))
+
+    (start, start_triangle), (end, end_triangle) = located
+    path = navmesh.find_path(start, end, start_triangle, end_triangle)
+    return [list(navmesh.utm_to_lat_lng(x, y)) for x, y in path], adjustments
+
+# Manual CORS, shared by every route
+ALLOWED_ORIGINS = ['http://localhost:3000', 'https://campus-navigator.vercel.app']
+
+def get_cors_origin():
+    """Echo the request origin if it is allowed, otherwise default to Vercel."""
+    origin = request.headers.get('Origin', '')
+    return origin if origin in ALLOWED_ORIGINS else 'https://campus-navigator.vercel.app'
+
+def cors_response(payload, status):
+    """JSON response with the CORS origin header set."""
+    response = make_response(jsonify(payload))
+    response.headers['Access-Control-Allow-Origin'] = get_cors_origin()
+    return response, status
+
+def cors_preflight():
+    """Empty response to an OPTIONS preflight request."""
+    response = make_response()
+    response.headers['Access-Control-Allow-Origin'] = get_cors_origin()
+    response.headers['Access-Control-Allow-Methods'] = 'GET, POST, DELETE, OPTIONS'
+    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+    response.headers['Access-Control-Max-Age'] = '3600'  # Cache preflight for 1 hour
+    return response, 204
+
+def load_map_version(engine_name, snap_to):
+    """Get the cached map version and check the requested engine and snap target.
+
+    Returns:
+        tuple: (map_version, None), or (None, error response) if the request cannot be served
+    """
+    # Get the cached grid config (downloaded from Cloud Storage on first use)
+    try:
+        map_version = grid_cache.get()
+    except Exception as e:
+        return None, cors_response({'error': f'Failed to load grid config: {str(e)}'}, 500)
+
+    if engine_name not in map_version.engine_names:
+        return None, cors_response({'error': f'Unknown engine: {engine_name}. Choose one of {map_version.engine_names}'}, 400)
+
+    if engine_name == 'navmesh' and snap_to != 'free':
+        return None, cors_response({'error': 'The navmesh engine only supports snap_to: free'}, 400)
+
+    if snap_to not in map_version.snap_indexes:
+        return None, cors_response({'error': f'Unknown snap_to: {snap_to}. Choose one of {sorted(map_version.snap_indexes)}'}, 400)
+
+    return map_version, None
 
 # Cloud Run HTTP Handler with manual CORS
 @app.route('/', methods=['OPTIONS', 'POST'])
 def find_path():
     """Handle POST requests to find a path and OPTIONS for CORS preflight."""
-    # Define allowed origins
-    allowed_origins = ['http://localhost:3000', 'https://campus-navigator.vercel.app']
-    origin = request.headers.get('Origin', '')  # Get the Origin header from the request
-    cors_origin = origin if origin in allowed_origins else 'https://campus-navigator.vercel.app'  # Default to Vercel
-
-    # Set CORS headers for all responses
-    response = make_response()
-    response.headers['Access-Control-Allow-Origin'] = cors_origin
-
     if request.method == 'OPTIONS':
         # Handle preflight request
-        response.headers['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
-        response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
-        response.headers['Access-Control-Max-Age'] = '3600'  # Cache preflight for 1 hour
-        return response, 204
+        return cors_preflight()
 
     # Handle POST request
     if request.method != 'POST':
-        response = make_response(jsonify({'error': 'Method not allowed'}))
-        response.headers['Access-Control-Allow-Origin'] = cors_origin
-        return response, 405
+        return cors_response({'error': 'Method not allowed'}, 405)
 
     # Parse request JSON
     data = request.get_json()
     if not data or 'start_lat' not in data or 'start_lng' not in data or 'end_lat' not in data or 'end_lng' not in data:
-        response = make_response(jsonify({'error': 'Missing required fields: start_lat, start_lng, end_lat, end_lng'}))
-        response.headers['Access-Control-Allow-Origin'] = cors_origin
-        return response, 400
+        return cors_response({'error': 'Missing required fields: start_lat, start_lng, end_lat, end_lng'}, 400)
     
     start_lat = float(data['start_lat'])
     start_lng = float(data['start_lng'])
     end_lat = float(data['end_lat'])
     end_lng = float(data['end_lng'])
+    engine_name = data.get('engine', 'astar')
+    snap_to = data.get('snap_to', 'free')
+    response_format = data.get('format', 'coordinates')
+    if response_format not in RESPONSE_FORMATS:
+        return cors_response({'error': f'Unknown format: {response_format}. Choose one of {list(RESPONSE_FORMATS)}'}, 400)
     
-    # Load grid config from Cloud Storage
-    try:
-        config = download_grid_config('gu-campus-maps', 'grid_config.json')
-    except Exception as e:
-        response = make_response(jsonify({'error': f'Failed to load grid config: {str(e)}'}))
-        response.headers['Access-Control-Allow-Origin'] = cors_origin
-        return response, 500
-    
-    # Convert lat-long to grid coordinates
-    start_row, start_col = lat_lng_to_grid(start_lat, start_lng, config)
-    end_row, end_col = lat_lng_to_grid(end_lat, end_lng, config)
+    with STAGE_SECONDS.time('load'):
+        map_version, error = load_map_version(engine_name, snap_to)
+    if error:
+        return error
+
+    # The navigation mesh works on lat-longs directly, without grid cells
+    if engine_name == 'navmesh':
+        with STAGE_SECONDS.time('search'):
+            path, adjustments = find_mesh_route(map_version.navmesh, start_lat, start_lng, end_lat, end_lng)
+        response_data = mesh_path_fields(path, response_format)
+        if adjustments:
+            response_data['adjustments'] = adjustments
+        if not path:
+            response_data['message'] = 'No valid path found between the adjusted points'
+        return cors_response(response_data, 200)
     
-    # Validate coordinates
+    # Convert lat-long to grid coordinates, moving points onto valid cells
     adjustments = {}
+    with STAGE_SECONDS.time('snap'):
+        overlay = closure_manager.overlay(map_version)
+        start, start_adjustment = resolve_point(map_version, start_lat, start_lng, snap_to, overlay)
+        end, end_adjustment = resolve_point(map_version, end_lat, end_lng, snap_to, overlay)
+    if start is None:
+        return cors_response({'error': 'No valid path available near start point'}, 400)
+    if start_adjustment:
+        adjustments['start_point'] = start_adjustment
+
+    if end is None:
+        return cors_response({'error': 'No valid path available near end point'}, 400)
+    if end_adjustment:
+        adjustments['end_point'] = end_adjustment
     
-    # Check if start point is within grid bounds
-    if not (0 <= start_row < config['rows'] and 0 <= start_col < config['cols']):
-        # Find nearest valid point within grid
-        start_row = max(0, min(start_row, config['rows'] - 1))
-        start_col = max(0, min(start_col, config['cols'] - 1))
-        adjustments['start_point'] = 'moved inside grid bounds'
-    
-    # Check if end point is within grid bounds
-    if not (0 <= end_row < config['rows'] and 0 <= end_col < config['cols']):
-        # Find nearest valid point within grid
-        end_row = max(0, min(end_row, config['rows'] - 1))
-        end_col = max(0, min(end_col, config['cols'] - 1))
-        adjustments['end_point'] = 'moved inside grid bounds'
-    
-    # Check if start point is an obstacle
-    if config['grid'][start_row][start_col] == 1:
-        new_start_row, new_start_col = find_nearest_valid_point(
-            config['grid'], start_row, start_col, config['rows'], config['cols'])
-        if new_start_row is not None:
-            start_row, start_col = new_start_row, new_start_col
-            adjustments['start_point'] = 'moved from obstacle to nearest valid point'
+    # Entrance-to-entrance routes are a table lookup, and repeated pairs of
+    # other snapped cells are answered from the route cache
+    with STAGE_SECONDS.time('route'):
+        source = 'table'
+        cache_key = None
+        route = table_route(map_version, engine_name, start, end, overlay)
+        if route is None:
+            source = 'cache'
+            cache_key = RouteCache.key(engine_name, padding, start, end)
+            route = cached_route(map_version, cache_key, overlay)
+            if route is None:
+                source = 'search'
+                route = find_route(map_version, engine_name, start, end, overlay)
+                route_cache.put(map_version.version, cache_key, route)
+    ROUTE_SOURCES.inc(source)
+    PATH_CELLS.observe(len(route['cells']))
+
+    with STAGE_SECONDS.time('serialize'):
+        response_data = path_fields(map_version, route, response_format, cache_key)
+        if route.get('approximate'):
+            response_data['approximate'] = True
+
+        if route['debug_info'] is not None:
+            # Include diagnostic information about why no path was found
+            response_data['adjustments'] = adjustments
+            response_data['debug_info'] = route['debug_info']
+            if not route['path']:
+                response_data['message'] = 'No valid path found between the adjusted points'
+
+        # Include adjustment information if any points were moved
+        elif adjustments:
+            response_data['adjustments'] = adjustments
+            # Include the adjusted coordinates for debugging
+            adjusted_start, adjusted_end = map_version.georeference.cells_to_lat_lng([start, end]).tolist()
+            response_data['adjusted_coordinates'] = {'start': adjusted_start, 'end': adjusted_end}
+
+        return cors_response(response_data, 200)
+
+def set_batch_route(map_version, result, route, response_format, cache_key=None):
+    """Fill in the entry of one pair in a /batch response from its route (see path_fields)."""
+    result.update(path_fields(map_version, route, response_format, cache_key))
+    if route.get('approximate'):
+        result['approximate'] = True
+    if route['debug_info'] is not None:
+        if route['path']:
+            result['path_found_without_padding'] = True
         else:
-            response = make_response(jsonify({'error': 'No valid path available near start point'}))
-            response.headers['Access-Control-Allow-Origin'] = cors_origin
-            return response, 400
-    
-    # Check if end point is an obstacle
-    if config['grid'][end_row][end_col] == 1:
-        new_end_row, new_end_col = find_nearest_valid_point(
-            config['grid'], end_row, end_col, config['rows'], config['cols'])
-        if new_end_row is not None:
-            end_row, end_col = new_end_row, new_end_col
-            adjustments['end_point'] = 'moved from obstacle to nearest valid point'
+            result['message'] = 'No valid path found between the adjusted points'
+
+@app.route('/cache', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters and size of the route cache."""
+    return cors_response(route_cache.stats(), 200)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    started = g.get('request_started')
+    if started is not None and request.endpoint != 'prometheus_metrics':
+        REQUEST_SECONDS.observe(time.perf_counter() - started, request.endpoint or 'unknown', response.status_code)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Latency and search-effort metrics of this process in the Prometheus text format."""
+    CACHE_ENTRIES.set(route_cache.stats()['entries'])
+    response = make_response(metrics.render())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response, 200
+
+@app.route('/batch', methods=['OPTIONS', 'POST'])
+def find_paths():
+    """Handle POST requests for many start/end pairs at once and OPTIONS for CORS preflight.
+
+    Config loading and point snapping happen once in this process, then the
+    searches are spread over the batch worker processes. While closures are
+    in force the searches run here instead, since the workers only hold the
+    grid without them.
+    """
+    if request.method == 'OPTIONS':
+        return cors_preflight()
+
+    data = request.get_json()
+    pairs = data.get('pairs') if isinstance(data, dict) else None
+    if not isinstance(pairs, list) or not pairs:
+        return cors_response({'error': 'Missing required field: pairs'}, 400)
+    if len(pairs) > BATCH_MAX_PAIRS:
+        return cors_response({'error': f'Too many pairs: {len(pairs)}. The limit is {BATCH_MAX_PAIRS}'}, 400)
+
+    engine_name = data.get('engine', 'astar')
+    snap_to = data.get('snap_to', 'free')
+    response_format = data.get('format', 'coordinates')
+    if response_format not in RESPONSE_FORMATS:
+        return cors_response({'error': f'Unknown format: {response_format}. Choose one of {list(RESPONSE_FORMATS)}'}, 400)
+    map_version, error = load_map_version(engine_name, snap_to)
+    if error:
+        return error
+    overlay = closure_manager.overlay(map_version) if engine_name != 'navmesh' else None
+    components = map_version.components if overlay is None else overlay.components
+
+    # Every pair gets a result; searches only run for pairs that can be connected
+    results = []
+    jobs = []
+    job_results = []
+    for i, pair in enumerate(pairs):
+        if not isinstance(pair, dict) or any(field not in pair for field in ('start_lat', 'start_lng', 'end_lat', 'end_lng')):
+            results.append({'path': [], 'error': f'Pair {i} is missing start_lat, start_lng, end_lat or end_lng'})
+            continue
+
+        result = {}
+        results.append(result)
+        if engine_name == 'navmesh':
+            # Mesh queries are cheap enough to answer here without the worker pool
+            path, adjustments = find_mesh_route(map_version.navmesh, float(pair['start_lat']), float(pair['start_lng']),
+                                                float(pair['end_lat']), float(pair['end_lng']))
+            result.update(mesh_path_fields(path, response_format))
+            if adjustments:
+                result['adjustments'] = adjustments
+            if not path:
+                result['message'] = 'No valid path found between the adjusted points'
+            continue
+
+        start, start_adjustment = resolve_point(map_version, float(pair['start_lat']), float(pair['start_lng']), snap_to,
+                                                overlay)
+        end, end_adjustment = resolve_point(map_version, float(pair['end_lat']), float(pair['end_lng']), snap_to, overlay)
+        if start is None or end is None:
+            result.update(path=[], error=f"No valid path available near {'start' if start is None else 'end'} point")
+            continue
+
+        adjustments = {}
+        if start_adjustment:
+            adjustments['start_point'] = start_adjustment
+        if end_adjustment:
+            adjustments['end_point'] = end_adjustment
+        if adjustments:
+            result['adjustments'] = adjustments
+
+        cache_key = RouteCache.key(engine_name, padding, start, end)
+        route = table_route(map_version, engine_name, start, end, overlay) or cached_route(map_version, cache_key, overlay)
+        if route is None:
+            path_padding = components.first_connected_padding(start, end, SERVED_PADDINGS)
+            if path_padding is None:
+                route = route_from_path(map_version, start, end, None, [])
+                route_cache.put(map_version.version, cache_key, route)
+            else:
+                jobs.append((start, end, path_padding))
+                job_results.append((result, cache_key))
+                continue
+        set_batch_route(map_version, result, route, response_format, cache_key)
+
+    try:
+        if overlay is None:
+            paths = batch_router.search(map_version, engine_name, jobs)
         else:
-            response = make_response(jsonify({'error': 'No valid path available near end point'}))
-            response.headers['Access-Control-Allow-Origin'] = cors_origin
-            return response, 400
-    
-        # Run A* pathfinding
-    path = a_star(config['grid'], (start_row, start_col), (end_row, end_col))
-    if not path:
-        # Include diagnostic information about why no path was found
-        padded_grid = apply_padding(config['grid'], padding)
-        start_is_obstacle = padded_grid[start_row][start_col] == 1
-        end_is_obstacle = padded_grid[end_row][end_col] == 1
-        
-        debug_info = {
-            'start_is_obstacle_in_padded': start_is_obstacle,
-            'end_is_obstacle_in_padded': end_is_obstacle,
-            'padding_used': padding
-        }
-        
-        # Try without padding if that might be the issue
-        if start_is_obstacle or end_is_obstacle:
-            path = a_star(config['grid'], (start_row, start_col), (end_row, end_col), custom_padding=0)
-            if path:
-                debug_info['path_found_without_padding'] = True
-                path_lat_lng = [grid_to_lat_lng(row, col, config) for row, col in path]
-                response_data = {
-                    'path': [[lat, lng] for lat, lng in path_lat_lng],
-                    'adjustments': adjustments,
-                    'debug_info': debug_info
-                }
-                response = make_response(jsonify(response_data))
-                response.headers['Access-Control-Allow-Origin'] = cors_origin
-                return response, 200
-                
-        response = make_response(jsonify({
-            'path': [], 
-            'adjustments': adjustments,
-            'debug_info': debug_info,
-            'message': 'No valid path found between the adjusted points'
-        }))
-        response.headers['Access-Control-Allow-Origin'] = cors_origin
-        return response, 200
-    
-    # Convert path to lat-long
-    path_lat_lng = [grid_to_lat_lng(row, col, config) for row, col in path]
-    response_data = {
-        'path': [[lat, lng] for lat, lng in path_lat_lng]
-    }
-    
-    # Include adjustment information if any points were moved
+            engine = map_version.engines[engine_name]
+            paths = [overlay.search(engine, start, end, path_padding).path for start, end, path_padding in jobs]
+    except Exception as e:
+        return cors_response({'error': f'Batch search failed: {str(e)}'}, 500)
+
+    for (start, end, path_padding), (result, cache_key), path in zip(jobs, job_results, paths):
+        route = route_from_path(map_version, start, end, path_padding, path)
+        if overlay is not None:
+            route['closure_state'] = SEARCHED
+        elif path and engine_name in APPROXIMATE_ENGINES:
+            route['approximate'] = True
+        route_cache.put(map_version.version, cache_key, route)
+        set_batch_route(map_version, result, route, response_format, cache_key)
+
+    return cors_response({'results': results}, 200)
+
+@app.route('/matrix', methods=['OPTIONS', 'POST'])
+def walking_matrix():
+    """Handle POST requests for the walking distance and time between every pair of locations.
+
+    Locations are {"lat": ..., "lng": ...} objects or entrance labels. Each
+    location runs a single search that measures the distance to all others.
+    """
+    if request.method == 'OPTIONS':
+        return cors_preflight()
+
+    data = request.get_json()
+    locations = data.get('locations') if isinstance(data, dict) else None
+    if not isinstance(locations, list) or not locations:
+        return cors_response({'error': 'Missing required field: locations'}, 400)
+    if len(locations) > MATRIX_MAX_LOCATIONS:
+        return cors_response({'error': f'Too many locations: {len(locations)}. The limit is {MATRIX_MAX_LOCATIONS}'}, 400)
+
+    snap_to = data.get('snap_to', 'free')
+    map_version, error = load_map_version('astar', snap_to)
+    if error:
+        return error
+    overlay = closure_manager.overlay(map_version)
+
+    cells = []
+    adjustments = {}
+    for i, location in enumerate(locations):
+        if isinstance(location, str):
+            if location not in map_version.entrances:
+                return cors_response({'error': f'Unknown entrance label: {location}'}, 400)
+            lat, lng = map_version.entrances[location]
+        elif isinstance(location, dict) and 'lat' in location and 'lng' in location:
+            lat, lng = float(location['lat']), float(location['lng'])
+        else:
+            return cors_response({'error': f'Location {i} must be an entrance label or have lat and lng'}, 400)
+
+        cell, adjustment = resolve_point(map_version, lat, lng, snap_to, overlay)
+        if cell is None:
+            return cors_response({'error': f'No valid path available near location {i}'}, 400)
+        if adjustment:
+            adjustments[str(i)] = adjustment
+        cells.append(cell)
+
+    # Distances between entrances are read from the route table when it covers every location,
+    # unless closures are in force, which the table does not know about
+    lengths = None
+    if map_version.route_table is not None and overlay is None:
+        lengths = map_version.route_table.lengths(cells)
+    if lengths is None:
+        matrix = map_version.matrix if overlay is None else overlay.matrix
+        lengths = matrix.lengths(cells, SERVED_PADDINGS)
+    meters_per_cell = cell_size(map_version.config)
+    distances = [[None if length is None else round(length * meters_per_cell, 1) for length in row]
+                 for row in lengths]
+    # Minutes rounded to one decimal place, like calculate_path_time in pathfinding-core
+    times = [[None if length is None else walking_minutes(length, meters_per_cell) for length in row]
+             for row in lengths]
+
+    response_data = {'distances': distances, 'times': times}
     if adjustments:
         response_data['adjustments'] = adjustments
-        # Include the adjusted coordinates for debugging
-        adjusted_start = grid_to_lat_lng(start_row, start_col, config)
-        adjusted_end = grid_to_lat_lng(end_row, end_col, config)
-        response_data['adjusted_coordinates'] = {
-            'start': [adjusted_start[0], adjusted_start[1]],
-            'end': [adjusted_end[0], adjusted_end[1]]
-        }
-    
-    response = make_response(jsonify(response_data))
-    response.headers['Access-Control-Allow-Origin'] = cors_origin
-    return response, 200
+    return cors_response(response_data, 200)
+
+def require_closures_token():
+    """Check the bearer token of a request that edits closures.
+
+    Returns:
+        tuple or None: An error response, or None if the request may go ahead
+    """
+    if not CLOSURES_TOKEN:
+        return cors_response({'error': 'Closure edits are disabled on this server'}, 403)
+    header = request.headers.get('Authorization', '')
+    token = header[len('Bearer '):] if header.startswith('Bearer ') else ''
+    if not hmac.compare_digest(token.encode('utf-8'), CLOSURES_TOKEN.encode('utf-8')):
+        response, status = cors_response({'error': 'A valid bearer token is required to edit closures'}, 401)
+        response.headers['WWW-Authenticate'] = 'Bearer'
+        return response, status
+    return None
+
+@app.route('/closures', methods=['OPTIONS', 'GET', 'POST'])
+def manage_closures():
+    """List the temporary closures (GET), add one (POST), or answer the CORS preflight (OPTIONS).
+
+    A closure is a polygon of [lat, lng] points that routes may not enter,
+    e.g. construction or an event, with an optional reason and expires_in
+    (seconds). It applies on top of the loaded grid within
+    CLOSURE_REFRESH_SECONDS in every worker, without rebuilding the grid.
+    Adding one requires the CLOSURES_TOKEN bearer token.
+    """
+    if request.method == 'OPTIONS':
+        return cors_preflight()
+    if request.method == 'POST':
+        error = require_closures_token()
+        if error:
+            return error
+
+    try:
+        map_version = grid_cache.get()
+    except Exception as e:
+        return cors_response({'error': f'Failed to load grid config: {str(e)}'}, 500)
+    if map_version.georeference is None:
+        return cors_response({'error': 'The loaded grid has no lat/lng bounds to place closures on'}, 400)
+
+    if request.method == 'GET':
+        return cors_response({'closures': closure_manager.closures(), 'routes': closure_manager.repairs}, 200)
+
+    data = request.get_json()
+    if not isinstance(data, dict) or not isinstance(data.get('polygon'), list):
+        return cors_response({'error': 'Missing required field: polygon'}, 400)
+    reason = data.get('reason')
+    if reason is not None and not isinstance(reason, str):
+        return cors_response({'error': 'reason must be a string'}, 400)
+    try:
+        expires_in = data.get('expires_in')
+        closure, cells, counts = closure_manager.add(map_version, data['polygon'], reason,
+                                                     None if expires_in is None else float(expires_in))
+    except (TypeError, ValueError) as e:
+        return cors_response({'error': str(e)}, 400)
+    return cors_response({'closure': closure, 'cells': cells, 'routes': counts}, 201)
+
+@app.route('/closures/<closure_id>', methods=['OPTIONS', 'DELETE'])
+def remove_closure(closure_id):
+    """Lift a temporary closure (DELETE, with the CLOSURES_TOKEN bearer token) or answer the CORS preflight."""
+    if request.method == 'OPTIONS':
+        return cors_preflight()
+    error = require_closures_token()
+    if error:
+        return error
+
+    try:
+        map_version = grid_cache.get()
+    except Exception as e:
+        return cors_response({'error': f'Failed to load grid config: {str(e)}'}, 500)
+    counts = closure_manager.remove(map_version, closure_id)
+    if counts is None:
+        return cors_response({'error': f'Unknown closure: {closure_id}'}, 404)
+    return cors_response({'removed': closure_id, 'routes': counts}, 200)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8080)
\ No newline at end of file
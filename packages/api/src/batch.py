@@ -0,0 +1,222 @@
+"""
+Batch routing on a process pool that reads the grid from shared memory
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from routing_engine.hpa import HierarchicalSearch
+from routing_engine.jps import DIRECTIONS, JumpPointSearch, mask_checksum
+from routing_engine.search import GridSearch
+from routing_engine.theta import ThetaStarSearch
+
+from src.map_version import SERVED_PADDINGS
+
+logger = logging.getLogger(__name__)
+
+# Every serving process starts its own pool, so unless BATCH_WORKERS is set the
+# cores are split between the WEB_CONCURRENCY processes (see gunicorn.conf.py)
+DEFAULT_WORKERS = int(os.environ.get('BATCH_WORKERS') or
+                      max(1, (os.cpu_count() or 1) // int(os.environ.get('WEB_CONCURRENCY') or 1)))
+# Batches smaller than this are searched in the request thread
+DEFAULT_INLINE_PAIRS = int(os.environ.get('BATCH_INLINE_PAIRS', 4))
+
+
+class SharedGrid:
+    """The search inputs of one map version copied into a single shared memory block.
+
+    The block holds the lookup tables of the A* and Theta* engines (the bordered
+    distance transform, blocked masks and heuristic tables) and the JPS+ tables
+    and HPA* abstract graphs of every served padding level. Workers search over
+    views of the block, so a worker adds no per-grid tables of its own.
+    Tasks only carry the block's name and layout, so the grid is written once
+    per version instead of being pickled to every worker.
+    """
+
+    def __init__(self, map_version):
+        engine = map_version.engine
+        arrays = {f'grid_{key}': value for key, value in engine.tables(SERVED_PADDINGS).items()}
+        arrays.update((f'theta_{key}', value)
+                      for key, value in map_version.engines['theta'].tables(SERVED_PADDINGS).items())
+        self.checksums = {}
+        for padding in SERVED_PADDINGS:
+            tables = map_version.engines['jps'].tables(padding)
+            shape = (len(DIRECTIONS), engine.rows + 2, engine.width)
+            arrays[f'jps_{padding}'] = np.frombuffer(b''.join(tables), dtype=np.int16).reshape(shape)
+            self.checksums[padding] = mask_checksum(engine.blocked(padding))
+            graph = map_version.engines['hpa'].graph_arrays(padding)
+            arrays[f'hpa_nodes_{padding}'], arrays[f'hpa_edges_{padding}'] = graph
+        self.cluster_size = map_version.engines['hpa'].cluster_size
+
+        self.version = map_version.version
+        self.layout = {}
+        offset = 0
+        for key, value in arrays.items():
+            self.layout[key] = (offset, value.shape, value.dtype.str)
+            offset += value.nbytes
+
+        self._memory = shared_memory.SharedMemory(create=True, size=offset)
+        self.name = self._memory.name
+        for key, value in arrays.items():
+            _view(self._memory, self.layout[key])[...] = value
+
+        # Batches still using this block, and whether a newer version replaced it
+        self.users = 0
+        self.retired = False
+
+    def task_info(self):
+        """Everything a worker needs to attach to the block, cheap to pickle."""
+        return self.name, self.layout, self.checksums, self.cluster_size
+
+    def close(self):
+        self._memory.close()
+        self._memory.unlink()
+
+
+def _view(memory, entry):
+    offset, shape, dtype = entry
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=memory.buf, offset=offset)
+
+
+def _tables(memory, layout, prefix):
+    return {key[len(prefix):]: _view(memory, entry) for key, entry in layout.items() if key.startswith(prefix)}
+
+
+# Block the worker process is attached to, and the engines built from it
+_worker_state = {}
+
+
+def _engines_for(name, layout, checksums, cluster_size):
+    """Build (or reuse) the engines of a worker process for a shared block."""
+    if _worker_state.get('name') == name:
+        return _worker_state['engines']
+
+    previous = _worker_state.pop('memory', None)
+    _worker_state.clear()
+    if previous is not None:
+        previous.close()
+
+    memory = shared_memory.SharedMemory(name=name)
+    grid_tables = _tables(memory, layout, 'grid_')
+    engine = GridSearch(grid_tables['distance'][1:-1, 1:-1], grid_tables)
+    stored = {padding: (_view(memory, layout[f'jps_{padding}']), checksum)
+              for padding, checksum in checksums.items()}
+    graphs = {padding: (cluster_size, _view(memory, layout[f'hpa_nodes_{padding}']),
+                        _view(memory, layout[f'hpa_edges_{padding}']), checksum)
+              for padding, checksum in checksums.items()}
+    engines = {
+        'astar': engine,
+        'jps': JumpPointSearch(engine, stored),
+        'hpa': HierarchicalSearch(engine, graphs, cluster_size),
+        'theta': ThetaStarSearch(engine, _tables(memory, layout, 'theta_')),
+    }
+    _worker_state.update(name=name, memory=memory, engines=engines)
+    return engines
+
+
+def _search_chunk(task_info, engine_name, jobs):
+    """Worker entry point: run a list of (start, goal, padding) searches."""
+    engine = _engines_for(*task_info)[engine_name]
+    return [engine.search(start, goal, padding).path for start, goal, padding in jobs]
+
+
+class BatchRouter:
+    """Runs many searches against one map version on a pool of worker processes.
+
+    Workers are started with the spawn method, so they never inherit the locks
+    or threads of the serving process. The pool is created on first use and
+    kept for the life of the process.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, inline_pairs=DEFAULT_INLINE_PAIRS):
+        """
+        Args:
+            workers (int): Number of worker processes, 1 or less searches in-process
+            inline_pairs (int): Batches with fewer jobs than this are searched in-process
+        """
+        self.workers = workers
+        self.inline_pairs = inline_pairs
+        self._pool = None
+        self._shared = None
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def search(self, map_version, engine_name, jobs):
+        """Search every job of a batch.
+
+        Args:
+            map_version (MapVersion): Map version the jobs were snapped on
+            engine_name (str): Key of map_version.engines
+            jobs (list): (start, goal, padding) tuples with (row, col) cells
+
+        Returns:
+            list: One path per job, in order, each a list of (row, col) cells
+        """
+        if not jobs:
+            return []
+        if self.workers <= 1 or len(jobs) < self.inline_pairs:
+            engine = map_version.engines[engine_name]
+            return [engine.search(start, goal, padding).path for start, goal, padding in jobs]
+
+        shared = self._acquire(map_version)
+        try:
+            task_info = shared.task_info()
+            chunk_size = -(-len(jobs) // self.workers)
+            futures = [self._executor().submit(_search_chunk, task_info, engine_name, jobs[i:i + chunk_size])
+                       for i in range(0, len(jobs), chunk_size)]
+            paths = []
+            for future in futures:
+                paths.extend(future.result())
+            return paths
+        except BrokenProcessPool:
+            with self._lock:
+                self._pool = None  # A worker died; start a fresh pool on the next batch
+            raise
+        finally:
+            self._release(shared)
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            if self._shared is not None:
+                self._retire(self._shared)
+                self._shared = None
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def _acquire(self, map_version):
+        with self._lock:
+            shared = self._shared
+            if shared is None or shared.version != map_version.version:
+                if shared is not None:
+                    self._retire(shared)
+                shared = self._shared = SharedGrid(map_version)
+                logger.info("Shared grid version %s with batch workers as %s", shared.version, shared.name)
+            shared.users += 1
+            return shared
+
+    def _release(self, shared):
+        with self._lock:
+            shared.users -= 1
+            if shared.retired and shared.users == 0:
+                shared.close()
+
+    def _retire(self, shared):
+        # Called with the lock held; batches still running keep the block alive
+        shared.retired = True
+        if shared.users == 0:
+            shared.close()
@@ -0,0 +1,378 @@
+"""
+Temporary closures (construction, events) applied over the loaded grid, and repair of the routes they cut
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from routing_engine.closures import ClosureOverlay, polygon_cells
+from routing_engine.dstar import DStarLite
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REFRESH_SECONDS = float(os.environ.get('CLOSURE_REFRESH_SECONDS', 5))
+# Cached routes a closure change repairs per process, most recently used first; any others it cuts are
+# dropped and searched again on their next request. Each keeps its D* Lite planner, a few MB on the campus grid.
+DEFAULT_MAX_PLANNERS = int(os.environ.get('CLOSURE_PLANNERS', 16))
+
+# Values of the closure_state entry of a cached route: searched over the closures, or repaired around them
+SEARCHED = 'searched'
+REPAIRED = 'repaired'
+
+
+class Detour:
+    """A cached route cut by closures, and the D* Lite planner that routes around them."""
+
+    def __init__(self, original, planner):
+        """
+        Args:
+            original (dict): The route over the grid without closures
+            planner (DStarLite): Planner between the route's end cells at its padding
+        """
+        self.original = original
+        self.planner = planner
+
+
+class RouteRepairer:
+    """Keeps the cached routes of a map version valid as closures come and go.
+
+    Routes that stay clear of every closure are left alone. A route a closure
+    cuts gets a D* Lite planner between its end cells, and is replaced by the
+    planner's path. Planners are kept, so when the closures next change each
+    route is repaired by re-expanding only the cells whose costs the change
+    affects: a closure elsewhere on campus costs a planner a few milliseconds
+    where a new search would take a few hundred. Routes whose original cells
+    are clear again get their original back.
+    """
+
+    def __init__(self, max_planners=DEFAULT_MAX_PLANNERS):
+        """
+        Args:
+            max_planners (int): Most routes repaired and planners kept, the most recently used first
+        """
+        self.max_planners = max_planners
+        self._detours = {}
+        self._version = None
+
+    def repair(self, route_cache, map_version, overlay):
+        """Repair, restore or drop every cached route of map_version for a new set of closures.
+
+        Args:
+            route_cache (RouteCache): Cache holding the routes
+            map_version (MapVersion): Version the overlay was built on
+            overlay (ClosureOverlay): The closures now in force, or None if there are none
+
+        Returns:
+            dict: Counts of routes 'repaired', 'restored' to their original and 'dropped',
+                and the 'nodes_expanded' by the planners
+        """
+        if map_version.version != self._version:
+            self._detours.clear()
+            self._version = map_version.version
+        counts = {'repaired': 0, 'restored': 0, 'dropped': 0, 'nodes_expanded': 0}
+        detours = {}
+        for key, route in reversed(route_cache.entries(map_version.version)):
+            detour = self._detours.get(key)
+            state = route.get('closure_state')
+            # Routes searched over earlier closures may be longer than needed now, and repaired
+            # routes whose planner was let go can no longer be restored: both are searched again
+            if state == SEARCHED or (state == REPAIRED and detour is None):
+                route_cache.discard(map_version.version, key)
+                counts['dropped'] += 1
+                continue
+
+            original = detour.original if detour is not None else route
+            cells, padding = original['cells'], original['padding']
+            if overlay is None or not cells or not overlay.crosses(cells, padding):
+                if detour is not None:
+                    route_cache.replace(map_version.version, key, original)
+                    counts['restored'] += 1
+                continue
+
+            expanded = detour.planner.nodes_expanded if detour is not None else 0
+            detour = self._plan(map_version, overlay, original, detour) if len(detours) < self.max_planners else None
+            if detour is None:
+                route_cache.discard(map_version.version, key)
+                counts['dropped'] += 1
+                continue
+            path = detour.planner.path()
+            counts['nodes_expanded'] += detour.planner.nodes_expanded - expanded
+
+            repaired = dict(original, cells=path, closure_state=REPAIRED)
+            # The planner's detour is a shortest path, even for a route HPA* found
+            repaired.pop('polyline', None)
+            repaired.pop('approximate', None)
+            repaired['path'] = map_version.georeference.cells_to_lat_lng(path).tolist()
+            if route_cache.replace(map_version.version, key, repaired):
+                detours[key] = detour
+                counts['repaired'] += 1
+
+        # Planners of routes that were restored, dropped or left the cache are let go
+        self._detours = detours
+        return counts
+
+    def _plan(self, map_version, overlay, original, detour):
+        # Bring the route's planner up to date, or start one. None if the route cannot be repaired.
+        cells, padding = original['cells'], original['padding']
+        if np.abs(np.diff(np.asarray(cells), axis=0)).max() > 1:
+            return None  # Any-angle waypoints; searched again so the route stays any-angle
+        start, end = tuple(cells[0]), tuple(cells[-1])
+        if not overlay.components.connected(start, end, padding):
+            return None  # Closed in, or cut off at this padding; a new search picks the padding again
+        mask = overlay.blocked(padding)
+        if detour is None:
+            detour = Detour(original, DStarLite(map_version.engine, mask, start, end))
+        else:
+            detour.planner.update(mask)
+        return detour if detour.planner.plan() else None
+
+
+class ClosureManager:
+    """The closures in force, shared by every worker through the storage backend.
+
+    Closures are stored as one JSON object next to the grid (e.g.
+    grid_config.closures.json). Every process polls its generation, and when
+    the closures change builds a ClosureOverlay on the current map version and
+    repairs its own route cache. The grid itself and its sidecars are untouched,
+    so a closure takes effect within a refresh interval and needs no rebuild.
+
+    Edits read the latest object before writing it back. Two edits from
+    different processes at the same moment may still overwrite one another.
+    """
+
+    def __init__(self, grid_cache, route_cache, file_name=None, refresh_interval=DEFAULT_REFRESH_SECONDS,
+                 repairer=None, clock=time.time):
+        """
+        Args:
+            grid_cache (GridCache): Source of the current map version and of the storage backend
+            route_cache (RouteCache): Cache whose routes are repaired when closures change
+            file_name (str): Object holding the closures, defaults to the grid's .closures.json sidecar name
+            refresh_interval (float): Seconds between generation checks, 0 disables the background thread
+            repairer (RouteRepairer): Repairs cached routes, defaults to one with DEFAULT_MAX_PLANNERS
+            clock (callable): Source of the current Unix time, for expiry
+        """
+        self.grid_cache = grid_cache
+        self.route_cache = route_cache
+        self.file_name = file_name or grid_cache.sidecar_name('.closures.json')
+        self.refresh_interval = refresh_interval
+        self.repairer = repairer or RouteRepairer()
+        self._clock = clock
+        self._closures = []
+        self._generation = None
+        self._loaded = False
+        # (map version, ids of the closures applied, overlay or None, time the first of them expires)
+        self._applied = None
+        # The _applied tuple the route cache was last repaired for
+        self._repaired = None
+        self.repairs = {'repaired': 0, 'restored': 0, 'dropped': 0, 'nodes_expanded': 0}
+        # _lock guards the closures and the overlay and is only held briefly, so requests never wait
+        # for route repairs, which _repair_lock runs one at a time
+        self._lock = threading.Lock()
+        self._repair_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._refresher = None
+
+    @property
+    def storage(self):
+        return self.grid_cache.storage
+
+    def closures(self):
+        """The closures in force, as stored: id, polygon, reason, created_at and expires_at (or None).
+
+        Reads the latest closures from storage, so those added by other processes are listed too.
+        """
+        self.refresh()
+        now = self._clock()
+        return [closure for closure in self._closures if not self._expired(closure, now)]
+
+    def add(self, map_version, polygon, reason=None, expires_in=None):
+        """Store a new closure and apply it in this process.
+
+        Args:
+            map_version (MapVersion): Version whose grid the polygon must cover
+            polygon: (lat, lng) vertices, at least three
+            reason (str): Shown when the closures are listed
+            expires_in (float): Seconds until the closure lifts by itself, None to keep it until removed
+
+        Returns:
+            tuple: (closure, cells it covers, route repair counts)
+
+        Raises:
+            ValueError: If the polygon is malformed or covers no cell of the grid
+        """
+        try:
+            polygon = [[float(lat), float(lng)] for lat, lng in polygon]
+        except (TypeError, ValueError):
+            raise ValueError("polygon must be a list of [lat, lng] pairs") from None
+        cells = polygon_cells(map_version.georeference, polygon)
+        if not len(cells):
+            raise ValueError("The closure polygon covers no cell of the grid")
+        if expires_in is not None and float(expires_in) <= 0:
+            raise ValueError("expires_in must be a positive number of seconds")
+
+        now = self._clock()
+        closure = {
+            'id': uuid.uuid4().hex[:12],
+            'polygon': polygon,
+            'reason': reason,
+            'created_at': now,
+            'expires_at': None if expires_in is None else now + float(expires_in),
+        }
+        with self._lock:
+            closures = [item for item in self._read() if not self._expired(item, now)] + [closure]
+            self._write(closures)
+        self.apply(map_version)
+        return closure, len(cells), self.repair()
+
+    def remove(self, map_version, closure_id):
+        """Lift a closure and apply the change in this process.
+
+        Returns:
+            dict or None: Route repair counts, or None if no closure has that id
+        """
+        now = self._clock()
+        with self._lock:
+            closures = self._read()
+            remaining = [item for item in closures if item['id'] != closure_id and not self._expired(item, now)]
+            if not any(item['id'] == closure_id for item in closures):
+                return None
+            self._write(remaining)
+        self.apply(map_version)
+        return self.repair()
+
+    def overlay(self, map_version):
+        """The overlay of the closures in force on map_version, or None if there are none.
+
+        Built again only when the map version or the closures changed, or one expired.
+        Cached routes are repaired for it by the refresh thread, not on the request path.
+        """
+        if not self._loaded:
+            # First use in this process: read the closures before serving, then keep polling
+            try:
+                with self._lock:
+                    self._read()
+            except Exception:
+                logger.exception("Could not read closures from %s", self.file_name)
+            self._loaded = True
+            self.start_background_refresh()
+        applied = self._applied
+        if applied is None or applied[0] is not map_version or self._clock() >= applied[3]:
+            self.apply(map_version)
+            applied = self._applied
+        return applied[2]
+
+    def apply(self, map_version):
+        """Rebuild the overlay for the current closures on map_version if they changed.
+
+        Requests use the new overlay right away. Cached routes that cross it are
+        treated as misses until repair() has run.
+
+        Returns:
+            bool: True if a new overlay was swapped in
+        """
+        with self._lock:
+            now = self._clock()
+            active = [closure for closure in self._closures if not self._expired(closure, now)]
+            ids = tuple(closure['id'] for closure in active)
+            applied = self._applied
+            if applied is not None and applied[0] is map_version and applied[1] == ids and now < applied[3]:
+                return False
+
+            overlay = None
+            if active:
+                overlay = ClosureOverlay(map_version.engine, map_version.obstacle_distance, map_version.components,
+                                         [polygon_cells(map_version.georeference, closure['polygon'])
+                                          for closure in active])
+            expiry = min((closure['expires_at'] for closure in active if closure['expires_at'] is not None),
+                         default=float('inf'))
+            self._applied = (map_version, ids, overlay, expiry)
+        if applied is None or applied[1] != ids:
+            logger.info("Applied %d closures to version %s", len(active), map_version.version)
+        return True
+
+    def repair(self):
+        """Repair the cached routes for the overlay last applied, unless they already were.
+
+        Runs without holding the lock requests take, so they keep being served meanwhile.
+
+        Returns:
+            dict: Route repair counts, all zero if there was nothing to repair
+        """
+        with self._repair_lock:
+            applied = self._applied
+            if applied is None or applied is self._repaired:
+                return {'repaired': 0, 'restored': 0, 'dropped': 0, 'nodes_expanded': 0}
+            map_version, ids, overlay, _ = applied
+            counts = self.repairer.repair(self.route_cache, map_version, overlay)
+            self._repaired = applied
+            for name, count in counts.items():
+                self.repairs[name] += count
+        if any(counts.values()):
+            logger.info("Repaired cached routes for %d closures on version %s: %s", len(ids), map_version.version,
+                        counts)
+        return counts
+
+    def refresh(self):
+        """Reload the closures if they changed in storage, apply them and repair the cached routes.
+
+        Returns:
+            bool: True if the stored closures changed
+        """
+        with self._lock:
+            generation = self.storage.generation(self.file_name)
+            changed = generation != self._generation
+            if changed:
+                self._read()
+        self.apply(self.grid_cache.get())
+        self.repair()
+        return changed
+
+    def start_background_refresh(self):
+        """Start the daemon thread that polls for closures added or lifted by other processes."""
+        if self.refresh_interval <= 0 or (self._refresher and self._refresher.is_alive()):
+            return
+        self._stop.clear()
+        self._refresher = threading.Thread(target=self._refresh_loop, name='closure-refresh', daemon=True)
+        self._refresher.start()
+
+    def stop_background_refresh(self):
+        self._stop.set()
+
+    def after_fork(self):
+        """Prepare a forked worker: fresh locks, and its own refresh thread once it serves a request."""
+        self._lock = threading.Lock()
+        self._repair_lock = threading.Lock()
+        self._loaded = False
+        self._refresher = None
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Closure refresh failed, keeping %d closures", len(self._closures))
+            self._stop.wait(self.refresh_interval)
+
+    def _read(self):
+        # Called with the lock held
+        generation = self.storage.generation(self.file_name)
+        if generation is None:
+            closures = []
+        else:
+            closures = json.loads(self.storage.read(self.file_name))['closures']
+        self._closures, self._generation = closures, generation
+        return closures
+
+    def _write(self, closures):
+        # Called with the lock held
+        self.storage.write(self.file_name, json.dumps({'closures': closures}), content_type='application/json')
+        self._closures, self._generation = closures, self.storage.generation(self.file_name)
+
+    @staticmethod
+    def _expired(closure, now):
+        return closure['expires_at'] is not None and closure['expires_at'] <= now
@@ -0,0 +1,232 @@
+"""
+Process-wide cache for the routing grid stored in Google Cloud Storage
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from routing_engine.map_bundle import is_bundle, load_config, read_bundle
+
+from src.map_version import MapVersion
+from src.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKET_NAME = os.environ.get('GRID_BUCKET', 'gu-campus-maps')
+DEFAULT_GRID_FILE = os.environ.get('GRID_FILE', 'grid_config.json')
+DEFAULT_CACHE_DIR = os.environ.get('GRID_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'campus-navigator'))
+DEFAULT_REFRESH_SECONDS = float(os.environ.get('GRID_REFRESH_SECONDS', 300))
+
+
+class GridCache:
+    """Loads the grid once per process and keeps it up to date in the background.
+
+    The first call to get() loads the grid from the on-disk copy if one exists,
+    otherwise from storage (Cloud Storage or a local directory, see src/storage.py).
+    A daemon thread then polls the blob's generation and, when it changes,
+    downloads and builds the new MapVersion before swapping it in with a
+    single reference assignment.
+
+    Precomputed data stored next to the grid (e.g. grid_config.jps.npz) is
+    downloaded together with it. Upload sidecars before the grid itself, since
+    only a new grid generation triggers a reload.
+    """
+
+    # Suffixes of optional sidecar files that replace the extension of file_name
+    sidecar_suffixes = ('.jps.npz', '.hpa.npz', '.navmesh.npz', '.entrances.json', '.routes.bin')
+    # Sidecars MapVersion memory-maps: it gets the path of their on-disk copy instead of their bytes
+    mapped_suffixes = ('.routes.bin',)
+
+    def __init__(self, bucket_name=DEFAULT_BUCKET_NAME, file_name=DEFAULT_GRID_FILE,
+                 cache_dir=DEFAULT_CACHE_DIR, refresh_interval=DEFAULT_REFRESH_SECONDS, storage=None):
+        """
+        Args:
+            bucket_name (str): GCS bucket holding the grid
+            file_name (str): Blob name of the grid within the bucket
+            cache_dir (str): Directory for the on-disk copy used on cold starts
+            refresh_interval (float): Seconds between generation checks, 0 disables them
+            storage: Backend to read from, defaults to get_storage(bucket_name)
+        """
+        self.bucket_name = bucket_name
+        self.storage = storage or get_storage(bucket_name)
+        self.file_name = file_name
+        self.cache_dir = cache_dir
+        self.refresh_interval = refresh_interval
+        self._current = None
+        self._load_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._refresher = None
+
+    @property
+    def local_path(self):
+        return os.path.join(self.cache_dir, os.path.basename(self.file_name))
+
+    @property
+    def meta_path(self):
+        return self.local_path + '.meta.json'
+
+    def sidecar_name(self, suffix):
+        return self.file_name.rsplit('.', 1)[0] + suffix
+
+    def local_sidecar_path(self, suffix):
+        return os.path.join(self.cache_dir, os.path.basename(self.sidecar_name(suffix)))
+
+    def get(self):
+        """Return the current MapVersion, loading it on first use."""
+        current = self._current
+        if current is not None:
+            return current
+
+        with self._load_lock:
+            if self._current is None:
+                self._current = self._load_initial()
+        self.start_background_refresh()
+        return self._current
+
+    def preload(self):
+        """Load and warm the current version without starting the refresh thread.
+
+        Used by a gunicorn master with preload_app: the version is built once
+        before workers are forked, and they share its pages copy-on-write.
+        Call after_fork() in each worker.
+
+        Returns:
+            MapVersion
+        """
+        with self._load_lock:
+            if self._current is None:
+                self._current = self._load_initial().warm()
+        return self._current
+
+    def after_fork(self):
+        """Prepare a forked worker: drop the parent's storage client and start refreshing."""
+        # HTTP connections of the parent's client must not be shared between processes
+        self.storage.reset()
+        self._load_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refresher = None
+        self.start_background_refresh()
+
+    def refresh(self):
+        """Check the blob generation and swap in a new version if it changed.
+
+        Returns:
+            bool: True if a new version was loaded
+        """
+        with self._refresh_lock:
+            version = self.storage.generation(self.file_name)
+            if version is None:
+                raise FileNotFoundError(f"{self.bucket_name}/{self.file_name} does not exist")
+
+            current = self._current
+            if current is not None and current.version == version:
+                return False
+
+            map_version = self._download(version).warm()
+            self._current = map_version
+            logger.info("Loaded grid %s generation %s", self.file_name, version)
+            return True
+
+    def start_background_refresh(self):
+        """Start the daemon thread that polls for new grid versions."""
+        if self.refresh_interval <= 0 or (self._refresher and self._refresher.is_alive()):
+            return
+        self._stop.clear()
+        self._refresher = threading.Thread(target=self._refresh_loop, name='grid-refresh', daemon=True)
+        self._refresher.start()
+
+    def stop_background_refresh(self):
+        self._stop.set()
+
+    def _refresh_loop(self):
+        # The first check runs immediately so a stale on-disk copy is replaced quickly
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Grid refresh failed, keeping version %s",
+                                 self._current.version if self._current else None)
+            self._stop.wait(self.refresh_interval)
+
+    def _load_initial(self):
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as file:
+                version = json.load(file)['version']
+            config = load_config(self.local_path)
+            sidecars = {}
+            for suffix in self.sidecar_suffixes:
+                path = self.local_sidecar_path(suffix)
+                if suffix in self.mapped_suffixes and os.path.exists(path):
+                    sidecars[suffix] = path
+                elif os.path.exists(path):
+                    with open(path, 'rb') as file:
+                        sidecars[suffix] = file.read()
+            return MapVersion(config, version, sidecars)
+        except (OSError, ValueError, KeyError):
+            pass
+
+        version = self.storage.generation(self.file_name)
+        if version is None:
+            raise FileNotFoundError(f"{self.bucket_name}/{self.file_name} does not exist")
+        return self._download(version)
+
+    def _download(self, version):
+        data = self.storage.read(self.file_name, version)
+        sidecars = {}
+        for suffix in self.sidecar_suffixes:
+            try:
+                sidecars[suffix] = self.storage.read(self.sidecar_name(suffix))
+            except FileNotFoundError:
+                pass
+        for suffix in self.mapped_suffixes:
+            if suffix in sidecars:
+                sidecars[suffix] = self._write_mapped(self.local_sidecar_path(suffix), sidecars[suffix])
+
+        if is_bundle(data):
+            # Bundles are served from a memory map of the on-disk copy
+            config = read_bundle(self._write_mapped(self.local_path, data)).config()
+        else:
+            config = json.loads(data)
+        map_version = MapVersion(config, version, sidecars)
+        self._write_local_copy(data, version, sidecars)
+        return map_version
+
+    def _write_local_copy(self, data, version, sidecars):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for suffix, sidecar in sidecars.items():
+                if suffix not in self.mapped_suffixes:
+                    _atomic_write(self.local_sidecar_path(suffix), sidecar)
+            if not is_bundle(data):
+                _atomic_write(self.local_path, data)
+            _atomic_write(self.meta_path, json.dumps({'version': version}).encode('utf-8'))
+        except OSError:
+            logger.warning("Could not write grid cache to %s", self.cache_dir, exc_info=True)
+
+    def _write_mapped(self, path, data):
+        """Store a file that is served memory-mapped and return its path, or its bytes if it cannot be written.
+
+        The file is replaced atomically, so maps of the previous version stay
+        valid until that version is dropped.
+        """
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            _atomic_write(path, data)
+            return path
+        except OSError:
+            logger.warning("Could not write %s, serving it from memory", path, exc_info=True)
+            return data
+
+def _atomic_write(path, data):
+    """Write data to path so readers never observe a partial file."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -0,0 +1,172 @@
+"""
+Immutable snapshot of one version of the routing grid
+"""
+import json
+import logging
+
+import numpy as np
+
+from routing_engine.components import ComponentIndex
+from routing_engine.distance_transform import obstacle_distance
+from routing_engine.georeference import GeoReference
+from routing_engine.hpa import HierarchicalSearch, load_abstract_graphs
+from routing_engine.jps import JumpPointSearch, load_jump_tables, mask_checksum
+from routing_engine.matrix import DistanceMatrix
+from routing_engine.navmesh import load_navmesh
+from routing_engine.search import GridSearch
+from routing_engine.snapping import SnapIndex
+from routing_engine.theta import ThetaStarSearch
+
+from src.route_table import load_route_table
+
+logger = logging.getLogger(__name__)
+
+# Padding levels requests are served at, in order of preference: the default
+# padding and the unpadded fallback. Per-padding indexes for these are built
+# before a version is swapped in.
+DEFAULT_PADDING = 2
+SERVED_PADDINGS = (DEFAULT_PADDING, 0)
+
+
+def load_entrance_labels(data):
+    """Read a grid_config.entrances.json sidecar written by entrance_labels_sidecar.
+
+    Returns:
+        tuple: (labels, checksum) with labels a dict of label -> (lat, lng) and
+            checksum the grid_checksum of the grid the file was written for
+    """
+    sidecar = json.loads(data)
+    if not isinstance(sidecar, dict) or 'grid_checksum' not in sidecar:
+        raise ValueError("Entrance labels carry no grid checksum; write them with python -m src.route_table")
+    labels = {entrance['label']: (float(entrance['latitude']), float(entrance['longitude']))
+              for entrance in sidecar['entrances']}
+    return labels, sidecar['grid_checksum']
+
+
+def entrance_labels_sidecar(map_version, entrances):
+    """The grid_config.entrances.json sidecar of a map version.
+
+    Args:
+        map_version (MapVersion): Grid the labels are served with
+        entrances (list): Labelled entrances written by the api-entrances service
+
+    Returns:
+        str: JSON of the entrances together with the grid's checksum
+    """
+    return json.dumps({'grid_checksum': map_version.grid_checksum, 'entrances': entrances})
+
+
+class MapVersion:
+    """A loaded grid config plus everything derived from it.
+
+    A new MapVersion is built in full before it replaces the previous one,
+    so request handlers always see a consistent grid and never a half-built one.
+    """
+
+    def __init__(self, config, version, sidecars=None):
+        """
+        Args:
+            config (dict): Parsed grid_config.json or MapBundle.config() (rows, cols, bounds and grid)
+            version (str): Identifier of the stored object, e.g. the GCS generation
+            sidecars (dict): Optional precomputed files stored next to the grid, by suffix
+        """
+        self.config = config
+        self.version = version
+        self.rows = config['rows']
+        self.cols = config['cols']
+        self.grid = config['grid']
+        # Cells <-> lat/lng for requests and responses, in whole arrays at a time.
+        # Synthetic grids of the benchmarks have no bounds and are only searched.
+        self.georeference = GeoReference.from_config(config) if 'lat_min' in config else None
+
+        # Distance to the nearest obstacle, so any padding radius is a threshold check.
+        # Map bundles may carry it precomputed; JSON configs are transformed here.
+        grid_array = np.asarray(self.grid, dtype=np.uint8)
+        if 'distance' in config:
+            self.obstacle_distance = np.asarray(config['distance'], dtype=np.int32)
+        else:
+            self.obstacle_distance = obstacle_distance(grid_array)
+        if grid_array.shape != (self.rows, self.cols):
+            logger.warning("Grid of version %s is %sx%s but rows/cols say %sx%s", version,
+                           grid_array.shape[0], grid_array.shape[1], self.rows, self.cols)
+
+        # Array-backed search engine with its own flat-index copy of the grid
+        self.engine = GridSearch(self.obstacle_distance)
+        # Sidecars built from the grid store this and are ignored when it does not match
+        self.grid_checksum = mask_checksum(self.engine.blocked(0))
+
+        sidecars = sidecars or {}
+        self.engines = {
+            'astar': self.engine,
+            'jps': JumpPointSearch(self.engine, self._load_sidecar(sidecars, '.jps.npz', load_jump_tables)),
+            'hpa': HierarchicalSearch(self.engine, self._load_sidecar(sidecars, '.hpa.npz', load_abstract_graphs)),
+            # Any-angle paths of a few waypoints, at five to seven times the search time of astar
+            'theta': ThetaStarSearch(self.engine),
+        }
+        for padding in SERVED_PADDINGS:
+            self.engines['jps'].tables(padding)
+            self.engines['hpa'].graph(padding)
+
+        # Any-angle routing on a navigation mesh, when one was built offline for this map
+        self.navmesh = self._load_sidecar(sidecars, '.navmesh.npz', load_navmesh)
+        if self.navmesh is not None and self.navmesh.grid_checksum != self.grid_checksum:
+            logger.warning("Ignoring navigation mesh built for a different grid in version %s", self.version)
+            self.navmesh = None
+
+        # Unreachable pairs are detected from the labels without running a search
+        self.components = ComponentIndex(self.engine, SERVED_PADDINGS)
+        self.matrix = DistanceMatrix(self.obstacle_distance, self.components)
+
+        # Named entrances (e.g. "Hemmingson_01") that requests may use in place of coordinates
+        entrances = self._load_sidecar(sidecars, '.entrances.json', load_entrance_labels)
+        if entrances is not None and entrances[1] != self.grid_checksum:
+            logger.warning("Ignoring entrance labels written for a different grid in version %s", self.version)
+            entrances = None
+        self.entrances = entrances[0] if entrances is not None else {}
+
+        # Precomputed entrance-to-entrance routes, only used if built for this grid
+        self.route_table = self._load_sidecar(sidecars, '.routes.bin', load_route_table)
+        if self.route_table is not None and not self.route_table.matches(self):
+            logger.warning("Ignoring route table built for a different grid in version %s", self.version)
+            self.route_table = None
+
+        # Nearest-cell lookups for snapping points, limited to the rows and cols
+        # lat/lng are mapped onto. Entrance and hallway targets are only available
+        # when the config carries those layers, and only their walkable cells count.
+        # The target masks are kept for moving points out of temporary closures.
+        walkable = grid_array[:self.rows, :self.cols] == 0
+        self.snap_targets = {'free': walkable}
+        for name, layer in (('entrance', 'entrances'), ('hallway', 'hallways')):
+            if layer in config:
+                self.snap_targets[name] = walkable & (np.asarray(config[layer])[:self.rows, :self.cols] == 1)
+        self.snap_indexes = {name: SnapIndex(targets) for name, targets in self.snap_targets.items()}
+
+    def warm(self):
+        """Build the per-padding indexes that are otherwise built on first use.
+
+        Called before a version is served from a preloaded gunicorn master, so
+        forked workers share these pages instead of each building a private copy.
+        """
+        for padding in SERVED_PADDINGS:
+            self.engine.blocked(padding)
+            self.components.labels(padding)
+            self.engines['theta'].blocked_sums(padding)
+            self.matrix.graph(padding)
+        return self
+
+    @property
+    def engine_names(self):
+        """Names requests may pass as engine: the grid engines, plus navmesh if loaded."""
+        return sorted(self.engines) + (['navmesh'] if self.navmesh is not None else [])
+
+    def _load_sidecar(self, sidecars, suffix, loader):
+        if suffix not in sidecars:
+            return None
+        try:
+            return loader(sidecars[suffix])
+        except Exception:
+            logger.warning("Ignoring unreadable %s sidecar for version %s", suffix, self.version, exc_info=True)
+            return None
+
+    def __repr__(self):
+        return f"MapVersion(version={self.version!r}, rows={self.rows}, cols={self.cols})"
@@ -0,0 +1,148 @@
+"""
+In-process LRU cache of finished routes
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+DEFAULT_MAX_ENTRIES = int(os.environ.get('ROUTE_CACHE_SIZE', 2048))
+DEFAULT_TTL_SECONDS = float(os.environ.get('ROUTE_CACHE_TTL_SECONDS', 3600))
+# Superseded map versions remembered, so a late request on one is not taken for a new version
+RETIRED_VERSIONS = 16
+
+
+class RouteCache:
+    """Least-recently-used cache of routes with a size limit and an expiry time.
+
+    Entries are keyed by map version, so a route is only served to requests
+    on the version it was searched on. The first lookup or store on a version
+    not seen before makes it the current one. Requests still running on the
+    previous version while a new one is swapped in keep reading their entries,
+    but what they store is dropped, and entries of superseded versions are
+    evicted as soon as they become the least recently used, instead of the
+    whole cache being cleared whenever the two versions alternate.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS, clock=time.monotonic):
+        """
+        Args:
+            max_entries (int): Most routes kept at once, 0 disables the cache
+            ttl_seconds (float): Seconds a route is served for after it was stored
+            clock (callable): Source of the current time in seconds
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._version = None
+        self._retired = deque(maxlen=RETIRED_VERSIONS)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(engine_name, padding, start, end):
+        """Cache key of a route between two snapped (row, col) cells."""
+        return engine_name, padding, tuple(start), tuple(end)
+
+    def get(self, version, key):
+        """Return the cached route for key on a map version, or None on a miss."""
+        with self._lock:
+            self._use_version(version)
+            entry = self._entries.get((version, key))
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, route = entry
+            if self._clock() - stored_at > self.ttl_seconds:
+                del self._entries[version, key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end((version, key))
+            self.hits += 1
+            return route
+
+    def put(self, version, key, route):
+        """Store a route for key on a map version, evicting the least recently used if full.
+
+        Routes of a superseded version are not stored.
+        """
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._use_version(version)
+            if version != self._version:
+                return
+            self._entries[version, key] = (self._clock(), route)
+            self._entries.move_to_end((version, key))
+            # Entries of superseded versions go as soon as they are the least recently used
+            while self._entries:
+                oldest_version = next(iter(self._entries))[0]
+                if oldest_version != self._version:
+                    self.invalidations += 1
+                elif len(self._entries) > self.max_entries:
+                    self.evictions += 1
+                else:
+                    break
+                self._entries.popitem(last=False)
+
+    def entries(self, version):
+        """Snapshot of the (key, route) pairs cached for a map version, least recently used first."""
+        with self._lock:
+            return [(key, route) for (entry_version, key), (_, route) in self._entries.items()
+                    if entry_version == version]
+
+    def replace(self, version, key, route, expected=None):
+        """Swap the route of an existing entry, keeping its age and recency.
+
+        Args:
+            expected: If given, the entry is only swapped while it still holds this route
+
+        Returns:
+            bool: False if the entry is gone, e.g. evicted since entries() listed it,
+                or holds another route than expected
+        """
+        with self._lock:
+            entry = self._entries.get((version, key))
+            if entry is None or (expected is not None and entry[1] is not expected):
+                return False
+            self._entries[version, key] = (entry[0], route)
+            return True
+
+    def discard(self, version, key):
+        """Drop one entry of a map version, if it is still cached."""
+        with self._lock:
+            self._entries.pop((version, key), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Counters and size of the cache, as a JSON-serializable dict."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'version': self._version,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+    def _use_version(self, version):
+        # Called with the lock held. Only a version never seen before replaces the current one.
+        if version != self._version and version not in self._retired:
+            if self._version is not None:
+                self._retired.append(self._version)
+            self._version = version
@@ -0,0 +1,257 @@
+"""
+Precomputed entrance-to-entrance routes served from a memory-mapped file
+"""
+import argparse
+import json
+import mmap
+import struct
+
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+
+from routing_engine.hpa import grid_graph
+from routing_engine.search import ORTHOGONAL_COST
+
+MAGIC = b'CNRT'
+FORMAT_VERSION = 1
+
+# magic, format version, rows, cols, entrances, trees, tree nodes, grid checksum, labels length
+_HEADER = struct.Struct('<4sIIIIIIII')
+
+# One record per ordered entrance pair. tree is -1 when the pair is not
+# connected; reverse means the path is read from the tree of the end entrance.
+PAIR_DTYPE = np.dtype([('tree', '<i4'), ('node', '<u4'), ('cost', '<u4'),
+                       ('padding', '<u2'), ('reverse', 'u1'), ('reserved', 'u1')])
+
+
+def _aligned(offset):
+    return (offset + 7) & ~7
+
+
+def entrance_cell(map_version, lat, lng):
+    """Grid cell of an entrance, mapped and snapped like the points of a route request."""
+    row, col = map_version.georeference.lat_lng_to_cell(lat, lng, clip=True)
+    if map_version.grid[row][col] == 1:
+        row, col = map_version.snap_indexes['free'].nearest(row, col)
+    return row, col
+
+
+def build_route_table(map_version, labels, cells, paddings):
+    """Shortest routes between every pair of entrances, as shortest-path trees.
+
+    Each entrance runs one Dijkstra search per padding level it needs. The
+    paths to all later entrances are merged into a tree rooted at it, so path
+    segments shared by several routes are stored once, and routes towards
+    earlier entrances are read backwards from their trees.
+
+    Args:
+        map_version (MapVersion): Map version the routes are computed on
+        labels (list): Entrance labels
+        cells (list): (row, col) cell of each entrance, None if it has no walkable cell
+        paddings (tuple): Padding levels in order of preference, like route requests
+
+    Returns:
+        bytes: The table in the format read by RouteTable
+    """
+    rows, cols = map_version.obstacle_distance.shape
+    count = len(labels)
+    pairs = np.zeros((count, count), dtype=PAIR_DTYPE)
+    pairs['tree'] = -1
+
+    # Targets of each source, by the padding level their pair is routed at
+    pending = {}
+    for i in range(count):
+        for j in range(i + 1, count):
+            if cells[i] is None or cells[j] is None:
+                continue
+            padding = map_version.components.first_connected_padding(cells[i], cells[j], paddings)
+            if padding is not None:
+                pending.setdefault(padding, {}).setdefault(i, []).append(j)
+
+    tree_offsets = [0]
+    tree_nodes, tree_parents = [], []
+    for padding, targets in sorted(pending.items()):
+        sources = sorted(targets)
+        ids = [cells[i][0] * cols + cells[i][1] for i in sources]
+        costs, predecessors = dijkstra(grid_graph(map_version.obstacle_distance > padding), directed=False,
+                                       indices=ids, return_predecessors=True)
+        for source, root, source_costs, source_predecessors in zip(sources, ids, costs, predecessors):
+            tree = len(tree_offsets) - 1
+            local = {root: 0}
+            nodes, parents = [root], [0]
+            for j in targets[source]:
+                target = cells[j][0] * cols + cells[j][1]
+                # Walk towards the root until the path joins the tree built so far
+                branch = []
+                node = target
+                while node not in local:
+                    branch.append(node)
+                    node = int(source_predecessors[node])
+                for node in reversed(branch):
+                    local[node] = len(nodes)
+                    parents.append(local[int(source_predecessors[node])])
+                    nodes.append(node)
+
+                cost = int(round(source_costs[target]))
+                pairs[source, j] = (tree, local[target], cost, padding, 0, 0)
+                pairs[j, source] = (tree, local[target], cost, padding, 1, 0)
+            tree_nodes.extend(nodes)
+            tree_parents.extend(parents)
+            tree_offsets.append(len(tree_nodes))
+
+    for i in range(count):
+        if cells[i] is not None:
+            pairs[i, i] = (-1, 0, 0, paddings[0], 0, 0)
+
+    label_bytes = json.dumps(labels).encode('utf-8')
+    entrance_cells = np.array([-1 if cell is None else cell[0] * cols + cell[1] for cell in cells], dtype='<i4')
+    sections = [label_bytes, entrance_cells.tobytes(), pairs.tobytes(),
+                np.array(tree_offsets, dtype='<u4').tobytes(),
+                np.array(tree_nodes, dtype='<u4').tobytes(),
+                np.array(tree_parents, dtype='<u4').tobytes()]
+
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, rows, cols, count, len(tree_offsets) - 1, len(tree_nodes),
+                          map_version.grid_checksum, len(label_bytes))
+    data = bytearray(header)
+    for section in sections:
+        data.extend(bytes(_aligned(len(data)) - len(data)))
+        data.extend(section)
+    return bytes(data)
+
+
+def load_route_table(source):
+    """Open a route table from a file path (memory-mapped) or from bytes.
+
+    Returns:
+        RouteTable
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as file:
+            return RouteTable(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+    return RouteTable(source)
+
+
+class RouteTable:
+    """Entrance-to-entrance routes read in place from a buffer.
+
+    Every array is a numpy view of the buffer, so a memory-mapped file is
+    served without being read into the heap, and the page cache is shared by
+    every worker process on the machine. Looking up a route is a dict lookup
+    per entrance plus a walk up one shortest-path tree.
+    """
+
+    def __init__(self, buffer):
+        """
+        Args:
+            buffer: bytes or mmap holding a table written by build_route_table
+        """
+        magic, version, rows, cols, count, trees, nodes, checksum, label_length = _HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"Not a version {FORMAT_VERSION} route table")
+        self.buffer = buffer
+        self.shape = (rows, cols)
+        self.checksum = checksum
+
+        offset = _HEADER.size
+        sections = {}
+        for name, dtype, length in (('labels', 'u1', label_length), ('cells', '<i4', count),
+                                    ('pairs', PAIR_DTYPE, count * count), ('offsets', '<u4', trees + 1),
+                                    ('nodes', '<u4', nodes), ('parents', '<u4', nodes)):
+            offset = _aligned(offset)
+            sections[name] = np.frombuffer(buffer, dtype=dtype, count=length, offset=offset)
+            offset += sections[name].nbytes
+
+        self.labels = json.loads(sections['labels'].tobytes())
+        self.pairs = sections['pairs'].reshape(count, count)
+        self._offsets = sections['offsets']
+        self._nodes = sections['nodes']
+        self._parents = sections['parents']
+        self._index = {divmod(int(cell), cols): i for i, cell in enumerate(sections['cells']) if cell >= 0}
+
+    def matches(self, map_version):
+        """Whether the table was built for the obstacles of map_version."""
+        return self.shape == map_version.obstacle_distance.shape and self.checksum == map_version.grid_checksum
+
+    def __contains__(self, cell):
+        return cell in self._index
+
+    def route(self, start, end):
+        """The stored route between two entrance cells.
+
+        Returns:
+            tuple: (path, padding) with path a list of (row, col) cells, ([], None)
+                if the entrances are not connected, or None if either cell is
+                not an entrance of the table
+        """
+        i, j = self._index.get(start), self._index.get(end)
+        if i is None or j is None:
+            return None
+        record = self.pairs[i, j]
+        if i == j:
+            return [start], int(record['padding'])
+        tree = int(record['tree'])
+        if tree < 0:
+            return [], None
+
+        base = int(self._offsets[tree])
+        nodes, parents = self._nodes, self._parents
+        cols = self.shape[1]
+        node = int(record['node'])
+        path = [divmod(int(nodes[base + node]), cols)]
+        while node:
+            node = int(parents[base + node])
+            path.append(divmod(int(nodes[base + node]), cols))
+        if not record['reverse']:
+            path.reverse()
+        return path, int(record['padding'])
+
+    def lengths(self, cells):
+        """Path lengths in cells between every pair of cells, like DistanceMatrix.lengths.
+
+        Returns:
+            list: N x N nested lists, or None unless every cell is an entrance of the table
+        """
+        indexes = [self._index.get(cell) for cell in cells]
+        if None in indexes:
+            return None
+        costs = self.pairs['cost'][np.ix_(indexes, indexes)]
+        connected = (self.pairs['tree'][np.ix_(indexes, indexes)] >= 0) | np.eye(len(indexes), dtype=bool)
+        return [[float(cost) / ORTHOGONAL_COST if ok else None for cost, ok in zip(cost_row, ok_row)]
+                for cost_row, ok_row in zip(costs.tolist(), connected.tolist())]
+
+
+def main():
+    """Build the route table and entrance labels sidecars for a grid config and a list of labelled entrances."""
+    from routing_engine.map_bundle import load_config
+    from src.map_version import SERVED_PADDINGS, MapVersion, entrance_labels_sidecar
+
+    parser = argparse.ArgumentParser(description="Precompute entrance-to-entrance routes for a grid config.")
+    parser.add_argument("grid_config", help="Path to grid_config.json or a map bundle")
+    parser.add_argument("entrances", help="Labelled entrances JSON written by the api-entrances service")
+    parser.add_argument("--output", help="Output path (default: <grid_config>.routes.bin)")
+    args = parser.parse_args()
+
+    map_version = MapVersion(load_config(args.grid_config), 'local')
+    with open(args.entrances, 'r', encoding='utf-8') as file:
+        entrances = json.load(file)
+
+    labels = [entrance['label'] for entrance in entrances]
+    cells = [entrance_cell(map_version, float(entrance['latitude']), float(entrance['longitude']))
+             for entrance in entrances]
+    cells = [None if cell[0] is None else cell for cell in cells]
+    data = build_route_table(map_version, labels, cells, SERVED_PADDINGS)
+
+    output = args.output or args.grid_config.rsplit('.', 1)[0] + '.routes.bin'
+    with open(output, 'wb') as file:
+        file.write(data)
+    print(f"Saved routes between {len(labels)} entrances ({len(data) / 1e6:.1f} MB) to {output}")
+
+    # The labels the API resolves entrance names with, tied to this grid like the table
+    labels_output = args.grid_config.rsplit('.', 1)[0] + '.entrances.json'
+    with open(labels_output, 'w', encoding='utf-8') as file:
+        file.write(entrance_labels_sidecar(map_version, entrances))
+    print(f"Saved the entrance labels to {labels_output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import random
+
+from routing_engine.search import GridSearch
+
+from benchmarks.compare import compare_results
+from benchmarks.corpus import SHORT_CELLS, build_corpus
+from benchmarks.differential import ENGINE_FACTORIES, random_cases, render_grid, run_differential, shrink
+from src.map_version import MapVersion
+
+
+def test_corpus_is_seeded_and_classified():
+    rng = random.Random(5)
+    grid = [[1 if rng.random() < 0.2 else 0 for _ in range(60)] for _ in range(50)]
+    for row in grid:
+        row[30] = 1  # A wall splits the map, so some pairs are unreachable
+    map_version = MapVersion({'rows': 50, 'cols': 60, 'grid': grid}, 'test')
+
+    corpus = build_corpus(map_version, pairs_per_category=5, paddings=(0,), seed=1)
+    assert corpus == build_corpus(map_version, pairs_per_category=5, paddings=(0,), seed=1)
+    assert corpus != build_corpus(map_version, pairs_per_category=5, paddings=(0,), seed=2)
+
+    categories = {pair.category for pair in corpus}
+    assert {'short', 'through_building', 'unreachable'} <= categories
+    for pair in corpus:
+        found = map_version.engine.search(pair.start, pair.goal, pair.padding).path
+        assert bool(found) == (pair.category != 'unreachable')
+        if pair.category == 'short':
+            assert max(abs(pair.start[0] - pair.goal[0]), abs(pair.start[1] - pair.goal[1])) <= SHORT_CELLS
+
+
+def test_compare_flags_slower_and_different_routes():
+    def results(p50, total_cost):
+        return {'meta': {'grid_checksum': 1, 'seed': 0, 'pairs_per_category': 5},
+                'results': [{'engine': 'astar', 'padding': 2, 'category': 'long', 'found': 5,
+                             'total_cost': total_cost, 'latency_ms': {'p50': p50, 'p99': p50},
+                             'nodes_expanded': {'mean': 100.0}}]}
+
+    assert compare_results(results(10.0, 500.0), results(10.5, 500.0))[1] == []
+    problems = compare_results(results(10.0, 500.0), results(12.0, 510.0))[1]
+    assert len(problems) == 2
+
+
+def test_differential_harness_shrinks_a_broken_engine(monkeypatch):
+    class OrthogonalSearch(GridSearch):
+        """Drops diagonal steps, so its paths are longer than the reference."""
+
+        def __init__(self, distance):
+            super().__init__(distance)
+            self.steps = self.steps[:4]
+
+    monkeypatch.setitem(ENGINE_FACTORIES, 'broken', lambda grid_search: OrthogonalSearch(grid_search._distance[1:-1, 1:-1]))
+    checked, mismatches = run_differential(random_cases(5, seed=0), ['astar', 'broken'])
+    assert checked['astar'] == checked['broken'] > 0
+    assert mismatches and {mismatch.engine for mismatch in mismatches} == {'broken'}
+
+    repro = shrink(mismatches[0])
+    assert repro.kind == 'cost'
+    assert len(repro.grid) * len(repro.grid[0]) <= 10  # One detour of a diagonal step is enough to fail
+    assert render_grid(repro).count('S') == 1
@@ -0,0 +1,100 @@
+import json
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from src.closures import REPAIRED, ClosureManager
+from src.grid_cache import GridCache
+from src.route_cache import RouteCache
+from src.storage import LocalStorage
+
+
+def test_closures_are_shared_and_cached_routes_repaired(tmp_path):
+    storage = LocalStorage('maps', root=str(tmp_path / 'buckets'))
+    grid = [[0] * 40 for _ in range(30)]
+    for row in range(5, 25):
+        grid[row][20] = 1  # A wall with gaps at the top and bottom
+    config = {'rows': 30, 'cols': 40, 'lat_min': 47.0, 'lat_max': 47.3, 'lng_min': -117.4, 'lng_max': -117.0,
+              'grid': grid}
+    storage.write('grid_config.json', json.dumps(config))
+    grid_cache = GridCache('maps', cache_dir=str(tmp_path / 'cache'), refresh_interval=0, storage=storage)
+    map_version = grid_cache.get()
+    georeference = map_version.georeference
+
+    now = [1000.0]
+    route_cache = RouteCache()
+    manager = ClosureManager(grid_cache, route_cache, refresh_interval=0, clock=lambda: now[0])
+    assert manager.overlay(map_version) is None
+
+    # A route through the bottom gap, cached before any closure
+    start, end = (28, 5), (28, 35)
+    cells = map_version.engine.search(start, end, 0).path
+    key = RouteCache.key('astar', 0, start, end)
+    original = {'path': georeference.cells_to_lat_lng(cells).tolist(), 'debug_info': None, 'cells': cells,
+                'padding': 0}
+    route_cache.put(map_version.version, key, original)
+
+    # Closing the bottom gap repairs the route through the top one
+    closure, closed_cells, counts = manager.add(
+        map_version, georeference.cells_to_lat_lng([(24, 18), (24, 22), (29, 22), (29, 18)]).tolist(),
+        'construction', expires_in=60)
+    assert closed_cells == 30 and counts['repaired'] == 1
+    overlay = manager.overlay(map_version)
+    repaired = route_cache.get(map_version.version, key)
+    assert repaired['closure_state'] == REPAIRED
+    assert not overlay.crosses(repaired['cells'], 0)
+    assert np.isclose(np.hypot(*np.diff(np.array(repaired['cells']), axis=0).T).sum(),
+                      overlay.search(map_version.engine, start, end).cost, rtol=1e-4)
+    assert repaired['path'] == georeference.cells_to_lat_lng(repaired['cells']).tolist()
+
+    # Another worker sees the closure through storage
+    other = ClosureManager(grid_cache, RouteCache(), refresh_interval=0, clock=lambda: now[0])
+    assert [item['id'] for item in other.closures()] == [closure['id']]
+    assert other.overlay(map_version).closed[26, 20]
+
+    # Requests get a new overlay from another worker while this one is still repairing routes
+    third, _, _ = other.add(map_version, georeference.cells_to_lat_lng([(10, 2), (10, 4), (12, 4)]).tolist())
+    with manager._repair_lock:
+        refresher = threading.Thread(target=manager.refresh)
+        refresher.start()
+        while manager._applied[1] != (closure['id'], third['id']):
+            time.sleep(0.01)
+        assert manager.overlay(map_version).closed[11, 3]
+    refresher.join()
+    other.remove(map_version, third['id'])
+    manager.refresh()
+
+    # Closing the top gap as well leaves no way round, so the route is dropped
+    second, _, counts = manager.add(map_version,
+                                    georeference.cells_to_lat_lng([(0, 18), (0, 22), (5, 22), (5, 18)]).tolist())
+    assert counts['dropped'] == 1 and route_cache.get(map_version.version, key) is None
+    assert manager.remove(map_version, second['id']) is not None
+    assert manager.remove(map_version, second['id']) is None
+
+    # Once the first closure expires, a re-cached original is left alone
+    route_cache.put(map_version.version, key, original)
+    now[0] += 61
+    assert manager.overlay(map_version) is None and manager.closures() == []
+    assert route_cache.get(map_version.version, key) is original
+
+    with pytest.raises(ValueError):
+        manager.add(map_version, [[0, 0], [0, 1], [1, 1]])
+
+
+def test_closure_edits_require_the_token(monkeypatch):
+    import main
+
+    client = main.app.test_client()
+    polygon = [[47.1, -117.3], [47.1, -117.2], [47.2, -117.2]]
+    monkeypatch.setattr(main, 'CLOSURES_TOKEN', '')
+    assert client.post('/closures', json={'polygon': polygon}).status_code == 403
+    assert client.delete('/closures/abc').status_code == 403
+
+    monkeypatch.setattr(main, 'CLOSURES_TOKEN', 'secret')
+    assert client.post('/closures', json={'polygon': polygon}).status_code == 401
+    assert client.post('/closures', json={'polygon': polygon},
+                       headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.delete('/closures/abc', headers={'Authorization': 'Basic secret'})
+    assert response.status_code == 401 and response.headers['WWW-Authenticate'] == 'Bearer'
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from routing_engine.distance_transform import obstacle_distance
+from routing_engine.map_bundle import bundle_from_config, load_config, read_bundle
+
+from src.map_version import MapVersion
+
+
+def make_config(rows=6, cols=8):
+    grid = [[1 if (row * cols + col) % 5 == 0 else 0 for col in range(cols)] for row in range(rows)]
+    return {'rows': rows, 'cols': cols, 'lat_min': 47.66, 'lat_max': 47.67,
+            'lng_min': -117.41, 'lng_max': -117.40, 'grid': grid,
+            'entrances': [[int(col == 0) for col in range(cols)] for _ in range(rows)]}
+
+
+def test_map_bundle_round_trips_through_a_memory_map(tmp_path):
+    config = make_config()
+    distance = obstacle_distance(np.asarray(config['grid'], dtype=np.uint8))
+    path = tmp_path / 'grid_config.bundle'
+    path.write_bytes(bundle_from_config(config, distance=distance))
+
+    bundle = read_bundle(str(path))
+    assert (bundle.rows, bundle.cols) == (6, 8)
+    assert bundle.bounds == (47.66, 47.67, -117.41, -117.40)
+    assert np.array_equal(bundle.layers['obstacles'], config['grid'])
+    assert np.array_equal(bundle.layers['distance'], distance)
+    assert bundle.layers['distance'].dtype == np.uint8  # Every distance fits in a byte
+    assert not bundle.layers['obstacles'].flags.writeable
+
+    loaded = MapVersion(load_config(str(path)), 'bundle')
+    expected = MapVersion(config, 'json')
+    assert np.array_equal(loaded.obstacle_distance, expected.obstacle_distance)
+    assert sorted(loaded.snap_indexes) == ['entrance', 'free']
+    assert loaded.engine.search((0, 1), (5, 6)).cost == expected.engine.search((0, 1), (5, 6)).cost
+
+
+def test_map_bundle_rejects_mismatched_and_corrupted_data():
+    config = make_config()
+    config['grid'] = [row + [0, 0] for row in config['grid']]
+    with pytest.raises(ValueError, match='6x10 but the map is 6x8'):
+        bundle_from_config(config)
+
+    data = bytearray(bundle_from_config(config, crop=True))
+    assert read_bundle(bytes(data)).layers['obstacles'].shape == (6, 8)
+    for position in (-1, 12):  # The last layer byte, and the header's column count
+        corrupted = bytearray(data)
+        corrupted[position] ^= 1
+        with pytest.raises(ValueError, match='checksum'):
+            read_bundle(bytes(corrupted))
+    with pytest.raises(ValueError, match='do not fit uint16'):
+        bundle_from_config(config, crop=True, distance=np.full((6, 8), 70000))
+    with pytest.raises(ValueError, match='Not a map bundle'):
+        read_bundle(b'{"rows": 480}' + bytes(64))
@@ -0,0 +1,26 @@
+import os
+
+from src.metrics import Registry
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.histogram('stage_seconds', 'Stage time', ('stage',), buckets=(0.1, 1.0))
+    counter = registry.counter('routes_total', 'Routes', ('source',))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, 'search')
+    counter.inc('cache')
+    counter.inc('cache')
+
+    assert registry.render() == '\n'.join([
+        '# HELP stage_seconds Stage time',
+        '# TYPE stage_seconds histogram',
+        'stage_seconds_bucket{stage="search",worker="%(pid)s",le="0.1"} 1',
+        'stage_seconds_bucket{stage="search",worker="%(pid)s",le="1.0"} 3',
+        'stage_seconds_bucket{stage="search",worker="%(pid)s",le="+Inf"} 4',
+        'stage_seconds_sum{stage="search",worker="%(pid)s"} 4.05',
+        'stage_seconds_count{stage="search",worker="%(pid)s"} 4',
+        '# HELP routes_total Routes',
+        '# TYPE routes_total counter',
+        'routes_total{source="cache",worker="%(pid)s"} 2',
+    ]) % {'pid': os.getpid()} + '\n'
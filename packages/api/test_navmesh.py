@@ -0,0 +1,76 @@
+import io
+import json
+import math
+
+import numpy as np
+from scipy.spatial import Delaunay
+
+from routing_engine.jps import grid_checksum
+from routing_engine.navmesh import NavMesh
+
+from src.map_version import MapVersion
+
+IDENTITY = np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+
+
+def mesh_with_wall():
+    """10 x 10 square with a wall from (4, 0) to (6, 8) rising from the bottom edge."""
+    outline = [(x, y) for x in (0, 4, 6, 10) for y in (0, 10)] + [(0, 5), (10, 5)]
+    wall = [(x, y) for x in (4, 6) for y in range(0, 9, 2)] + [(5, 8)]
+    points = np.array(sorted(set(outline + wall)), dtype=float)
+    triangulation = Delaunay(points)
+    centroids = points[triangulation.simplices].mean(axis=1)
+    keep = ~((centroids[:, 0] > 4) & (centroids[:, 0] < 6) & (centroids[:, 1] < 8))
+    new_index = np.full(len(keep), -1)
+    new_index[keep] = np.arange(keep.sum())
+    neighbors = triangulation.neighbors[keep]
+    neighbors = np.where(neighbors >= 0, new_index[neighbors], -1)
+    return NavMesh(points, triangulation.simplices[keep], neighbors, IDENTITY, IDENTITY)
+
+
+def polyline_length(path):
+    return sum(math.dist(a, b) for a, b in zip(path, path[1:]))
+
+
+def test_navmesh_paths_are_taut_and_avoid_walls():
+    mesh = mesh_with_wall()
+
+    # Triangle A* picks the channel, so paths are near-shortest rather than exact
+    path = mesh.find_path((1, 1), (3, 9))
+    assert path[0] == (1, 1) and path[-1] == (3, 9)
+    assert polyline_length(path) <= math.hypot(2, 8) * 1.02
+
+    path = mesh.find_path((1, 1), (9, 1))
+    assert path[0] == (1, 1) and path[-1] == (9, 1)
+    assert (4, 8) in path and (6, 8) in path
+    assert math.isclose(polyline_length(path), 2 * math.hypot(3, 7) + 2)
+
+    assert mesh.locate((5, 4)) == -1
+    point, triangle = mesh.nearest((5.5, 4))
+    assert point == (6.0, 4.0) and triangle >= 0
+
+
+def test_map_version_ignores_sidecars_of_another_grid():
+    mesh = mesh_with_wall()
+    config = {'rows': 4, 'cols': 5, 'grid': [[0, 1, 0, 0, 0]] * 4}
+    other_grid = [[0] * 5] * 4
+
+    def sidecars(checksum):
+        archive = io.BytesIO()
+        np.savez(archive, vertices=mesh.vertices, triangles=mesh.triangles, neighbors=mesh.neighbors,
+                 to_utm=IDENTITY, to_lat_lng=IDENTITY, grid_checksum=np.array(checksum, dtype=np.uint32))
+        entrances = [{'label': 'Hall_01', 'latitude': 0.5, 'longitude': 0.5}]
+        return {'.navmesh.npz': archive.getvalue(),
+                '.entrances.json': json.dumps({'grid_checksum': checksum, 'entrances': entrances})}
+
+    matching = MapVersion(config, 'a', sidecars(grid_checksum(config['grid'])))
+    assert matching.grid_checksum == grid_checksum(config['grid'])
+    assert matching.navmesh is not None and matching.entrances == {'Hall_01': (0.5, 0.5)}
+
+    stale = MapVersion(config, 'b', sidecars(grid_checksum(other_grid)))
+    assert stale.navmesh is None and stale.entrances == {}
+
+    # Labels uploaded straight from the api-entrances service are tied to no grid
+    untied = MapVersion(config, 'c', {'.entrances.json': json.dumps([{'label': 'Hall_01', 'latitude': 0.5,
+                                                                      'longitude': 0.5}])})
+    assert untied.entrances == {}
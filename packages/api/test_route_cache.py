@@ -0,0 +1,51 @@
+from src.route_cache import RouteCache
+
+
+def test_route_cache_evicts_expires_and_invalidates():
+    now = [0.0]
+    cache = RouteCache(max_entries=2, ttl_seconds=10, clock=lambda: now[0])
+    a, b, c = (RouteCache.key('astar', 2, (0, i), (5, 5)) for i in range(3))
+
+    cache.put('v1', a, 'route a')
+    cache.put('v1', b, 'route b')
+    assert cache.get('v1', a) == 'route a'
+    cache.put('v1', c, 'route c')  # b is now the least recently used
+    assert cache.get('v1', b) is None
+    assert cache.evictions == 1
+
+    now[0] = 11
+    assert cache.get('v1', a) is None
+    assert cache.expirations == 1
+
+    cache.put('v1', a, 'route a')
+    assert cache.get('v2', a) is None
+    assert (cache.hits, cache.misses) == (1, 3)
+
+    # Requests still on v1 during the swap keep their entries, but store nothing new
+    assert cache.get('v1', a) == 'route a'
+    cache.put('v1', b, 'route b')
+    assert cache.get('v1', b) is None
+    assert cache.stats()['version'] == 'v2'
+
+    # v1 entries go once they are the least recently used
+    cache.put('v2', b, 'route b2')
+    assert cache.stats()['entries'] == 1 and cache.invalidations == 2  # a and c
+    assert cache.get('v2', b) == 'route b2'
+
+
+def test_polylines_are_cached_on_a_copy_of_the_route():
+    import main
+    from src.map_version import MapVersion
+
+    config = {'rows': 10, 'cols': 12, 'lat_min': 47.0, 'lat_max': 47.1, 'lng_min': -117.2, 'lng_max': -117.0,
+              'grid': [[0] * 12 for _ in range(10)]}
+    map_version = MapVersion(config, 'polyline-test')
+    start, end = (1, 1), (8, 10)
+    route = main.route_from_path(map_version, start, end, 2, map_version.engine.search(start, end, 2).path)
+    key = RouteCache.key('astar', 2, start, end)
+    main.route_cache.put(map_version.version, key, route)
+
+    fields = main.path_fields(map_version, route, 'polyline', key)
+    # Other threads may be reading the cached dict, so it is left as it was
+    assert 'polyline' not in route
+    assert main.route_cache.get(map_version.version, key)['polyline'] == fields['polyline']
@@ -0,0 +1,56 @@
+import math
+import random
+
+from src.map_version import MapVersion
+from src.route_table import build_route_table, load_route_table
+
+
+def test_route_table_serves_shortest_routes_from_file(tmp_path):
+    rng = random.Random(9)
+    grid = [[1 if rng.random() < 0.25 else 0 for _ in range(40)] for _ in range(30)]
+    grid[0][0] = grid[29][39] = 0
+    map_version = MapVersion({'rows': 30, 'cols': 40, 'grid': grid}, 'test')
+    free = [(row, col) for row in range(30) for col in range(40) if not grid[row][col]]
+    cells = rng.sample(free, 8) + [None]
+    labels = [f'Building_{i:02}' for i in range(len(cells))]
+
+    path = tmp_path / 'grid_config.routes.bin'
+    path.write_bytes(build_route_table(map_version, labels, cells, (1, 0)))
+    table = load_route_table(str(path))
+    assert table.matches(map_version)
+    assert table.labels == labels
+    assert None not in table
+
+    lengths = table.lengths(cells[:-1])
+    for i, start in enumerate(cells[:-1]):
+        for j, end in enumerate(cells[:-1]):
+            route, padding = table.route(start, end)
+            expected_padding = map_version.components.first_connected_padding(start, end, (1, 0))
+            if i == j:
+                assert route == [start] and lengths[i][j] == 0
+            elif expected_padding is None:
+                assert route == [] and lengths[i][j] is None
+            else:
+                expected = map_version.engine.search(start, end, expected_padding).cost
+                assert padding == expected_padding
+                assert route[0] == start and route[-1] == end
+                assert all(max(abs(a - c), abs(b - d)) == 1 for (a, b), (c, d) in zip(route, route[1:]))
+                assert math.isclose(lengths[i][j], expected)
+                assert math.isclose(sum(math.dist(a, b) for a, b in zip(route, route[1:])), expected, rel_tol=1e-4)
+    assert table.route((0, 0), cells[0]) is None or (0, 0) in cells
+
+
+def test_route_table_only_answers_cell_path_engines(tmp_path):
+    import main
+
+    grid = [[0] * 12 for _ in range(10)]
+    config = {'rows': 10, 'cols': 12, 'lat_min': 47.0, 'lat_max': 47.1, 'lng_min': -117.2, 'lng_max': -117.0,
+              'grid': grid}
+    map_version = MapVersion(config, 'test')
+    cells = [(1, 1), (8, 10)]
+    path = tmp_path / 'grid_config.routes.bin'
+    path.write_bytes(build_route_table(map_version, ['A_01', 'B_01'], cells, (0,)))
+    map_version.route_table = load_route_table(str(path))
+
+    assert main.table_route(map_version, 'astar', *cells)['cells'][-1] == cells[1]
+    assert main.table_route(map_version, 'theta', *cells) is None
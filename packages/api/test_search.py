@@ -0,0 +1,262 @@
+import math
+import random
+
+import numpy as np
+
+from routing_engine.components import ComponentIndex
+from routing_engine.distance_transform import obstacle_distance
+from routing_engine.hpa import HierarchicalSearch
+from routing_engine.jps import JumpPointSearch
+from routing_engine.landmarks import LandmarkSearch
+from routing_engine.matrix import DistanceMatrix
+from routing_engine.reference import a_star
+from routing_engine.search import UNREACHED, GridSearch
+from routing_engine.theta import ThetaStarSearch
+
+from src.batch import BatchRouter, SharedGrid, _engines_for, _worker_state
+from src.map_version import SERVED_PADDINGS, MapVersion
+
+
+def path_length(path):
+    return sum(math.dist(path[i], path[i + 1]) for i in range(len(path) - 1))
+
+
+def random_grid(rng, rows=40, cols=50, density=0.25):
+    return [[1 if rng.random() < density else 0 for _ in range(cols)] for _ in range(rows)]
+
+
+def random_free_cell(rng, distance, padding):
+    rows, cols = distance.shape
+    while True:
+        row, col = rng.randrange(rows), rng.randrange(cols)
+        if distance[row, col] > padding:
+            return row, col
+
+
+def test_grid_search_matches_reference_a_star():
+    rng = random.Random(7)
+    for _ in range(20):
+        grid = random_grid(rng)
+        distance = obstacle_distance(grid)
+        engine = GridSearch(distance)
+        for padding in (0, 1):
+            if not np.any(distance > padding):
+                continue
+            start = random_free_cell(rng, distance, padding)
+            goal = random_free_cell(rng, distance, padding)
+
+            expected = a_star(grid, start, goal, custom_padding=padding, distance=distance.tolist())
+            result = engine.search(start, goal, padding)
+
+            assert bool(result.path) == bool(expected)
+            if expected:
+                assert result.path[0] == start and result.path[-1] == goal
+                assert math.isclose(path_length(result.path), path_length(expected), rel_tol=1e-4)
+                assert math.isclose(result.cost, path_length(result.path), rel_tol=1e-4)
+                assert all(distance[row, col] > padding for row, col in result.path)
+
+
+def test_grid_search_rejects_blocked_endpoints():
+    grid = [[0, 0, 0], [0, 1, 0], [0, 0, 0]]
+    engine = GridSearch(obstacle_distance(grid))
+    assert engine.search((0, 0), (1, 1)).path == []
+    assert engine.search((0, 0), (2, 2), padding=1).path == []
+    assert len(engine.search((0, 0), (2, 2)).path) == 4
+
+
+def test_jump_point_search_matches_grid_search():
+    rng = random.Random(11)
+    for _ in range(40):
+        grid = random_grid(rng, rows=rng.randint(5, 30), cols=rng.randint(5, 30),
+                           density=rng.choice([0.05, 0.2, 0.4]))
+        distance = obstacle_distance(grid)
+        engine = GridSearch(distance)
+        jps = JumpPointSearch(engine)
+        for padding in (0, 1):
+            if not np.any(distance > padding):
+                continue
+            start = random_free_cell(rng, distance, padding)
+            goal = random_free_cell(rng, distance, padding)
+
+            expected = engine.search(start, goal, padding)
+            result = jps.search(start, goal, padding)
+
+            assert bool(result.path) == bool(expected.path)
+            if expected.path:
+                assert result.cost == expected.cost
+                assert result.path[0] == start and result.path[-1] == goal
+                assert math.isclose(path_length(result.path), result.cost, rel_tol=1e-4)
+                assert all(distance[row, col] > padding for row, col in result.path)
+
+
+def test_hierarchical_search_finds_valid_near_shortest_paths():
+    rng = random.Random(13)
+    for _ in range(30):
+        grid = random_grid(rng, rows=rng.randint(10, 40), cols=rng.randint(10, 40),
+                           density=rng.choice([0.05, 0.2, 0.35]))
+        distance = obstacle_distance(grid)
+        engine = GridSearch(distance)
+        hierarchy = HierarchicalSearch(engine, cluster_size=rng.choice([4, 8]))
+        for padding in (0, 1):
+            if not np.any(distance > padding):
+                continue
+            start = random_free_cell(rng, distance, padding)
+            goal = random_free_cell(rng, distance, padding)
+
+            expected = engine.search(start, goal, padding)
+            result = hierarchy.search(start, goal, padding)
+
+            assert bool(result.path) == bool(expected.path)
+            if expected.path:
+                assert result.path[0] == start and result.path[-1] == goal
+                assert result.cost >= expected.cost
+                assert math.isclose(path_length(result.path), result.cost, rel_tol=1e-4)
+                assert all(max(abs(a - c), abs(b - d)) == 1
+                           for (a, b), (c, d) in zip(result.path, result.path[1:]))
+                assert all(distance[row, col] > padding for row, col in result.path)
+
+
+def test_hierarchical_routes_are_marked_approximate():
+    import main
+
+    config = {'rows': 20, 'cols': 20, 'lat_min': 47.0, 'lat_max': 47.1, 'lng_min': -117.2, 'lng_max': -117.0,
+              'grid': [[0] * 20 for _ in range(20)]}
+    map_version = MapVersion(config, 'test')
+    assert main.find_route(map_version, 'hpa', (3, 3), (16, 16))['approximate']
+    assert 'approximate' not in main.find_route(map_version, 'astar', (3, 3), (16, 16))
+
+
+def test_landmark_search_matches_grid_search():
+    rng = random.Random(17)
+    for _ in range(30):
+        grid = random_grid(rng, rows=rng.randint(5, 40), cols=rng.randint(5, 40),
+                           density=rng.choice([0.05, 0.2, 0.35]))
+        distance = obstacle_distance(grid)
+        engine = GridSearch(distance)
+        alt = LandmarkSearch(engine, count=rng.choice([1, 4, 8]))
+        for padding in (0, 1):
+            if not np.any(distance > padding):
+                continue
+            for _ in range(5):
+                start = random_free_cell(rng, distance, padding)
+                goal = random_free_cell(rng, distance, padding)
+                expected = engine.search(start, goal, padding)
+                result = alt.search(start, goal, padding)
+                assert bool(result.path) == bool(expected.path)
+                if expected.path:
+                    assert math.isclose(result.cost, expected.cost)
+                    assert math.isclose(path_length(result.path), expected.cost, rel_tol=1e-4)
+
+
+def test_searches_hand_back_clean_buffers():
+    rng = random.Random(19)
+    grid = random_grid(rng, rows=100, cols=120, density=0.2)
+    distance = obstacle_distance(grid)
+    engine = GridSearch(distance)
+    hierarchy = HierarchicalSearch(engine, cluster_size=8)
+    engines = [engine, JumpPointSearch(engine), hierarchy, ThetaStarSearch(engine), LandmarkSearch(engine, count=4)]
+    costs = engine.cost_layer(np.ones(distance.shape))
+
+    def assert_clean():
+        g, _, closed = engine._buffers()
+        assert all(value == UNREACHED for value in g) and not any(closed)
+        engine._local.dirty = False
+
+    for _ in range(20):
+        start = random_free_cell(rng, distance, 0)
+        # Short searches reset only the cells they touched, long ones the whole buffers
+        near = (min(max(start[0] + rng.randint(-3, 3), 0), 99), min(max(start[1] + rng.randint(-3, 3), 0), 119))
+        for goal in (near, random_free_cell(rng, distance, 0)):
+            expected = GridSearch(distance).search(start, goal)
+            for searcher in engines:
+                searcher.search(start, goal)
+                assert_clean()
+            engine.search_mask(engine.blocked(0), start, goal, costs)
+            assert_clean()
+            assert all(hierarchy._local.corridor)
+
+            # A search that raised halfway leaves its writes behind for the next one to clear
+            engine._buffers()[0][engine.index(*goal)] = 0
+            assert engine.search(start, goal) == expected
+            assert_clean()
+
+
+def test_component_index_agrees_with_search():
+    rng = random.Random(5)
+    for _ in range(20):
+        grid = random_grid(rng, density=0.4)
+        distance = obstacle_distance(grid)
+        engine = GridSearch(distance)
+        components = ComponentIndex(engine, paddings=(0,))
+        for _ in range(10):
+            start = random_free_cell(rng, distance, 0)
+            goal = random_free_cell(rng, distance, 0)
+            assert components.connected(start, goal, 0) == bool(engine.search(start, goal).path)
+        assert components.first_connected_padding(start, goal, (1, 0)) in (None, 0, 1)
+
+
+def test_distance_matrix_matches_grid_search():
+    rng = random.Random(5)
+    grid = random_grid(rng, rows=30, cols=40, density=0.3)
+    distance = obstacle_distance(grid)
+    engine = GridSearch(distance)
+    components = ComponentIndex(engine, paddings=(1, 0))
+    cells = [random_free_cell(rng, distance, 0) for _ in range(8)]
+
+    lengths = DistanceMatrix(distance, components).lengths(cells, (1, 0))
+    for i, start in enumerate(cells):
+        for j, goal in enumerate(cells):
+            padding = components.first_connected_padding(start, goal, (1, 0))
+            expected = engine.search(start, goal, padding).cost if padding is not None else None
+            if expected is None:
+                assert lengths[i][j] is None if i != j else lengths[i][j] == 0
+            else:
+                assert math.isclose(lengths[i][j], expected)
+
+
+def test_batch_router_workers_match_inline_search():
+    rng = random.Random(3)
+    grid = random_grid(rng, rows=30, cols=30, density=0.15)
+    map_version = MapVersion({'rows': 30, 'cols': 30, 'grid': grid}, 'test')
+    jobs = [(random_free_cell(rng, map_version.obstacle_distance, 0),
+             random_free_cell(rng, map_version.obstacle_distance, 0), 0) for _ in range(6)]
+
+    router = BatchRouter(workers=2, inline_pairs=1)
+    try:
+        for engine_name in ('astar', 'jps', 'hpa', 'theta'):
+            engine = map_version.engines[engine_name]
+            expected = [engine.search(start, goal, p).path for start, goal, p in jobs]
+            assert router.search(map_version, engine_name, jobs) == expected
+    finally:
+        router.close()
+
+
+def test_batch_worker_engines_read_the_shared_block():
+    rng = random.Random(4)
+    grid = random_grid(rng, rows=30, cols=30, density=0.15)
+    map_version = MapVersion({'rows': 30, 'cols': 30, 'grid': grid}, 'test')
+    start = random_free_cell(rng, map_version.obstacle_distance, 0)
+    goal = random_free_cell(rng, map_version.obstacle_distance, 0)
+
+    shared = SharedGrid(map_version)
+    try:
+        # What a worker process builds for its first task on this block
+        engines = _engines_for(*shared.task_info())
+        block = np.frombuffer(_worker_state['memory'].buf, dtype=np.uint8)
+        engine, theta = engines['astar'], engines['theta']
+        tables = [engine.row_of, engine.col_of, engine.octile, theta.euclid]
+        for padding in SERVED_PADDINGS:
+            tables += [engine.blocked(padding), theta.blocked_sums(padding), *engines['jps'].tables(padding)]
+        for table in tables:
+            assert np.shares_memory(np.frombuffer(table, dtype=np.uint8), block)
+        assert np.shares_memory(engine._distance, block)
+
+        for name in ('astar', 'jps', 'theta'):
+            assert engines[name].search(start, goal, 0).path == map_version.engines[name].search(start, goal, 0).path
+        del engines, engine, theta, tables, table, block
+    finally:
+        memory = _worker_state.pop('memory', None)
+        _worker_state.clear()
+        if memory is not None:
+            memory.close()
+        shared.close()
@@ -0,0 +1,36 @@
+import json
+import os
+
+import pytest
+
+from routing_engine.jps import grid_checksum
+
+from src.grid_cache import GridCache
+from src.storage import LocalStorage
+
+
+def test_grid_cache_reads_from_local_storage(tmp_path):
+    storage = LocalStorage('maps', root=str(tmp_path / 'buckets'))
+    config = {'rows': 4, 'cols': 5, 'lat_min': 0, 'lat_max': 1, 'lng_min': 0, 'lng_max': 1, 'grid': [[0] * 5] * 4}
+    storage.write('grid_config.json', json.dumps(config))
+    entrances = [{'label': 'Hall_01', 'latitude': 0.5, 'longitude': 0.5}]
+    storage.write('grid_config.entrances.json',
+                  json.dumps({'grid_checksum': grid_checksum(config['grid']), 'entrances': entrances}))
+
+    cache = GridCache('maps', cache_dir=str(tmp_path / 'cache'), refresh_interval=0, storage=storage)
+    first = cache.get()
+    assert first.version == storage.generation('grid_config.json')
+    assert first.entrances == {'Hall_01': (0.5, 0.5)}
+    assert not cache.refresh()
+
+    config['grid'] = [[0, 1, 0, 0, 0]] * 4
+    storage.write('grid_config.json', json.dumps(config))
+    os.utime(storage.path('grid_config.json'), ns=(1, 1))  # A new generation even on coarse clocks
+    assert cache.refresh()
+    assert cache.get().grid[0][1] == 1
+    assert cache.get().entrances == {}  # Written for the previous grid
+
+    with pytest.raises(FileNotFoundError):
+        storage.read('grid_config.json', generation=first.version)
+    with pytest.raises(ValueError):
+        storage.path('../outside.json')
@@ -1,64 +1,52 @@
 import json
-import geopandas as gpd
-import math
+import os
+import numpy as np
+from grid_utils import campus_georeference
+from process_geojson import GeoJSONGridProcessor
+from routing_engine.distance_transform import obstacle_distance
+from routing_engine.map_bundle import bundle_from_config
 
 # Constants
 GRID_SQUARE_SIZE = 2 # meters (2x2 meters)
-
-def read_json_file(file_path):
-    with open(file_path, 'r') as file:
-        data = json.load(file)
-    return data
-
-def read_geojson_file(file_path):
-    data = gpd.read_file(file_path)
-    return data
-
-def lat_meters_to_degrees(meters):
-    return meters / 111320  # Approximate conversion for latitude
-
-def lon_meters_to_degrees(meters, latitude):
-    return meters / (111320 * math.cos(math.radians(latitude)))  # Adjust for longitude
+BUILDINGS_GEOJSON = 'campus1.geojson'  # the buildings the API and grid_canvas.py route over
+OUTPUT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def build_grid_config(buildings_geojson=BUILDINGS_GEOJSON, georeference=None):
+    """
+    Rasterize the buildings, entrances and hallways into a grid config for the API
+
+    Args:
+        buildings_geojson: GeoJSON file of building outlines, next to this script
+        georeference: GeoReference to rasterize with, the campus square's by default
+
+    Returns:
+        dict: Bounds, rows and cols of the georeference, the grid and, when their GeoJSON
+            files are present, the entrances and hallways layers that snap_to uses
+    """
+    # rows, columns and lat/lng bounds from the bounding box of the campus square,
+    # the same georeference the API maps requests with
+    georeference = georeference or campus_georeference(GRID_SQUARE_SIZE)
+    processor = GeoJSONGridProcessor(buildings_geojson, GRID_SQUARE_SIZE, georeference)
+
+    config = georeference.config()
+    config["grid"] = processor.generated_grid.tolist()
+    entrances = processor.process_entrances()
+    if entrances is not None:
+        config["entrances"] = entrances.tolist()
+    hallways = processor.process_hallways()
+    if hallways is not None:
+        config["hallways"] = hallways.tolist()
+    return config
 
 if __name__ == "__main__":
-    json_file_path = 'packages/data-processing/grid_storage.json'
-    geojson_file_path = 'packages/data-processing/campus_square.geojson'
+    new_json = build_grid_config()
 
-    # store the grid array in a variable
-    grid_json = read_json_file(json_file_path)
-    grid_array = grid_json['campus1.geojson']
-    
-    # store metrics about the geojson file in a variable
-    geojson_square = read_geojson_file(geojson_file_path)
-    # Extract the coordinates of the polygon
-    polygon = geojson_square.geometry.iloc[0]
-    coordinates = polygon.exterior.coords[:-1]
-
-    # Extract latitude and longitude values
-    lats = [coord[1] for coord in coordinates]
-    lngs = [coord[0] for coord in coordinates]
-
-    # Calculate the latitude and longitude range
-    grid_min_lat = min(lats)
-    grid_max_lat = max(lats)
-    grid_min_lng = min(lngs)
-    grid_max_lng = max(lngs)
-
-    # Compute number of rows and columns
-    grid_num_rows = int((grid_max_lat - grid_min_lat) / lat_meters_to_degrees(GRID_SQUARE_SIZE))
-    grid_num_cols = int((grid_max_lng - grid_min_lng) / lon_meters_to_degrees(GRID_SQUARE_SIZE, (grid_min_lat + grid_max_lat) / 2))
-    
-    # build new json object
-    new_json = {
-        "rows": grid_num_rows,
-        "cols": grid_num_cols,
-        "lat_min": grid_min_lat,
-        "lat_max": grid_max_lat,
-        "lng_min": grid_min_lng,
-        "lng_max": grid_max_lng,
-        "grid": grid_array,
-    }
-    
     # write new json object to file
-    with open('packages/data-processing/grid_config.json', 'w') as file:
+    with open(os.path.join(OUTPUT_DIR, 'grid_config.json'), 'w') as file:
         json.dump(new_json, file)
+
+    # and the same grid as a map bundle, with its distance transform so the API can mmap it without parsing
+    grid_array = np.asarray(new_json["grid"], dtype=np.uint8)
+    bundle = bundle_from_config(new_json, distance=obstacle_distance(grid_array))
+    with open(os.path.join(OUTPUT_DIR, 'grid_config.bundle'), 'wb') as file:
+        file.write(bundle)
@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+
+import numpy as np
+from pyproj import Transformer
+from scipy.spatial import Delaunay
+from shapely.geometry import Point, Polygon, shape
+from shapely.ops import unary_union
+from shapely.prepared import prep
+
+from routing_engine.georeference import GeoReference
+from routing_engine.jps import grid_checksum
+
+# UTM zone of the campus, where the mesh is triangulated in metres
+UTM_CRS = "epsg:32611"
+# Outline segments shorter than this (in metres) are not split any further
+MIN_SEGMENT_LENGTH = 1e-3
+
+class NavMeshBuilder:
+    """Triangulates the walkable space between building polygons into a navigation mesh.
+
+    The free space is the grid bounds minus the (optionally buffered) building
+    footprints, in UTM metres. Its outline is triangulated with a conforming
+    Delaunay triangulation: every outline segment missing from the
+    triangulation is split at its midpoint until all of them are triangle
+    edges. Triangles whose centroid lies in a building are then dropped.
+    """
+
+    def __init__(self, geojson_path, grid_config_path, clearance=0.0, tolerance=0.25):
+        """
+        Args:
+            geojson_path: GeoJSON file with the building polygons
+            grid_config_path: grid_config.json whose lat/lng bounds the mesh covers
+            clearance: Metres of padding kept free around every building
+            tolerance: Metres the outline may move when it is simplified
+        """
+        self.clearance = clearance
+        self.tolerance = tolerance
+        self.transformer = Transformer.from_crs("epsg:4326", UTM_CRS, always_xy=True)
+
+        with open(grid_config_path, "r", encoding="utf-8") as file:
+            config = json.load(file)
+        self.bounds = GeoReference.from_config(config).bounds
+        # Stored in the mesh so the API only serves it with the grid it was built for
+        self.grid_checksum = grid_checksum(config["grid"])
+
+        with open(geojson_path, "r", encoding="utf-8") as file:
+            self.geojson_data = json.load(file)
+
+    def latlon_to_utm(self, lat, lon):
+        return self.transformer.transform(lon, lat)
+
+    def free_space(self):
+        """Walkable area as a shapely geometry in UTM coordinates."""
+        lat_min, lat_max, lng_min, lng_max = self.bounds
+        corners = [self.latlon_to_utm(lat, lng) for lat, lng in
+                   ((lat_min, lng_min), (lat_min, lng_max), (lat_max, lng_max), (lat_max, lng_min))]
+        area = Polygon(corners)
+
+        buildings = []
+        for feature in self.geojson_data["features"]:
+            geom = shape(feature["geometry"])
+            polygons = geom.geoms if geom.geom_type == "MultiPolygon" else [geom] if geom.geom_type == "Polygon" else []
+            for poly in polygons:
+                buildings.append(Polygon([self.latlon_to_utm(lat, lon) for lon, lat in poly.exterior.coords]))
+
+        obstacles = unary_union(buildings)
+        if self.clearance > 0:
+            obstacles = obstacles.buffer(self.clearance)
+        return area.difference(obstacles).simplify(self.tolerance, preserve_topology=True)
+
+    def triangulate(self, free, max_rounds=50):
+        """Conforming Delaunay triangulation of a free-space geometry.
+
+        Returns:
+            tuple: (vertices, triangles, neighbors) as numpy arrays, with
+                neighbors[t][k] the triangle across from vertex k of t, or -1 at a wall
+        """
+        polygons = free.geoms if free.geom_type == "MultiPolygon" else [free]
+        point_ids = {}
+        segments = []
+
+        def point_id(point):
+            if point not in point_ids:
+                point_ids[point] = len(point_ids)
+            return point_ids[point]
+
+        for polygon in polygons:
+            for ring in [polygon.exterior] + list(polygon.interiors):
+                coords = [tuple(coord) for coord in ring.coords[:-1]]
+                for a, b in zip(coords, coords[1:] + coords[:1]):
+                    segments.append((point_id(a), point_id(b)))
+
+        segments = [segment for segment in segments if segment[0] != segment[1]]
+        for _ in range(max_rounds):
+            points = np.array(list(point_ids), dtype=np.float64)
+            # Qhull loses precision on raw UTM coordinates, so triangulate relative to a corner
+            triangulation = Delaunay(points - points.min(axis=0))
+            edges = set()
+            for a, b, c in triangulation.simplices.tolist():
+                edges.update(((a, b), (b, a), (b, c), (c, b), (c, a), (a, c)))
+
+            missing = [segment for segment in segments if segment not in edges]
+            if not missing:
+                break
+            for segment in missing:
+                segments.remove(segment)
+                a, b = segment
+                if np.hypot(*(points[b] - points[a])) < MIN_SEGMENT_LENGTH:
+                    continue  # Too short to matter; the triangles around it decide
+                # A vertex on the segment keeps it from ever being an edge, so split there
+                middle = self._vertex_on_segment(points, a, b)
+                if middle is None:
+                    middle = point_id(tuple((points[a] + points[b]) / 2))
+                segments.extend(((a, middle), (middle, b)))
+        else:
+            print(f"Warning: {len(missing)} outline segments still missing after {max_rounds} rounds")
+
+        prepared = prep(free)
+        centroids = points[triangulation.simplices].mean(axis=1)
+        keep = np.array([prepared.contains(Point(x, y)) for x, y in centroids])
+
+        new_index = np.full(len(keep), -1)
+        new_index[keep] = np.arange(int(keep.sum()))
+        neighbors = triangulation.neighbors[keep]
+        neighbors = np.where(neighbors >= 0, new_index[neighbors], -1)
+        return points, triangulation.simplices[keep], neighbors
+
+    @staticmethod
+    def _vertex_on_segment(points, a, b):
+        """Index of a point lying on the open segment a-b, or None."""
+        direction = points[b] - points[a]
+        length = np.hypot(*direction)
+        offsets = points - points[a]
+        along = offsets @ direction / length
+        across = np.abs(offsets[:, 0] * direction[1] - offsets[:, 1] * direction[0]) / length
+        on_segment = np.flatnonzero((across < MIN_SEGMENT_LENGTH) & (along > MIN_SEGMENT_LENGTH)
+                                    & (along < length - MIN_SEGMENT_LENGTH))
+        if not len(on_segment):
+            return None
+        return int(on_segment[np.argmin(np.abs(along[on_segment] - length / 2))])
+
+    def affine_maps(self, samples=5):
+        """Least-squares affine maps between (lng, lat) and UTM over the bounds.
+
+        Over a campus the projection is affine to well under a centimetre, so
+        the API can convert coordinates without pyproj.
+
+        Returns:
+            tuple: (to_utm, to_lat_lng), each a 2x3 matrix applied to (u, v, 1)
+        """
+        lat_min, lat_max, lng_min, lng_max = self.bounds
+        lats, lngs = np.meshgrid(np.linspace(lat_min, lat_max, samples), np.linspace(lng_min, lng_max, samples))
+        lng_lat = np.column_stack([lngs.ravel(), lats.ravel()])
+        utm = np.array([self.latlon_to_utm(lat, lng) for lng, lat in lng_lat])
+
+        ones = np.ones((len(utm), 1))
+        to_utm = np.linalg.lstsq(np.hstack([lng_lat, ones]), utm, rcond=None)[0].T
+        to_lat_lng = np.linalg.lstsq(np.hstack([utm, ones]), lng_lat, rcond=None)[0].T
+        return to_utm, to_lat_lng
+
+    def build(self, output_path):
+        free = self.free_space()
+        vertices, triangles, neighbors = self.triangulate(free)
+        to_utm, to_lat_lng = self.affine_maps()
+        np.savez_compressed(output_path, vertices=vertices, triangles=triangles.astype(np.int32),
+                            neighbors=neighbors.astype(np.int32), to_utm=to_utm, to_lat_lng=to_lat_lng,
+                            clearance=np.array(self.clearance),
+                            grid_checksum=np.array(self.grid_checksum, dtype=np.uint32))
+        print(f"Navigation mesh: {len(vertices)} vertices, {len(triangles)} triangles")
+        print(f"Saved to {output_path}")
+
+
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Build a navigation mesh from the campus building polygons.")
+    parser.add_argument("--geojson", default=os.path.join(script_dir, "campus_detailed_2.24.geojson"),
+                        help="GeoJSON file with the building polygons")
+    parser.add_argument("--grid-config", default=os.path.join(script_dir, "grid_config.json"),
+                        help="grid_config.json whose bounds the mesh covers")
+    parser.add_argument("--clearance", type=float, default=0.0,
+                        help="Metres kept free around buildings (the API's default padding of 2 cells is 4 m)")
+    parser.add_argument("--output", default=os.path.join(script_dir, "grid_config.navmesh.npz"),
+                        help="Output path; upload it next to grid_config.json for the API to load")
+    args = parser.parse_args()
+
+    NavMeshBuilder(args.geojson, args.grid_config, args.clearance).build(args.output)
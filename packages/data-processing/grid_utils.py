@@ -1,6 +1,30 @@
+import json
+import os
 import numpy as np
 from shapely.geometry import Point, LineString, shape
 from typing import List, Tuple, Dict, Any
+from routing_engine.georeference import GeoReference
+
+# Polygon whose bounding box is the extent of the campus grid
+CAMPUS_BOUNDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "campus_square.geojson")
+
+
+def campus_georeference(cell_meters: float = 2.0, bounds_file: str = CAMPUS_BOUNDS_FILE) -> GeoReference:
+    """
+    Georeference of the campus grid, shared by the grid builders and the API
+
+    Args:
+        cell_meters: Target edge length of a cell in metres
+        bounds_file: GeoJSON file whose features' bounding box the grid covers
+
+    Returns:
+        GeoReference: Rows, columns and lat/lng bounds of the grid
+    """
+    with open(bounds_file, "r", encoding="utf-8") as file:
+        features = json.load(file)["features"]
+    lng_min, lat_min, lng_max, lat_max = np.array([shape(feature["geometry"]).bounds for feature in features]).T
+    return GeoReference.from_bounds((lat_min.min(), lat_max.max(), lng_min.min(), lng_max.max()), cell_meters)
+
 
 class GridUtils:
     def __init__(self, grid_size: float, base_grid: np.ndarray):
@@ -6,37 +6,23 @@ from shapely.geometry import LineString, Point
 from shapely.ops import unary_union
 from rasterio.features import rasterize
 from affine import Affine
-from pyproj import Transformer
-from grid_utils import GridUtils
+from grid_utils import GridUtils, campus_georeference
 
 class GeoJSONGridProcessor:
-    def __init__(self, geojson_filename="campus_detailed_2.24.geojson", cell_size=2):
+    def __init__(self, geojson_filename="campus_detailed_2.24.geojson", cell_size=2, georeference=None):
         script_dir = os.path.dirname(os.path.abspath(__file__))
         self.geojson_path = os.path.join(script_dir, geojson_filename)
         self.cell_size = cell_size
         self.geojson_filename = geojson_filename  
         self.load_geojson()
 
-        # Convert lat/lon to UTM for accurate grid mapping
-        self.transformer = Transformer.from_crs("epsg:4326", "epsg:32611", always_xy=True)
-        # Expand the bounding box slightly to ensure we capture all features
-        self.ZERO_POINT = self.latlon_to_utm(47.6615, -117.4100)  # Slightly SW
-        self.END_POINT = self.latlon_to_utm(47.6710, -117.3962)   # Slightly NE
-        
-        # Calculate grid dimensions
-        utm_width = self.END_POINT[0] - self.ZERO_POINT[0]
-        utm_height = self.END_POINT[1] - self.ZERO_POINT[1]
-        
-        # Ensure cell_size is in UTM units (meters)
-        self.utm_cell_size = 2.0  # 2 meters per cell
-        
-        self.GRID_SIZE = (
-            int(utm_height / self.utm_cell_size),
-            int(utm_width / self.utm_cell_size)
-        )
+        # Lay out cells with the same GeoReference the API maps requests with (built from the
+        # bounds build_config.py writes), so a cell here is the same patch of ground online
+        self.georeference = georeference or campus_georeference(cell_size)
+        self.GRID_SIZE = self.georeference.shape
         
         print(f"Grid dimensions: {self.GRID_SIZE}")
-        print(f"UTM bounds: ({self.ZERO_POINT}, {self.END_POINT})")
+        print(f"Lat/lng bounds: {self.georeference.bounds}")
         
         self.generated_grid = self.generate_grid()
         if self.generated_grid is not None and np.any(self.generated_grid == 1):
@@ -44,21 +30,6 @@ class GeoJSONGridProcessor:
         else:
             print("Error: Grid generation failed or contains no obstacles, not saving.")
 
-    def latlon_to_utm(self, lat, lon):
-        return self.transformer.transform(lon, lat)
-
-    def utm_to_grid_coords(self, x, y):
-        """Convert UTM coordinates to grid coordinates"""
-        # Calculate relative position in UTM space
-        rel_x = x - self.ZERO_POINT[0]
-        rel_y = self.END_POINT[1] - y  # Flip Y axis
-        
-        # Convert to grid coordinates
-        col = int(rel_x / self.utm_cell_size)
-        row = int(rel_y / self.utm_cell_size)
-        
-        return row, col
-
     def load_geojson(self):
         try:
             with open(self.geojson_path, "r", encoding="utf-8") as file:
@@ -85,21 +56,15 @@ class GeoJSONGridProcessor:
             print("Warning: No valid obstacle polygons found in GeoJSON.")
             return np.zeros(self.GRID_SIZE, dtype=int)
 
-        print("Extracted obstacle polygons (converted to UTM):")
-        transformed_polygons = []
+        print("Extracted obstacle polygons:")
         for poly in obstacle_polygons:
-            transformed_poly = Polygon([self.latlon_to_utm(lat, lon) for lon, lat in poly.exterior.coords])
-            transformed_polygons.append(transformed_poly)
-            print(f" - Bounding Box: {transformed_poly.bounds}")
-
-        x_res = (self.END_POINT[0] - self.ZERO_POINT[0]) / self.GRID_SIZE[1]
-        y_res = (self.END_POINT[1] - self.ZERO_POINT[1]) / self.GRID_SIZE[0]
-        transform = Affine.translation(self.ZERO_POINT[0], self.END_POINT[1]) * Affine.scale(x_res, -y_res)
+            print(f" - Bounding Box: {poly.bounds}")
 
+        # Polygons stay in lng/lat; the affine transform maps them onto the grid's cells
         grid = rasterize(
-            [(poly, 1) for poly in transformed_polygons],
+            [(poly, 1) for poly in obstacle_polygons],
             out_shape=self.GRID_SIZE,
-            transform=transform,
+            transform=Affine(*self.georeference.affine),
             fill=0,
             all_touched=True 
         )
@@ -138,31 +103,26 @@ class GeoJSONGridProcessor:
             return
 
         # Initialize grid utils
-        grid_utils = GridUtils(self.utm_cell_size, self.generated_grid)
+        grid_utils = GridUtils(self.cell_size, self.generated_grid)
         entrance_points = []
 
-        for feature in entrances_data["features"]:
-            geom = shape(feature["geometry"])
-            if geom.geom_type == "Point":
-                # Convert to UTM
-                utm_x, utm_y = self.latlon_to_utm(geom.y, geom.x)
-                
-                # Convert to grid coordinates
-                grid_row, grid_col = self.utm_to_grid_coords(utm_x, utm_y)
-                
-                # Ensure coordinates are within grid bounds
-                if (0 <= grid_row < self.GRID_SIZE[0] and 
-                    0 <= grid_col < self.GRID_SIZE[1]):
-                    # Check if this point is on a building edge
-                    if grid_utils.is_on_building_edge(grid_row, grid_col):
-                        # Add a 3x3 grid of entrance points for better traversability
-                        for dr in [-1, 0, 1]:
-                            for dc in [-1, 0, 1]:
-                                new_row, new_col = grid_row + dr, grid_col + dc
-                                if (0 <= new_row < self.GRID_SIZE[0] and 
-                                    0 <= new_col < self.GRID_SIZE[1] and
-                                    not (dr == 0 and dc == 0 and self.generated_grid[new_row, new_col] == 1)):  # Don't overwrite center building tile
-                                    entrance_points.append((new_row, new_col))
+        # Convert every entrance to grid coordinates at once
+        points = [(geom.y, geom.x) for geom in (shape(feature["geometry"]) for feature in entrances_data["features"])
+                  if geom.geom_type == "Point"]
+        cells = self.georeference.lat_lng_to_cells(points)
+
+        # Only entrances within grid bounds
+        for grid_row, grid_col in cells[self.georeference.contains(cells)].tolist():
+            # Check if this point is on a building edge
+            if grid_utils.is_on_building_edge(grid_row, grid_col):
+                # Add a 3x3 grid of entrance points for better traversability
+                for dr in [-1, 0, 1]:
+                    for dc in [-1, 0, 1]:
+                        new_row, new_col = grid_row + dr, grid_col + dc
+                        if (0 <= new_row < self.GRID_SIZE[0] and 
+                            0 <= new_col < self.GRID_SIZE[1] and
+                            not (dr == 0 and dc == 0 and self.generated_grid[new_row, new_col] == 1)):  # Don't overwrite center building tile
+                            entrance_points.append((new_row, new_col))
 
         # Create entrance grid
         entrance_grid = np.zeros_like(self.generated_grid)
@@ -184,24 +144,17 @@ class GeoJSONGridProcessor:
             return
 
         # Initialize grid utils and get entrance points
-        grid_utils = GridUtils(self.utm_cell_size, self.generated_grid)
+        grid_utils = GridUtils(self.cell_size, self.generated_grid)
         entrance_grid = self.process_entrances()  # Get entrance points first
         hallway_points = []
 
         for feature in hallways_data["features"]:
             geom = shape(feature["geometry"])
             if geom.geom_type == "LineString":
-                # Convert all coordinates to UTM
-                utm_coords = [
-                    self.latlon_to_utm(lat, lon) 
-                    for lon, lat in geom.coords
-                ]
-                
-                # Convert to grid coordinates
-                grid_coords = [
-                    self.utm_to_grid_coords(x, y)
-                    for x, y in utm_coords
-                ]
+                # Convert all coordinates to grid coordinates at once
+                grid_coords = self.georeference.lat_lng_to_cells(
+                    [(lat, lon) for lon, lat in geom.coords]
+                ).tolist()
                 
                 # Process each segment of the hallway
                 for i in range(len(grid_coords) - 1):
@@ -237,7 +190,7 @@ class GeoJSONGridProcessor:
         return hallway_grid
 
     def check_entrance_intersections(self, hallway_union):
-            """ Checks how many entrances exist and how many intersect with hallways. """
+            """ Checks how many entrances exist and how many intersect with hallways (given in lon/lat). """
             entrance_path = os.path.join(os.path.dirname(__file__), "entrances.geojson")
             try:
                 with open(entrance_path, "r", encoding="utf-8") as file:
@@ -251,9 +204,7 @@ class GeoJSONGridProcessor:
             for feature in entrance_data["features"]:
                 geom = shape(feature["geometry"])
                 if geom.geom_type == "Point":
-                    # Convert entrance lat/lon to UTM for correct intersection checking
-                    utm_x, utm_y = self.latlon_to_utm(geom.y, geom.x)
-                    entrance_points.append(Point(utm_x, utm_y))
+                    entrance_points.append(Point(geom.x, geom.y))
 
             total_entrances = len(entrance_points)
             entrances_touching_hallways = sum(1 for pt in entrance_points if hallway_union.intersects(pt))
@@ -261,12 +212,8 @@ class GeoJSONGridProcessor:
             print(f"Total entrances: {total_entrances}")
             print(f"Entrances connected to hallways: {entrances_touching_hallways}")
 
-geojson_processor = GeoJSONGridProcessor()
-geojson_processor.process_entrances()
-geojson_processor.process_hallways()
-
-def get_grid():
-    return geojson_processor.generated_grid
+if __name__ == "__main__":
+    geojson_processor = GeoJSONGridProcessor()
+    geojson_processor.process_entrances()
+    geojson_processor.process_hallways()
 
-def get_grid_size():
-    return geojson_processor.GRID_SIZE
@@ -0,0 +1,34 @@
+import json
+import os
+
+import numpy as np
+from shapely.geometry import shape
+
+from build_config import build_grid_config
+from grid_utils import campus_georeference
+from routing_engine.map_bundle import bundle_from_config, read_bundle
+from routing_engine.snapping import SnapIndex
+
+
+def test_built_config_snaps_to_entrances():
+    config = build_grid_config()
+    # Read back the way the API loads a bundle, with the layers under the JSON's keys
+    loaded = read_bundle(bundle_from_config(config)).config()
+    grid, entrances = np.asarray(loaded["grid"]), np.asarray(loaded["entrances"])
+    assert entrances.shape == grid.shape and np.asarray(loaded["hallways"]).shape == grid.shape
+
+    # Targets as MapVersion builds them for snap_to=entrance: walkable entrance cells
+    targets = (grid == 0) & (entrances == 1)
+    snap_index = SnapIndex(targets)
+
+    # A request at a surveyed entrance snaps onto the entrance cells around it
+    with open(os.path.join(os.path.dirname(__file__), "entrances.geojson"), "r", encoding="utf-8") as file:
+        points = [shape(feature["geometry"]) for feature in json.load(file)["features"]]
+    georeference = campus_georeference()
+    cells = georeference.lat_lng_to_cells([(point.y, point.x) for point in points])
+    distances = []
+    for row, col in cells[georeference.contains(cells)].tolist():
+        snapped = snap_index.nearest(row, col)
+        assert targets[snapped]
+        distances.append(np.hypot(snapped[0] - row, snapped[1] - col))
+    assert min(distances) <= 1
@@ -1,124 +1,104 @@
-import heapq
-import math
-from path_smoothing import get_smooth_path_points
+"""
+Graduated-padding routes for the desktop tools, on top of the shared routing engine
+"""
+import numpy as np
+
+from routing_engine import (GridSearch, ThetaStarSearch, get_smooth_path_points, obstacle_distance, padding_costs,
+                            path_length, path_points, walking_minutes)
 
 # Global padding variable
 # This creates a small buffer around all obstacles to allow for smoother pathfinding
 padding = 2  # Reduced padding to allow closer approach to buildings
 
-def euclidean_distance(a, b):
-    """Calculate Euclidean distance between two points."""
-    return math.sqrt((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2)
-
-def apply_padding(grid, padding_value):
-    """Create a new grid with padding around obstacles."""
-    if padding_value <= 0:
-        return grid
-
-    rows, cols = len(grid), len(grid[0])
-    padded_grid = [[0 for _ in range(cols)] for _ in range(rows)]
-    
-    # First copy the original obstacles
-    for i in range(rows):
-        for j in range(cols):
-            if grid[i][j] == 1:
-                padded_grid[i][j] = 1
-    
-    # Then add padding around obstacles, but with decreasing values
-    for i in range(rows):
-        for j in range(cols):
-            if grid[i][j] == 1:
-                # Mark cells within padding_value distance with decreasing values
-                for di in range(-padding_value, padding_value + 1):
-                    for dj in range(-padding_value, padding_value + 1):
-                        ni, nj = i + di, j + dj
-                        if 0 <= ni < rows and 0 <= nj < cols:
-                            # Calculate distance from obstacle
-                            dist = max(abs(di), abs(dj))
-                            # Convert distance to a value between 0 and 1
-                            # Closer to obstacle = higher value
-                            if padded_grid[ni][nj] != 1:  # Don't override actual obstacles
-                                padded_grid[ni][nj] = (padding_value - dist + 1) / (padding_value + 1)
-    
-    return padded_grid
-
-def get_neighbors(current, grid):
-    """Get valid neighboring cells."""
-    rows, cols = len(grid), len(grid[0])
-    row, col = current
-    
-    # Include diagonal movements
-    directions = [
-        (-1, -1), (-1, 0), (-1, 1),
-        (0, -1),           (0, 1),
-        (1, -1),  (1, 0),  (1, 1)
-    ]
-    
-    neighbors = []
-    for dr, dc in directions:
-        r, c = row + dr, col + dc
-        if (0 <= r < rows and 0 <= c < cols and grid[r][c] != 1):
-            # Add neighbor with its padding value as additional cost
-            neighbors.append((r, c))
-    
-    return neighbors
-
-def a_star(grid, start, end, custom_padding=None):
-    """Performs A* pathfinding algorithm with cost influenced by padding."""
-    if not grid or not (0 <= start[0] < len(grid)) or not (0 <= start[1] < len(grid[0])) or \
-       not (0 <= end[0] < len(grid)) or not (0 <= end[1] < len(grid[0])):
-        return None
-
-    # Check if start or end is in padded area but not an actual obstacle
-    if grid[start[0]][start[1]] == 1 or grid[end[0]][end[1]] == 1:
-        return None
-
-    rows, cols = len(grid), len(grid[0])
-    closed_set = set()
-    open_set = [(0, start)]
-    heapq.heapify(open_set)
-    came_from = {}
-    g_score = {start: 0}
-    f_score = {start: euclidean_distance(start, end)}
-    
-    while open_set:
-        current_f, current = heapq.heappop(open_set)
-        
-        if current == end:
-            path = []
-            while current in came_from:
-                path.append(current)
-                current = came_from[current]
-            path.append(start)
-            path.reverse()
-            
-            # smooth the path using spline logic
-            smoothed_path = get_smooth_path_points(path, cell_size=2, smoothing_factor=0.5)
-            return smoothed_path
-            
-        closed_set.add(current)
-        
-        for neighbor in get_neighbors(current, grid):
-            if neighbor in closed_set:
-                continue
-                
-            # Calculate cost including padding penalty
-            padding_cost = grid[neighbor[0]][neighbor[1]] if isinstance(grid[neighbor[0]][neighbor[1]], float) else 0
-            tentative_g = g_score[current] + euclidean_distance(current, neighbor) + padding_cost * 2
-            
-            if neighbor not in g_score or tentative_g < g_score[neighbor]:
-                came_from[neighbor] = current
-                g_score[neighbor] = tentative_g
-                f_score[neighbor] = g_score[neighbor] + euclidean_distance(neighbor, end)
-                heapq.heappush(open_set, (f_score[neighbor], neighbor))
-    
-    return []  # No path found
+# Extra cost, in cells, of a step into a cell next to an obstacle; it falls off across the padding
+PADDING_WEIGHT = 2
+
+
+class PaddedRouter:
+    """Routes around obstacles, preferring to keep a padding's distance from them.
+
+    Unlike the API, which blocks the padding outright, cells inside the padding
+    stay walkable at a cost that grows towards the obstacle. The engine, masks
+    and cost layer are built once, so each route is a single search.
+
+    Routes are either every cell of the path, or (with any_angle) only its
+    waypoints from Lazy Theta*, joined by straight segments that never cross
+    an obstacle and already look smooth without a spline.
+    """
+
+    def __init__(self, grid, custom_padding=None, open_cells=None):
+        """
+        Args:
+            grid: 2D list or array where 1 marks an obstacle
+            custom_padding (int): Padding radius in cells, defaults to padding
+            open_cells (np.ndarray): Optional boolean mask of cells that are walkable at no cost,
+                even inside obstacles (e.g. hallways and entrances)
+        """
+        pad_value = custom_padding if custom_padding is not None else padding
+        distance = obstacle_distance(grid)
+        costs = padding_costs(distance, pad_value)
+        self.engine = GridSearch(distance)
+        self.theta = ThetaStarSearch(self.engine)
+
+        blocked = np.frombuffer(self.engine.blocked(0), dtype=np.uint8).reshape(self.engine.rows + 2, -1).copy()
+        if open_cells is not None:
+            blocked[1:-1, 1:-1][open_cells] = 0
+            costs[open_cells] = 0
+        self.blocked = bytearray(blocked.tobytes())
+        # Cells a route may not enter, which smoothed routes are checked against
+        self.obstacles = blocked[1:-1, 1:-1] != 0
+        self.costs = self.engine.cost_layer(costs, PADDING_WEIGHT)
+
+    def route(self, start, end, any_angle=False):
+        """Cells of the cheapest path from start to end.
+
+        Args:
+            start (tuple): (row, col) of the start cell
+            end (tuple): (row, col) of the end cell
+            any_angle (bool): Return only the waypoints of an any-angle path
+
+        Returns:
+            list: (row, col) cells, empty if there is no path; None if an endpoint is off the grid or blocked
+        """
+        rows, cols = self.engine.rows, self.engine.cols
+        if not (0 <= start[0] < rows and 0 <= start[1] < cols and 0 <= end[0] < rows and 0 <= end[1] < cols):
+            return None
+        if self.blocked[self.engine.index(*start)] or self.blocked[self.engine.index(*end)]:
+            return None
+        engine = self.theta if any_angle else self.engine
+        return engine.search_mask(self.blocked, start, end, self.costs).path
+
+
+def a_star(grid, start, end, custom_padding=None, any_angle=False, smooth=None):
+    """Find a route with graduated padding and return it as (x, y) points for display.
+
+    Builds a PaddedRouter per call; keep one around when routing repeatedly on the same grid.
+
+    Args:
+        any_angle (bool): Route with Lazy Theta* and return only its waypoints, instead of
+            every cell of the 8-connected path
+        smooth (bool): Round the corners that can be rounded without crossing a building,
+            with one point per cell of length. Defaults to smoothing cell paths only
+
+    Returns:
+        list: (x, y) points, empty if there is no path, None if an endpoint is invalid
+    """
+    router = PaddedRouter(grid, custom_padding)
+    path = router.route(start, end, any_angle=any_angle)
+    if not path:
+        return path
+    if smooth is None:
+        smooth = not any_angle
+    if smooth:
+        return get_smooth_path_points(path, cell_size=2, blocked=router.obstacles)
+    return path_points(path, cell_size=2)
+
 
 def calculate_path_time(path, walking_speed=1.4, grid_cell_size=2.0):
     """
     Calculate estimated travel time for a given path.
     Args:
-        path: List of coordinates from A* algorithm
+        path: List of (row, col) cells or waypoints of a route
         walking_speed: Speed in meters per second (default 1.4 m/s ≈ 5 km/h)
         grid_cell_size: Size of each grid cell in meters (default 2.0)
     Returns:
@@ -126,10 +106,4 @@ def calculate_path_time(path, walking_speed=1.4, grid_cell_size=2.0):
     """
     if not path:
         return 0
-        
-    total_distance = 0
-    for i in range(len(path) - 1):
-        total_distance += euclidean_distance(path[i], path[i+1]) * grid_cell_size
-        
-    # Convert seconds to minutes and round to 1 decimal place
-    return round((total_distance / walking_speed) / 60, 1)
+    return walking_minutes(path_length(path), grid_cell_size, walking_speed)
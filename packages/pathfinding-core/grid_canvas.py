@@ -1,10 +1,16 @@
 import tkinter as tk
 import json
-from a_star import a_star, apply_padding
+import numpy as np
+from scipy import ndimage
+from a_star import PaddedRouter
+from routing_engine import get_smooth_path_points, path_points
 
 # Constants
 SQUARE_SIZE = 2
-PATH_SMOOTHING = 0.5  # Adjustable smoothing factor (0 to 1)
+ANY_ANGLE_PATHS = False  # Route with Lazy Theta* and draw only its waypoints, instead of every cell
+SMOOTH_PATHS = not ANY_ANGLE_PATHS  # Round the corners of the route; any-angle waypoints look smooth without it
+SMOOTHING_METHOD = 'chaikin'  # 'chaikin' (corner cutting) or 'spline'
+PATH_SMOOTHING = 0.5  # Adjustable spline smoothing factor (0 to 1)
 
 # Color scheme for different layers
 LAYER_COLORS = {
@@ -32,6 +38,7 @@ class GridApp:
         self.cell_size = SQUARE_SIZE
         self.start = None
         self.end = None
+        self.router = None
         
         # Get grid dimensions from campus1.geojson
         self.base_grid = grid_data["campus1.geojson"]
@@ -151,51 +158,37 @@ class GridApp:
             ex, ey = self.end[1] * self.cell_size, self.end[0] * self.cell_size
             self.canvas.create_rectangle(ex, ey, ex + self.cell_size, ey + self.cell_size, fill="magenta", outline="black")
 
-    def get_pathfinding_grid(self):
-        """Creates a grid suitable for pathfinding where 1 is non-traversable and 0 is traversable"""
-        grid_height = len(self.base_grid)
-        grid_width = len(self.base_grid[0])
-        pathfinding_grid = [[0 for _ in range(grid_width)] for _ in range(grid_height)]
-        
-        # First, mark buildings
-        for i in range(grid_height):
-            for j in range(grid_width):
-                if self.base_grid[i][j] == 1:
-                    pathfinding_grid[i][j] = 1
-        
-        # Get hallways and entrances
-        hallways_and_entrances = set()
-        for i in range(grid_height):
-            for j in range(grid_width):
-                if (self.grid_data["entrances.geojson"][i][j] == 1 or 
-                    self.grid_data["hallways.geojson"][i][j] == 1):
-                    hallways_and_entrances.add((i, j))
-                    # Add adjacent cells to ensure good connectivity
-                    for di in [-1, 0, 1]:
-                        for dj in [-1, 0, 1]:
-                            ni, nj = i + di, j + dj
-                            if (0 <= ni < grid_height and 
-                                0 <= nj < grid_width):
-                                hallways_and_entrances.add((ni, nj))
-        
-        # Apply graduated padding to buildings
-        from a_star import apply_padding
-        pathfinding_grid = apply_padding(pathfinding_grid, 2)  # Use smaller padding
-        
-        # Make hallways and entrances fully traversable
-        for i, j in hallways_and_entrances:
-            pathfinding_grid[i][j] = 0
-        
-        return pathfinding_grid
+    def get_router(self):
+        """Creates the router, where buildings are non-traversable and their surroundings cost extra"""
+        # The map never changes while the app runs, so build the engine and cost layer once
+        if self.router is not None:
+            return self.router
+
+        buildings = (np.array(self.base_grid) == 1).astype(np.uint8)
+
+        # Hallways and entrances plus their adjacent cells, to ensure good connectivity
+        hallways_and_entrances = ndimage.binary_dilation(
+            (np.array(self.grid_data["entrances.geojson"]) == 1) |
+            (np.array(self.grid_data["hallways.geojson"]) == 1),
+            structure=np.ones((3, 3), dtype=bool))
+
+        # Graduated padding around buildings; hallways and entrances are fully traversable
+        self.router = PaddedRouter(buildings, 2, open_cells=hallways_and_entrances)  # Use smaller padding
+        return self.router
 
     def find_path(self):
         """Find and draw path between start and end points"""
         if self.start and self.end:
-            # Get grid suitable for pathfinding
-            pathfinding_grid = self.get_pathfinding_grid()
-            
-            # Find path
-            path = a_star(pathfinding_grid, self.start, self.end)
+            # Find the route's cells (or any-angle waypoints) in canvas coordinates
+            router = self.get_router()
+            cells = router.route(self.start, self.end, any_angle=ANY_ANGLE_PATHS)
+            if not cells:
+                path = None
+            elif SMOOTH_PATHS:
+                path = get_smooth_path_points(cells, self.cell_size, PATH_SMOOTHING, SMOOTHING_METHOD,
+                                              blocked=router.obstacles)
+            else:
+                path = path_points(cells, self.cell_size)
             
             if path:
                 # Clear any existing path
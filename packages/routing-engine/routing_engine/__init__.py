@@ -0,0 +1,34 @@
+"""
+Shared routing engine for the campus grid: grid loading, cost layers, snapping,
+search, smoothing and time estimates
+
+The names below are the stable API used by the Flask service (packages/api) and
+the desktop tools (packages/pathfinding-core). Submodules hold the precompute
+helpers and command line tools behind them.
+"""
+from routing_engine.closures import ClosureOverlay, polygon_cells
+from routing_engine.components import ComponentIndex
+from routing_engine.distance_transform import obstacle_distance, padded_grid, padding_cost_table, padding_costs
+from routing_engine.dstar import DStarLite
+from routing_engine.estimates import WALKING_SPEED, cell_size, path_length, walking_minutes
+from routing_engine.georeference import GeoReference
+from routing_engine.hpa import HierarchicalSearch
+from routing_engine.jps import JumpPointSearch
+from routing_engine.landmarks import LandmarkSearch
+from routing_engine.map_bundle import load_config
+from routing_engine.matrix import DistanceMatrix
+from routing_engine.navmesh import NavMesh
+from routing_engine.polyline import decode_polyline, encode_polyline, simplify_path
+from routing_engine.search import DIAGONAL_COST, NO_PATH, ORTHOGONAL_COST, GridSearch, SearchResult
+from routing_engine.smoothing import SMOOTHING_METHODS, get_smooth_path_points, path_points, smooth_path, smooth_paths
+from routing_engine.snapping import SnapIndex
+from routing_engine.theta import ThetaStarSearch
+
+__all__ = [
+    'ClosureOverlay', 'ComponentIndex', 'DIAGONAL_COST', 'DStarLite', 'DistanceMatrix', 'GeoReference',
+    'GridSearch', 'HierarchicalSearch', 'JumpPointSearch', 'LandmarkSearch', 'NO_PATH', 'NavMesh',
+    'ORTHOGONAL_COST', 'SMOOTHING_METHODS', 'SearchResult', 'SnapIndex', 'ThetaStarSearch', 'WALKING_SPEED',
+    'cell_size', 'decode_polyline', 'encode_polyline', 'get_smooth_path_points', 'load_config',
+    'obstacle_distance', 'padded_grid', 'padding_cost_table', 'padding_costs', 'path_length', 'path_points',
+    'polygon_cells', 'simplify_path', 'smooth_path', 'smooth_paths', 'walking_minutes',
+]
@@ -0,0 +1,194 @@
+"""
+Temporary closures laid over a loaded grid, updating its indexes only where they change
+"""
+import threading
+
+import numpy as np
+from scipy import ndimage
+
+from routing_engine.matrix import DistanceMatrix
+
+# Spacing, in cells, of the points sampled along polygon edges, so thin closures still close a cell
+EDGE_SAMPLE_CELLS = 0.25
+
+
+def polygon_cells(georeference, polygon):
+    """Cells a closure polygon covers: those whose centre lies inside it, and those its outline crosses.
+
+    Args:
+        georeference (GeoReference): Georeference of the grid
+        polygon: (lat, lng) vertices of the outline, at least three
+
+    Returns:
+        np.ndarray: (n, 2) int array of (row, col) cells on the grid, possibly empty
+    """
+    vertices = np.asarray(polygon, dtype=float).reshape(-1, 2)
+    if len(vertices) < 3:
+        raise ValueError("A closure polygon needs at least three points")
+    # Vertices in fractional cell coordinates, where cell (row, col) spans [row, row + 1) x [col, col + 1)
+    corners = georeference.cells_to_lat_lng([(0, 0), (1, 1)])
+    scale = corners[1] - corners[0]
+    outline = (vertices - corners[0]) / scale + 0.5
+    ends = np.roll(outline, -1, axis=0)
+
+    # Cells crossed by the outline
+    counts = np.maximum(np.ceil(np.abs(ends - outline).max(axis=1) / EDGE_SAMPLE_CELLS), 1).astype(np.int64)
+    edge = np.repeat(np.arange(len(outline)), counts)
+    fraction = (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)) / counts[edge]
+    samples = outline[edge] + fraction[:, None] * (ends - outline)[edge]
+    cells = [np.floor(samples).astype(np.int64)]
+
+    # Cells whose centre is inside, by the even-odd rule over the outline's bounding box
+    low = np.maximum(np.floor(outline.min(axis=0)).astype(np.int64), 0)
+    high = np.minimum(np.ceil(outline.max(axis=0)).astype(np.int64), georeference.shape)
+    if (high > low).all():
+        rows, cols = np.mgrid[low[0]:high[0], low[1]:high[1]]
+        centres = np.column_stack([rows.ravel() + 0.5, cols.ravel() + 0.5])
+        y, x = centres[:, :1], centres[:, 1:]
+        y0, x0, y1, x1 = outline[:, 0], outline[:, 1], ends[:, 0], ends[:, 1]
+        straddles = (y0 > y) != (y1 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            crossing = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+        inside = np.count_nonzero(straddles & (x < crossing), axis=1) % 2 == 1
+        cells.append(centres[inside].astype(np.int64))
+
+    cells = np.unique(np.concatenate(cells), axis=0)
+    return cells[georeference.contains(cells)]
+
+
+class ClosureOverlay:
+    """A map version's grid with closed cells blocked, without rebuilding its indexes.
+
+    Closing cells only lowers obstacle distances, and only near the closure,
+    so the distance transform is recomputed in a window around each closure
+    that grows until the distances at its edge are unchanged. Blocked masks are
+    copies of the base masks with those windows rewritten, and component labels
+    are recomputed only for the components a closure cut into.
+
+    Searches run over these masks with any engine that takes a caller-supplied
+    mask (GridSearch and ThetaStarSearch). Engines whose precomputed tables
+    describe the grid without closures are answered by A* instead.
+    """
+
+    def __init__(self, grid_search, obstacle_distance, components, closures):
+        """
+        Args:
+            grid_search (GridSearch): Engine of the base grid
+            obstacle_distance (np.ndarray): Obstacle distance transform of the base grid
+            components (ComponentIndex): Component labels of the base grid
+            closures (list): (n, 2) arrays of the (row, col) cells of each closure
+        """
+        self.grid = grid_search
+        rows, cols = obstacle_distance.shape
+        self.closed = np.zeros((rows, cols), dtype=bool)
+        self.obstacle_distance = obstacle_distance.copy()
+        # (row slice, col slice) of every region whose distances changed
+        self.windows = []
+        for cells in closures:
+            cells = np.asarray(cells, dtype=np.int64).reshape(-1, 2)
+            if len(cells):
+                self.closed[cells[:, 0], cells[:, 1]] = True
+                self.windows.append(self._lower_distances(cells, obstacle_distance))
+        self._blocked = {}
+        self._lock = threading.Lock()
+        self.components = components.overlay(self.blocked)
+        self.matrix = DistanceMatrix(self.obstacle_distance, self.components)
+
+    def blocked(self, padding):
+        """Blocked-cell mask for a padding radius like GridSearch.blocked, with the closures applied."""
+        mask = self._blocked.get(padding)
+        if mask is None:
+            with self._lock:
+                mask = self._blocked.get(padding)
+                if mask is None:
+                    mask = bytearray(self.grid.blocked(padding))
+                    bordered = np.frombuffer(mask, dtype=np.uint8).reshape(self.grid.rows + 2, self.grid.width)
+                    for rows, cols in self.windows:
+                        window = bordered[rows.start + 1:rows.stop + 1, cols.start + 1:cols.stop + 1]
+                        window |= self.obstacle_distance[rows, cols] <= padding
+                    self._blocked[padding] = mask
+        return mask
+
+    def search(self, engine, start, goal, padding=0):
+        """Search with engine over the mask of a padding level, or with A* if engine has no search_mask.
+
+        Returns:
+            SearchResult
+        """
+        if not hasattr(engine, 'search_mask'):
+            engine = self.grid
+        return engine.search_mask(self.blocked(padding), start, goal)
+
+    def crosses(self, cells, padding):
+        """Whether a path runs through a cell that is blocked at a padding level once the closures apply.
+
+        Args:
+            cells: (row, col) cells of the path; consecutive cells that are not neighbours,
+                like the waypoints of ThetaStarSearch, are joined by straight segments
+
+        Returns:
+            bool
+        """
+        if not len(cells):
+            return False
+        cells = np.asarray(cells, dtype=np.int64).reshape(-1, 2)
+        mask = self.blocked(padding)
+        indices = (cells[:, 0] + 1) * self.grid.width + cells[:, 1] + 1
+        if np.frombuffer(mask, dtype=np.uint8)[indices].any():
+            return True
+        jumps = np.flatnonzero(np.abs(np.diff(cells, axis=0)).max(axis=1) > 1)
+        return any(self.grid.line_cost(mask, indices[i], indices[i + 1]) is None for i in jumps.tolist())
+
+    def nearest_open(self, row, col, targets):
+        """Nearest cell of targets that is not closed, searched in growing squares around (row, col).
+
+        Args:
+            targets (np.ndarray): 2D bool array of the cells a point may be snapped to, at most the grid's shape
+
+        Returns:
+            tuple: (row, col), or (None, None) if every target is closed
+        """
+        rows, cols = targets.shape
+        closed = self.closed[:rows, :cols]
+        radius = 1
+        while True:
+            top, left = max(row - radius, 0), max(col - radius, 0)
+            bottom, right = row + radius + 1, col + radius + 1
+            candidates = np.argwhere(targets[top:bottom, left:right] & ~closed[top:bottom, left:right])
+            covers_grid = top == 0 and left == 0 and bottom >= rows and right >= cols
+            if len(candidates):
+                candidates += (top, left)
+                distances = np.hypot(*(candidates - (row, col)).T)
+                nearest = np.argmin(distances)
+                # Targets outside the square are at least radius + 1 away
+                if distances[nearest] <= radius + 1 or covers_grid:
+                    found_row, found_col = candidates[nearest].tolist()
+                    return found_row, found_col
+            elif covers_grid:
+                return None, None
+            radius *= 2
+
+    def _lower_distances(self, cells, base_distance):
+        # Distances to the closure are exact inside any box around it. A cell outside the box
+        # is only affected if some cell on the box's edge is, so the box grows until none is.
+        rows, cols = base_distance.shape
+        low, high = cells.min(axis=0), cells.max(axis=0) + 1
+        margin = 1
+        while True:
+            top, left = max(low[0] - margin, 0), max(low[1] - margin, 0)
+            bottom, right = min(high[0] + margin, rows), min(high[1] + margin, cols)
+            sources = np.ones((bottom - top, right - left), dtype=bool)
+            sources[cells[:, 0] - top, cells[:, 1] - left] = False
+            to_closure = ndimage.distance_transform_cdt(sources, metric='chessboard')
+            base = base_distance[top:bottom, left:right]
+            # Edges of the box that have cells beyond them
+            edge = np.zeros(sources.shape, dtype=bool)
+            edge[0, :] |= top > 0
+            edge[-1, :] |= bottom < rows
+            edge[:, 0] |= left > 0
+            edge[:, -1] |= right < cols
+            if not (to_closure[edge] < base[edge]).any():
+                window = slice(top, bottom), slice(left, right)
+                np.minimum(self.obstacle_distance[window], to_closure, out=self.obstacle_distance[window])
+                return window
+            margin *= 2
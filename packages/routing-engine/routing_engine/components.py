@@ -0,0 +1,122 @@
+"""
+Connected-component labels used to reject unreachable routes before searching
+"""
+import threading
+from array import array
+
+import numpy as np
+from scipy import ndimage
+
+# Search moves to all 8 neighbours, so components use 8-connectivity too
+EIGHT_CONNECTED = np.ones((3, 3), dtype=bool)
+
+
+def component_labels(blocked):
+    """Label the 8-connected regions of traversable cells.
+
+    Args:
+        blocked (np.ndarray): 2D bool array, True for cells that cannot be entered
+
+    Returns:
+        np.ndarray: int32 labels, 0 for blocked cells and 1..n for each region
+    """
+    labels, _ = ndimage.label(~np.asarray(blocked, dtype=bool), structure=EIGHT_CONNECTED)
+    return labels.astype(np.int32)
+
+
+def relabel_blocked(labels, blocked):
+    """Component labels after blocking more cells, relabelling only the components that lost cells.
+
+    Args:
+        labels (np.ndarray): Labels from component_labels
+        blocked (np.ndarray): The new blocked mask, a superset of the cells labelled 0
+
+    Returns:
+        np.ndarray: New labels; pieces of split components get labels above the previous maximum
+    """
+    lost = np.unique(labels[blocked & (labels != 0)])
+    labels = labels.copy()
+    if not lost.size:
+        return labels
+    touched = np.isin(labels, lost)
+    rows, cols = np.flatnonzero(touched.any(axis=1)), np.flatnonzero(touched.any(axis=0))
+    box = slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1)
+    free = touched[box] & ~blocked[box]
+    pieces, _ = ndimage.label(free, structure=EIGHT_CONNECTED)
+    window = labels[box]
+    window[touched[box]] = 0
+    window[free] = pieces[free] + labels.max()
+    return labels
+
+
+class ComponentIndex:
+    """Component labels of a GridSearch grid, one label array per padding level.
+
+    Two cells are connected at a padding level exactly when they carry the same
+    non-zero label, so reachability is a pair of array reads instead of a search.
+    """
+
+    def __init__(self, grid_search, paddings=(), blocked=None):
+        """
+        Args:
+            grid_search (GridSearch): Engine whose blocked masks are labelled
+            paddings (iterable): Padding levels to label up front; others are labelled on first use
+            blocked (callable): Padding -> blocked mask to label instead of grid_search.blocked,
+                e.g. ClosureOverlay.blocked
+        """
+        self.grid = grid_search
+        self.blocked = blocked or grid_search.blocked
+        self._labels = {}
+        self._lock = threading.Lock()
+        for padding in paddings:
+            self.labels(padding)
+
+    def labels(self, padding):
+        """Flat labels for a padding level, indexed like the GridSearch's bordered grid."""
+        labels = self._labels.get(padding)
+        if labels is None:
+            with self._lock:
+                labels = self._labels.get(padding)
+                if labels is None:
+                    shape = (self.grid.rows + 2, self.grid.width)
+                    blocked = np.frombuffer(self.blocked(padding), dtype=np.uint8).reshape(shape)
+                    labels = array('i', component_labels(blocked == 1).tobytes())
+                    self._labels[padding] = labels
+        return labels
+
+    def overlay(self, blocked):
+        """Labels of the same grid with more cells blocked, relabelling only the components that lost cells.
+
+        Blocking cells can only split components, so every other component keeps
+        its label, and only the bounding box of the touched ones is labelled again.
+
+        Args:
+            blocked (callable): Padding -> blocked mask, blocking every cell the current masks block
+
+        Returns:
+            ComponentIndex
+        """
+        index = ComponentIndex(self.grid, blocked=blocked)
+        shape = (self.grid.rows + 2, self.grid.width)
+        for padding in list(self._labels):
+            labels = np.frombuffer(self._labels[padding], dtype=np.int32).reshape(shape)
+            mask = np.frombuffer(blocked(padding), dtype=np.uint8).reshape(shape) == 1
+            index._labels[padding] = array('i', relabel_blocked(labels, mask).tobytes())
+        return index
+
+    def connected(self, start, goal, padding):
+        """Whether a path exists between two (row, col) cells at a padding level."""
+        labels = self.labels(padding)
+        label = labels[self.grid.index(*start)]
+        return label != 0 and label == labels[self.grid.index(*goal)]
+
+    def first_connected_padding(self, start, goal, paddings):
+        """The first padding level in paddings at which start and goal are connected.
+
+        Returns:
+            int or None: The padding level, or None if they are connected at none of them
+        """
+        for padding in paddings:
+            if self.connected(start, goal, padding):
+                return padding
+        return None
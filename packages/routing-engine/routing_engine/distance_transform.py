@@ -0,0 +1,72 @@
+"""
+Obstacle distance transform and the padding layers derived from it
+"""
+import numpy as np
+from scipy import ndimage
+
+
+def obstacle_distance(grid):
+    """Chessboard distance from every cell to the nearest obstacle.
+
+    Obstacle cells get 0, their 8 neighbours 1, and so on. A cell lies inside
+    the padding of radius p around the obstacles exactly when its distance is <= p,
+    which matches the square padding painted around obstacles.
+
+    Args:
+        grid: 2D list or array where 1 marks an obstacle
+
+    Returns:
+        np.ndarray: int32 array with the same shape as grid
+    """
+    obstacles = np.asarray(grid) == 1
+    if not obstacles.any():
+        # No obstacles at all, every cell is further away than any padding we use
+        return np.full(obstacles.shape, sum(obstacles.shape), dtype=np.int32)
+    return ndimage.distance_transform_cdt(~obstacles, metric='chessboard').astype(np.int32)
+
+
+def padded_grid(distance, padding_value):
+    """Return the obstacle grid padded by padding_value cells as a uint8 array.
+
+    Args:
+        distance (np.ndarray): Output of obstacle_distance
+        padding_value (int): Padding radius in cells, 0 gives the raw obstacles
+
+    Returns:
+        np.ndarray: 1 for blocked cells, 0 for traversable ones
+    """
+    return (distance <= max(padding_value, 0)).astype(np.uint8)
+
+
+def padding_cost_table(padding_value):
+    """Graduated padding cost indexed by distance to the nearest obstacle.
+
+    Index 0 is an obstacle (1), indices 1..padding_value decrease towards 0,
+    and the last index (padding_value + 1) is used for every cell further away.
+
+    Args:
+        padding_value (int): Padding radius in cells
+
+    Returns:
+        list: padding_value + 2 costs between 0 and 1
+    """
+    padding_value = max(padding_value, 0)
+    table = [(padding_value - dist + 1) / (padding_value + 1) for dist in range(padding_value + 2)]
+    table[0] = 1
+    table[-1] = 0
+    return table
+
+
+def padding_costs(distance, padding_value):
+    """Cost layer that discourages, rather than forbids, walking close to obstacles.
+
+    Args:
+        distance (np.ndarray): Output of obstacle_distance
+        padding_value (int): Padding radius in cells, 0 gives no cost outside obstacles
+
+    Returns:
+        np.ndarray: float array with the shape of distance, 1 on obstacles and 0 beyond the padding
+    """
+    padding_value = max(padding_value, 0)
+    table = np.array(padding_cost_table(padding_value))
+    return table[np.minimum(distance, padding_value + 1)]
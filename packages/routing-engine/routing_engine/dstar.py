@@ -0,0 +1,181 @@
+"""
+D* Lite: incremental replanning after cells of the grid open or close
+"""
+from heapq import heappop, heappush
+
+import numpy as np
+
+from routing_engine.search import ORTHOGONAL_COST
+
+INFINITY = float('inf')
+
+
+class DStarLite:
+    """Shortest path between two fixed cells that is kept up to date as cells change.
+
+    The search runs backwards from the goal and keeps, for every cell it has
+    reached, its cost to the goal (g) and a one-step lookahead of it (rhs).
+    When cells are blocked or freed, only the cells whose costs those changes
+    invalidate are expanded again, instead of repeating the whole search.
+
+    Moves and step costs are the same as GridSearch's, so a plan over a mask
+    costs exactly what a search_mask over it costs. Values are kept in dicts,
+    so a planner's memory grows with the area it explored rather than the grid.
+    """
+
+    def __init__(self, grid_search, blocked, start, goal):
+        """
+        Args:
+            grid_search (GridSearch): Engine whose flat indices, steps and octile table are used
+            blocked (bytearray): Mask indexed like GridSearch.blocked(), whose border cells must be blocked
+            start (tuple): (row, col) of the start cell
+            goal (tuple): (row, col) of the goal cell
+        """
+        self.grid = grid_search
+        self.blocked = blocked
+        self.start = grid_search.index(*start)
+        self.goal = grid_search.index(*goal)
+        self.g = {}
+        self.rhs = {self.goal: 0}
+        self.nodes_expanded = 0
+        self._queue = []
+        self._queued = {}
+        self._push(self.goal)
+
+    def plan(self):
+        """Bring the plan up to date and return it.
+
+        Returns:
+            list: (row, col) cells from start to goal, empty if they are not connected
+        """
+        self._compute()
+        return self.path()
+
+    def update(self, blocked):
+        """Switch to a new blocked mask, queueing only the cells next to those that changed.
+
+        Call plan() afterwards to repair the path.
+
+        Args:
+            blocked (bytearray): New mask, indexed like the previous one
+
+        Returns:
+            int: Number of cells whose blocked state changed
+        """
+        changed = np.flatnonzero(np.frombuffer(self.blocked, dtype=np.uint8) !=
+                                 np.frombuffer(blocked, dtype=np.uint8))
+        self.blocked = blocked
+        for cell in changed.tolist():
+            self._update_vertex(cell)
+            for offset, _ in self.grid.steps:
+                self._update_vertex(cell + offset)
+        return len(changed)
+
+    def path(self):
+        """The current plan, following the cheapest step out of every cell from start to goal."""
+        g, blocked, steps = self.g, self.blocked, self.grid.steps
+        current = self.start
+        if blocked[current] or self.rhs.get(current, INFINITY) == INFINITY:
+            return []
+        cells = [self.grid.cell(current)]
+        while current != self.goal:
+            best, best_cost = None, INFINITY
+            for offset, step in steps:
+                neighbor = current + offset
+                if not blocked[neighbor]:
+                    cost = step + g.get(neighbor, INFINITY)
+                    if cost < best_cost:
+                        best, best_cost = neighbor, cost
+            if best is None or best_cost == INFINITY or len(cells) > self.grid.size:
+                return []
+            current = best
+            cells.append(self.grid.cell(current))
+        return cells
+
+    @property
+    def cost(self):
+        """Length of the current plan in cells, None if there is no path."""
+        cost = self.rhs.get(self.start, INFINITY)
+        return None if cost == INFINITY else cost / ORTHOGONAL_COST
+
+    def _heuristic(self, cell):
+        grid = self.grid
+        return grid.octile[abs(grid.row_of[cell] - grid.row_of[self.start]) * grid.width +
+                           abs(grid.col_of[cell] - grid.col_of[self.start])]
+
+    def _key(self, cell):
+        value = min(self.g.get(cell, INFINITY), self.rhs.get(cell, INFINITY))
+        return value + self._heuristic(cell), value
+
+    def _push(self, cell):
+        key = self._key(cell)
+        self._queued[cell] = key
+        heappush(self._queue, (key, cell))
+
+    def _top(self):
+        # Entries are removed lazily: one is current only while _queued holds the same key
+        queue, queued = self._queue, self._queued
+        while queue and queued.get(queue[0][1]) != queue[0][0]:
+            heappop(queue)
+        return queue[0] if queue else None
+
+    def _update_vertex(self, cell):
+        blocked = self.blocked
+        if cell != self.goal:
+            best = INFINITY
+            if not blocked[cell]:
+                g = self.g
+                for offset, step in self.grid.steps:
+                    neighbor = cell + offset
+                    if not blocked[neighbor]:
+                        cost = step + g.get(neighbor, INFINITY)
+                        if cost < best:
+                            best = cost
+            if best == INFINITY:
+                self.rhs.pop(cell, None)
+            else:
+                self.rhs[cell] = best
+        if self.g.get(cell, INFINITY) != self.rhs.get(cell, INFINITY):
+            self._push(cell)
+        else:
+            self._queued.pop(cell, None)
+
+    def _compute(self):
+        g, rhs, steps, queued = self.g, self.rhs, self.grid.steps, self._queued
+        while True:
+            top = self._top()
+            if top is None:
+                break
+            key, cell = top
+            start_g, start_rhs = g.get(self.start, INFINITY), rhs.get(self.start, INFINITY)
+            if key >= self._key(self.start) and start_g == start_rhs:
+                break
+            heappop(self._queue)
+            del queued[cell]
+            self.nodes_expanded += 1
+            blocked = self.blocked
+
+            cell_g, cell_rhs = g.get(cell, INFINITY), rhs.get(cell, INFINITY)
+            if cell_g > cell_rhs:
+                # Overconsistent: the cell got cheaper, settle it and pass that on. A neighbour's
+                # lookahead can only drop to a step via this cell, so no need to scan its other moves.
+                g[cell] = cell_rhs
+                for offset, step in steps:
+                    neighbor = cell + offset
+                    cost = cell_rhs + step
+                    if neighbor != self.goal and not blocked[neighbor] and cost < rhs.get(neighbor, INFINITY):
+                        rhs[neighbor] = cost
+                        if g.get(neighbor, INFINITY) != cost:
+                            self._push(neighbor)
+                        else:
+                            queued.pop(neighbor, None)
+            else:
+                # Underconsistent: the cell got dearer. Forget its cost and queue it again, and only
+                # the neighbours whose lookahead went through it need to recompute theirs.
+                del g[cell]
+                if cell_rhs != INFINITY:
+                    self._push(cell)
+                for offset, step in steps:
+                    neighbor = cell + offset
+                    if rhs.get(neighbor) == cell_g + step:
+                        self._update_vertex(neighbor)
@@ -0,0 +1,50 @@
+"""
+Walking distance and time estimates for routes
+"""
+import math
+
+import numpy as np
+
+# Average walking speed in metres per second (about 5 km/h)
+WALKING_SPEED = 1.4
+# Metres per degree of latitude
+METERS_PER_DEGREE = 111320
+
+
+def cell_size(config):
+    """Mean edge length of a grid cell in metres, from the lat/lng bounds of a grid config."""
+    if 'cell_size' in config:
+        return config['cell_size']  # Stored in map bundles
+    lat_mid = math.radians((config['lat_min'] + config['lat_max']) / 2)
+    row_meters = (config['lat_max'] - config['lat_min']) * METERS_PER_DEGREE / config['rows']
+    col_meters = (config['lng_max'] - config['lng_min']) * METERS_PER_DEGREE * math.cos(lat_mid) / config['cols']
+    return (row_meters + col_meters) / 2
+
+
+def path_length(path):
+    """Length of a path along its straight segments, in the units of its points.
+
+    Args:
+        path (list): (row, col) cells, or any 2D points such as smoothed path points
+
+    Returns:
+        float: 0 for paths with fewer than two points
+    """
+    if len(path) < 2:
+        return 0.0
+    points = np.asarray(path, dtype=float)
+    return float(np.hypot(*np.diff(points, axis=0).T).sum())
+
+
+def walking_minutes(length, meters_per_cell, walking_speed=WALKING_SPEED):
+    """Walking time for a length in cells, rounded to a tenth of a minute.
+
+    Args:
+        length (float): Route length in cells, e.g. SearchResult.cost or path_length of the cells
+        meters_per_cell (float): Edge length of a cell in metres (see cell_size)
+        walking_speed (float): Speed in metres per second
+
+    Returns:
+        float
+    """
+    return round(length * meters_per_cell / walking_speed / 60, 1)
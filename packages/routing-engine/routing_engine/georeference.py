@@ -0,0 +1,114 @@
+"""
+Mapping between grid cells and latitude/longitude, shared by the grid builders and the API
+"""
+import math
+
+import numpy as np
+
+from routing_engine.estimates import METERS_PER_DEGREE
+
+
+class GeoReference:
+    """The lat/lng bounds of a grid and the affine transform between its cells and lat/lng.
+
+    Rows run south from lat_max and columns east from lng_min, every cell
+    spanning the same fraction of a degree. The transform is worked out once,
+    so a map version keeps one GeoReference and converts whole paths, or every
+    point of a GeoJSON layer, with a single array operation.
+
+    data-processing rasterizes its layers through the same transform the API
+    serves them with, so a cell means the same patch of ground offline and online.
+    """
+
+    def __init__(self, rows, cols, bounds):
+        """
+        Args:
+            rows (int): Number of grid rows
+            cols (int): Number of grid columns
+            bounds (tuple): (lat_min, lat_max, lng_min, lng_max)
+        """
+        self.rows = int(rows)
+        self.cols = int(cols)
+        self.bounds = tuple(float(bound) for bound in bounds)
+        lat_min, lat_max, lng_min, lng_max = self.bounds
+        # Degrees spanned by one row and one column
+        self.row_size = (lat_max - lat_min) / self.rows
+        self.col_size = (lng_max - lng_min) / self.cols
+        # Cell (row, col) corner -> (lng, lat), in the (a, b, c, d, e, f) order of affine.Affine and rasterio
+        self.affine = (self.col_size, 0.0, lng_min, 0.0, -self.row_size, lat_max)
+        self._origin = np.array([lat_max, lng_min])
+        self._scale = np.array([-self.row_size, self.col_size])
+
+    @classmethod
+    def from_config(cls, config):
+        """GeoReference of a grid_config.json or MapBundle.config()."""
+        return cls(config['rows'], config['cols'],
+                   (config['lat_min'], config['lat_max'], config['lng_min'], config['lng_max']))
+
+    @classmethod
+    def from_bounds(cls, bounds, cell_meters):
+        """GeoReference with as many cells of about cell_meters as fit within bounds.
+
+        Args:
+            bounds (tuple): (lat_min, lat_max, lng_min, lng_max)
+            cell_meters (float): Target edge length of a cell in metres
+        """
+        lat_min, lat_max, lng_min, lng_max = bounds
+        lng_meters = METERS_PER_DEGREE * math.cos(math.radians((lat_min + lat_max) / 2))
+        rows = int((lat_max - lat_min) * METERS_PER_DEGREE / cell_meters)
+        cols = int((lng_max - lng_min) * lng_meters / cell_meters)
+        return cls(rows, cols, bounds)
+
+    @property
+    def shape(self):
+        return self.rows, self.cols
+
+    def config(self):
+        """The rows, cols and bounds entries of a grid config."""
+        lat_min, lat_max, lng_min, lng_max = self.bounds
+        return {'rows': self.rows, 'cols': self.cols,
+                'lat_min': lat_min, 'lat_max': lat_max, 'lng_min': lng_min, 'lng_max': lng_max}
+
+    def cells_to_lat_lng(self, cells):
+        """Lat/lng of the centres of cells.
+
+        Args:
+            cells: (row, col) pairs as a list or (n, 2) array; fractional rows and columns,
+                e.g. of smoothed paths, are placed between cell centres
+
+        Returns:
+            np.ndarray: (n, 2) float array of (lat, lng)
+        """
+        cells = np.asarray(cells, dtype=float).reshape(-1, 2)
+        return self._origin + (cells + 0.5) * self._scale
+
+    def lat_lng_to_cells(self, points, clip=False):
+        """Cells that contain lat/lng points.
+
+        Args:
+            points: (lat, lng) pairs as a list or (n, 2) array
+            clip (bool): Move points outside the bounds to the nearest edge cell
+
+        Returns:
+            np.ndarray: (n, 2) int array of (row, col), which may lie off the grid unless clip
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        cells = np.floor((points - self._origin) / self._scale).astype(np.int64)
+        if clip:
+            np.clip(cells, 0, (self.rows - 1, self.cols - 1), out=cells)
+        return cells
+
+    def cell_to_lat_lng(self, row, col):
+        """Lat/lng of the centre of one cell, as a (lat, lng) tuple of floats."""
+        lat, lng = self.cells_to_lat_lng((row, col))[0].tolist()
+        return lat, lng
+
+    def lat_lng_to_cell(self, lat, lng, clip=False):
+        """The (row, col) tuple of ints of the cell containing one point, see lat_lng_to_cells."""
+        row, col = self.lat_lng_to_cells((lat, lng), clip)[0].tolist()
+        return row, col
+
+    def contains(self, cells):
+        """Mask of the (row, col) cells that lie on the grid."""
+        cells = np.asarray(cells).reshape(-1, 2)
+        return (cells[:, 0] >= 0) & (cells[:, 0] < self.rows) & (cells[:, 1] >= 0) & (cells[:, 1] < self.cols)
@@ -0,0 +1,412 @@
+"""
+Hierarchical pathfinding (HPA*) over clusters of the routing grid
+"""
+import argparse
+import io
+import threading
+from heapq import heappop, heappush
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from routing_engine.jps import mask_checksum
+from routing_engine.search import ORTHOGONAL_COST, DIAGONAL_COST, SearchResult, NO_PATH
+
+DEFAULT_CLUSTER_SIZE = 32
+# Entrances narrower than this get one transition in the middle, wider ones one at each end
+MAX_ENTRANCE_WIDTH = 6
+
+# Half of the 8 neighbour offsets with their step cost; the other half are the reverse edges
+_FORWARD_STEPS = (((0, 1), ORTHOGONAL_COST), ((1, 0), ORTHOGONAL_COST),
+                  ((1, 1), DIAGONAL_COST), ((1, -1), DIAGONAL_COST))
+
+
+def grid_graph(free):
+    """Sparse 8-connected graph of a block of cells, for scipy's csgraph routines.
+
+    Args:
+        free (np.ndarray): 2D bool array of the cells that may be entered
+
+    Returns:
+        scipy.sparse.csr_matrix: Undirected step costs between cell ids row * width + col
+    """
+    height, width = free.shape
+    ids = np.arange(free.size).reshape(free.shape)
+    tails, heads, weights = [], [], []
+    for (d_row, d_col), cost in _FORWARD_STEPS:
+        row_end = height - d_row
+        col_start, col_end = max(0, -d_col), width - max(0, d_col)
+        here = (slice(0, row_end), slice(col_start, col_end))
+        there = (slice(d_row, height), slice(col_start + d_col, col_end + d_col))
+        both = free[here] & free[there]
+        tails.append(ids[here][both])
+        heads.append(ids[there][both])
+        weights.append(np.full(int(both.sum()), cost, dtype=np.float64))
+
+    tails, heads, weights = np.concatenate(tails), np.concatenate(heads), np.concatenate(weights)
+    return coo_matrix((weights, (tails, heads)), shape=(free.size, free.size)).tocsr()
+
+
+def _cluster_distances(free, sources):
+    """Shortest 8-connected path costs from sources to every cell of a block of cells.
+
+    Returns:
+        np.ndarray: float array of shape (len(sources), free.size), inf where unreachable
+    """
+    width = free.shape[1]
+    return dijkstra(grid_graph(free), directed=False, indices=[row * width + col for row, col in sources])
+
+
+def build_abstract_graph(free, cluster_size=DEFAULT_CLUSTER_SIZE):
+    """Find the entrances between clusters and the distances between them.
+
+    The grid is cut into square clusters. Along every border between two
+    clusters each run of cells that are free on both sides is an entrance,
+    marked by one or two transitions: a pair of facing cells joined by an edge.
+    Inside each cluster, every pair of transition cells that can reach each
+    other without leaving the cluster is joined by an edge of that length.
+
+    Args:
+        free (np.ndarray): 2D bool array, True for cells that can be entered
+        cluster_size (int): Side of a cluster in cells
+
+    Returns:
+        tuple: (nodes, edges) where nodes is an int32 array of (row, col) cells
+            and edges an int64 array of (node, node, cost) rows, each edge listed once
+    """
+    free = np.asarray(free, dtype=bool)
+    rows, cols = free.shape
+    node_ids = {}
+    edges = []
+
+    def node(cell):
+        if cell not in node_ids:
+            node_ids[cell] = len(node_ids)
+        return node_ids[cell]
+
+    def add_transitions(pairs_free, cells):
+        # pairs_free[i] is True when both facing cells of position i are free
+        padded = np.concatenate(([False], pairs_free, [False]))
+        changes = np.flatnonzero(padded[1:] != padded[:-1])
+        for first, end in zip(changes[::2], changes[1::2]):
+            last = end - 1
+            positions = (first, last) if end - first >= MAX_ENTRANCE_WIDTH else ((first + last) // 2,)
+            for position in positions:
+                inside, outside = cells(position)
+                edges.append((node(inside), node(outside), ORTHOGONAL_COST))
+
+    for border in range(cluster_size, cols, cluster_size):
+        for top in range(0, rows, cluster_size):
+            bottom = min(top + cluster_size, rows)
+            add_transitions(free[top:bottom, border - 1] & free[top:bottom, border],
+                            lambda i, top=top, border=border: ((top + i, border - 1), (top + i, border)))
+    for border in range(cluster_size, rows, cluster_size):
+        for left in range(0, cols, cluster_size):
+            right = min(left + cluster_size, cols)
+            add_transitions(free[border - 1, left:right] & free[border, left:right],
+                            lambda i, left=left, border=border: ((border - 1, left + i), (border, left + i)))
+
+    clusters = {}
+    for cell in node_ids:
+        clusters.setdefault((cell[0] // cluster_size, cell[1] // cluster_size), []).append(cell)
+    for (cluster_row, cluster_col), cells in clusters.items():
+        if len(cells) < 2:
+            continue
+        top, left = cluster_row * cluster_size, cluster_col * cluster_size
+        block = free[top:top + cluster_size, left:left + cluster_size]
+        local = [(row - top, col - left) for row, col in cells]
+        distances = _cluster_distances(block, local)
+        for i in range(len(cells)):
+            for j in range(i + 1, len(cells)):
+                cost = distances[i, local[j][0] * block.shape[1] + local[j][1]]
+                if np.isfinite(cost):
+                    edges.append((node_ids[cells[i]], node_ids[cells[j]], int(cost)))
+
+    nodes = np.array(list(node_ids), dtype=np.int32).reshape(-1, 2)
+    return nodes, np.array(edges, dtype=np.int64).reshape(-1, 3)
+
+
+def save_abstract_graphs(file, graphs_by_padding, checksums, cluster_size):
+    """Write abstract graphs for several padding levels to an .npz file or file object."""
+    arrays = {'cluster_size': np.array(cluster_size, dtype=np.int32)}
+    for padding, (nodes, edges) in graphs_by_padding.items():
+        arrays[f'nodes_{padding}'] = nodes
+        arrays[f'edges_{padding}'] = edges
+        arrays[f'checksum_{padding}'] = np.array(checksums[padding], dtype=np.uint32)
+    np.savez_compressed(file, **arrays)
+
+
+def load_abstract_graphs(data):
+    """Read abstract graphs written by save_abstract_graphs.
+
+    Returns:
+        dict: padding -> (cluster_size, nodes, edges, checksum)
+    """
+    loaded = {}
+    with np.load(io.BytesIO(data)) as archive:
+        cluster_size = int(archive['cluster_size'])
+        for name in archive.files:
+            if name.startswith('nodes_'):
+                padding = int(name[len('nodes_'):])
+                loaded[padding] = (cluster_size, archive[name], archive[f'edges_{padding}'],
+                                   int(archive[f'checksum_{padding}']))
+    return loaded
+
+
+class AbstractGraph:
+    """Transition cells of one padding level and the edges between them."""
+
+    def __init__(self, nodes, edges, cluster_size):
+        self.cells = [tuple(cell) for cell in np.asarray(nodes).tolist()]
+        self.neighbors = [[] for _ in self.cells]
+        for a, b, cost in np.asarray(edges).tolist():
+            self.neighbors[a].append((b, cost))
+            self.neighbors[b].append((a, cost))
+        self.cluster_nodes = {}
+        for i, (row, col) in enumerate(self.cells):
+            self.cluster_nodes.setdefault((row // cluster_size, col // cluster_size), []).append(i)
+
+
+class HierarchicalSearch:
+    """HPA* engine on top of a GridSearch.
+
+    A query connects start and goal to the transitions of their clusters, runs
+    A* over the small abstract graph, and then refines the route with a grid
+    search restricted to the clusters the abstract path passes through. Routes
+    are near-optimal rather than shortest: the corridor may exclude a slightly
+    shorter path. When the abstract graph cannot connect the two cells (only
+    possible through a diagonal squeeze across a cluster corner) the query
+    falls back to a full grid search.
+    """
+
+    def __init__(self, grid_search, stored_graphs=None, cluster_size=DEFAULT_CLUSTER_SIZE):
+        """
+        Args:
+            grid_search (GridSearch): Engine whose grid, blocked masks and search buffers are used
+            stored_graphs (dict): Optional padding -> (cluster_size, nodes, edges, checksum)
+                from load_abstract_graphs
+            cluster_size (int): Side of a cluster in cells, used when graphs are built here
+        """
+        self.grid = grid_search
+        self.cluster_size = cluster_size
+        self._stored = stored_graphs or {}
+        self._graphs = {}
+        self._lock = threading.Lock()
+        # Per-thread corridor masks, and a run of blocked cells to close a cluster row with
+        self._local = threading.local()
+        self._wall = memoryview(b'\x01' * cluster_size)
+
+    def graph(self, padding):
+        """Abstract graph for a padding level.
+
+        Stored graphs are used when their checksum and cluster size match,
+        otherwise the graph is built from the grid.
+        """
+        return self._graph_and_arrays(padding)[0]
+
+    def graph_arrays(self, padding):
+        """The (nodes, edges) arrays of a padding level's graph, as build_abstract_graph returns them."""
+        return self._graph_and_arrays(padding)[1]
+
+    def _graph_and_arrays(self, padding):
+        entry = self._graphs.get(padding)
+        if entry is not None:
+            return entry
+
+        with self._lock:
+            entry = self._graphs.get(padding)
+            if entry is None:
+                blocked = self.grid.blocked(padding)
+                stored = self._stored.get(padding)
+                if stored is not None and stored[0] == self.cluster_size and stored[3] == mask_checksum(blocked):
+                    arrays = (stored[1], stored[2])
+                else:
+                    arrays = build_abstract_graph(self._free(blocked), self.cluster_size)
+                entry = (AbstractGraph(*arrays, self.cluster_size), arrays)
+                self._graphs[padding] = entry
+        return entry
+
+    def search(self, start, goal, padding=0):
+        """Find a near-shortest 8-connected path from start to goal.
+
+        Args:
+            start (tuple): (row, col) of the start cell
+            goal (tuple): (row, col) of the goal cell
+            padding (int): Cells within this chessboard distance of an obstacle are blocked
+
+        Returns:
+            SearchResult, with nodes_expanded counting abstract and refinement expansions
+        """
+        grid = self.grid
+        blocked = grid.blocked(padding)
+        if blocked[grid.index(*start)] or blocked[grid.index(*goal)]:
+            return NO_PATH
+
+        graph = self.graph(padding)
+        route, abstract_expanded = self._abstract_path(graph, blocked, start, goal)
+        if route is None:
+            return grid.search_mask(blocked, start, goal)
+
+        clusters = {self._cluster_of(cell) for cell in route}
+        result = self._refine(blocked, clusters, start, goal)
+        if not result.path:
+            return grid.search_mask(blocked, start, goal)
+        return result._replace(nodes_expanded=result.nodes_expanded + abstract_expanded)
+
+    def _free(self, blocked):
+        shape = (self.grid.rows + 2, self.grid.width)
+        return np.frombuffer(blocked, dtype=np.uint8).reshape(shape)[1:-1, 1:-1] == 0
+
+    def _cluster_of(self, cell):
+        return cell[0] // self.cluster_size, cell[1] // self.cluster_size
+
+    def _links(self, graph, blocked, cell, targets=()):
+        """Path costs from cell to the transitions of its cluster and to any targets in it."""
+        size = self.cluster_size
+        cluster = self._cluster_of(cell)
+        top, left = cluster[0] * size, cluster[1] * size
+        free = self._free(blocked)[top:top + size, left:left + size]
+        nodes = graph.cluster_nodes.get(cluster, [])
+
+        distances = _cluster_distances(free, [(cell[0] - top, cell[1] - left)])[0]
+        width = free.shape[1]
+        links = {}
+        for node in nodes:
+            row, col = graph.cells[node]
+            cost = distances[(row - top) * width + col - left]
+            if np.isfinite(cost):
+                links[node] = int(cost)
+        target_costs = {}
+        for target in targets:
+            cost = distances[(target[0] - top) * width + target[1] - left]
+            if np.isfinite(cost):
+                target_costs[target] = int(cost)
+        return links, target_costs
+
+    def _abstract_path(self, graph, blocked, start, goal):
+        """A* over the abstract graph with start and goal linked in.
+
+        Returns:
+            tuple: (cells of the abstract route from start to goal or None if there is none,
+                nodes expanded)
+        """
+        same_cluster = self._cluster_of(start) == self._cluster_of(goal)
+        start_links, direct = self._links(graph, blocked, start, [goal] if same_cluster else [])
+        goal_links, _ = self._links(graph, blocked, goal)
+
+        octile, width = self.grid.octile, self.grid.width
+        goal_row, goal_col = goal
+
+        def heuristic(cell):
+            return octile[abs(cell[0] - goal_row) * width + abs(cell[1] - goal_col)]
+
+        # Node ids: graph nodes, then len(cells) for the start and len(cells) + 1 for the goal
+        start_id, goal_id = len(graph.cells), len(graph.cells) + 1
+        g = {start_id: 0}
+        parent = {}
+        open_set = [(heuristic(start), start_id)]
+        if goal in direct:
+            g[goal_id] = direct[goal]
+            parent[goal_id] = start_id
+            heappush(open_set, (direct[goal], goal_id))
+        for node, cost in start_links.items():
+            g[node] = cost
+            parent[node] = start_id
+            heappush(open_set, (cost + heuristic(graph.cells[node]), node))
+
+        closed = {start_id}
+        expanded = 0
+        while open_set:
+            _, current = heappop(open_set)
+            if current in closed:
+                continue
+            if current == goal_id:
+                break
+            closed.add(current)
+            expanded += 1
+
+            successors = graph.neighbors[current]
+            if current in goal_links:
+                successors = successors + [(goal_id, goal_links[current])]
+            for neighbor, cost in successors:
+                tentative = g[current] + cost
+                if neighbor not in closed and tentative < g.get(neighbor, tentative + 1):
+                    g[neighbor] = tentative
+                    parent[neighbor] = current
+                    cell = goal if neighbor == goal_id else graph.cells[neighbor]
+                    heappush(open_set, (tentative + heuristic(cell), neighbor))
+        else:
+            return None, expanded
+
+        route = [goal]
+        node = parent[goal_id]
+        while node != start_id:
+            route.append(graph.cells[node])
+            node = parent[node]
+        route.append(start)
+        route.reverse()
+        return route, expanded
+
+    def _refine(self, blocked, clusters, start, goal):
+        """Search from start to goal with every cell outside the given clusters blocked as well.
+
+        The corridor mask is a per-thread buffer that stays blocked everywhere
+        between searches. The rows of the clusters are copied in from blocked for
+        one search and closed again after it, so no full-size mask is built per query.
+        """
+        grid, size = self.grid, self.cluster_size
+        corridor = getattr(self._local, 'corridor', None)
+        if corridor is None:
+            corridor = self._local.corridor = bytearray(b'\x01') * grid.size
+
+        spans = []
+        for cluster_row, cluster_col in clusters:
+            left = cluster_col * size
+            right = min(left + size, grid.cols)
+            for row in range(cluster_row * size, min((cluster_row + 1) * size, grid.rows)):
+                first = grid.index(row, left)
+                spans.append((first, first + right - left))
+        for first, last in spans:
+            corridor[first:last] = blocked[first:last]
+        try:
+            return grid.search_mask(corridor, start, goal)
+        finally:
+            wall = self._wall
+            for first, last in spans:
+                corridor[first:last] = wall[:last - first]
+
+
+def main():
+    """Precompute HPA* abstract graphs for a grid config and store them alongside it."""
+    from routing_engine.distance_transform import obstacle_distance
+    from routing_engine.map_bundle import load_config
+    from routing_engine.search import GridSearch
+
+    parser = argparse.ArgumentParser(description="Precompute HPA* abstract graphs for a grid config.")
+    parser.add_argument("grid_config", help="Path to grid_config.json or a map bundle")
+    parser.add_argument("--padding", type=int, action='append',
+                        help="Padding level to precompute, may be repeated (default: 2 and 0)")
+    parser.add_argument("--cluster-size", type=int, default=DEFAULT_CLUSTER_SIZE,
+                        help=f"Side of a cluster in cells (default: {DEFAULT_CLUSTER_SIZE})")
+    parser.add_argument("--output", help="Output .npz path (default: <grid_config>.hpa.npz)")
+    args = parser.parse_args()
+
+    config = load_config(args.grid_config)
+    engine = GridSearch(obstacle_distance(config['grid']))
+    hierarchy = HierarchicalSearch(engine, cluster_size=args.cluster_size)
+
+    graphs, checksums = {}, {}
+    for padding in args.padding or [2, 0]:
+        blocked = engine.blocked(padding)
+        graphs[padding] = build_abstract_graph(hierarchy._free(blocked), args.cluster_size)
+        checksums[padding] = mask_checksum(blocked)
+        print(f"Padding {padding}: {len(graphs[padding][0])} transitions, {len(graphs[padding][1])} edges")
+
+    output = args.output or args.grid_config.rsplit('.', 1)[0] + '.hpa.npz'
+    save_abstract_graphs(output, graphs, checksums, args.cluster_size)
+    print(f"Saved abstract graphs for padding {sorted(graphs)} to {output}")
+
+
+if __name__ == '__main__':
+    main()
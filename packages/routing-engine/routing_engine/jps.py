@@ -0,0 +1,371 @@
+"""
+Jump Point Search with precomputed JPS+ jump tables
+"""
+import argparse
+import io
+import threading
+import zlib
+from array import array
+from heapq import heappop, heappush
+
+import numpy as np
+
+from routing_engine.search import ORTHOGONAL_COST, DIAGONAL_COST, SearchResult, NO_PATH, shared_table
+
+# (d_row, d_col) of each direction; the first four are cardinal, the rest diagonal
+DIRECTIONS = ((-1, 0), (0, 1), (1, 0), (0, -1), (-1, 1), (1, 1), (1, -1), (-1, -1))
+DIRECTION_INDEX = {direction: i for i, direction in enumerate(DIRECTIONS)}
+START = len(DIRECTIONS)  # Arrival "direction" of the start node, which expands every way
+
+# Maps each direction onto east (cardinal) or south-east (diagonal) and back again,
+# so the table sweeps only need to be written once.
+_ORIENTATIONS = {
+    (0, 1): (lambda a: a, lambda a: a),
+    (0, -1): (np.fliplr, np.fliplr),
+    (1, 0): (np.transpose, np.transpose),
+    (-1, 0): (lambda a: np.fliplr(a.T), lambda a: np.fliplr(a).T),
+    (1, 1): (lambda a: a, lambda a: a),
+    (-1, 1): (np.flipud, np.flipud),
+    (1, -1): (np.fliplr, np.fliplr),
+    (-1, -1): (lambda a: np.flipud(np.fliplr(a)), lambda a: np.flipud(np.fliplr(a))),
+}
+
+
+def _east_jumps(free):
+    """Jump distances towards increasing column for every cell.
+
+    A positive value k means moving east for k steps lands on a jump point, i.e. a
+    cell with a forced neighbour. Zero or a negative value -k means there is no jump
+    point before the wall, and k free cells can be walked first.
+    """
+    rows, cols = free.shape
+    pad = np.pad(free, 1)
+    forced = (~pad[:-2, 1:-1] & pad[:-2, 2:]) | (~pad[2:, 1:-1] & pad[2:, 2:])
+
+    table = np.zeros(free.shape, dtype=np.int16)
+    for col in range(cols - 2, -1, -1):
+        following = table[:, col + 1]
+        step = np.where(following > 0, following + 1, following - 1)
+        step = np.where(forced[:, col + 1], 1, step)
+        table[:, col] = np.where(free[:, col + 1], step, 0)
+    return table
+
+
+def _southeast_jumps(free, east, south):
+    """Jump distances along the (1, 1) diagonal, in the same format as _east_jumps.
+
+    A diagonal jump stops on a cell with a forced neighbour or on a cell from which
+    a straight jump along either component direction reaches a jump point.
+    """
+    rows, cols = free.shape
+    pad = np.pad(free, 1)
+    forced = (~pad[:-2, 1:-1] & pad[:-2, 2:]) | (~pad[1:-1, :-2] & pad[2:, :-2])
+    jump_point = forced | (east > 0) | (south > 0)
+
+    table = np.zeros(free.shape, dtype=np.int16)
+    for row in range(rows - 2, -1, -1):
+        following = table[row + 1, 1:]
+        step = np.where(following > 0, following + 1, following - 1)
+        step = np.where(jump_point[row + 1, 1:], 1, step)
+        table[row, :-1] = np.where(free[row + 1, 1:], step, 0)
+    return table
+
+
+def build_jump_tables(blocked):
+    """Compute the JPS+ jump table of a grid.
+
+    Diagonal moves may pass between two blocked cells, as they can in GridSearch,
+    so the tables follow the forced-neighbour rules of the original JPS.
+
+    Args:
+        blocked (np.ndarray): 2D bool array, True for cells that cannot be entered
+
+    Returns:
+        np.ndarray: int16 array of shape (8, rows, cols), one plane per entry in DIRECTIONS
+    """
+    free = ~np.asarray(blocked, dtype=bool)
+    tables = np.zeros((len(DIRECTIONS),) + free.shape, dtype=np.int16)
+    for i, direction in enumerate(DIRECTIONS):
+        forward, backward = _ORIENTATIONS[direction]
+        oriented = forward(free)
+        if 0 in direction:
+            tables[i] = backward(_east_jumps(oriented))
+        else:
+            east = _east_jumps(oriented)
+            south = _east_jumps(oriented.T).T
+            tables[i] = backward(_southeast_jumps(oriented, east, south))
+    return tables
+
+
+def mask_checksum(mask):
+    """CRC32 of a blocked mask, used to check stored tables still match the grid."""
+    return zlib.crc32(bytes(mask)) & 0xffffffff
+
+
+def grid_checksum(grid):
+    """mask_checksum of GridSearch.blocked(0) for a grid, computed from the grid alone.
+
+    Files derived from a grid but built without a GridSearch, like the navigation
+    mesh, store it so they can be matched to the grid they were built for.
+
+    Args:
+        grid: 2D list or array where 1 marks an obstacle
+
+    Returns:
+        int
+    """
+    return mask_checksum(np.pad(np.asarray(grid) == 1, 1, constant_values=True).astype(np.uint8))
+
+
+def save_jump_tables(file, tables_by_padding, checksums):
+    """Write jump tables for several padding levels to an .npz file or file object."""
+    arrays = {}
+    for padding, tables in tables_by_padding.items():
+        arrays[f'pad_{padding}'] = tables
+        arrays[f'checksum_{padding}'] = np.array(checksums[padding], dtype=np.uint32)
+    np.savez_compressed(file, **arrays)
+
+
+def load_jump_tables(data):
+    """Read jump tables written by save_jump_tables.
+
+    Returns:
+        dict: padding -> (tables, checksum)
+    """
+    loaded = {}
+    with np.load(io.BytesIO(data)) as archive:
+        for name in archive.files:
+            if name.startswith('pad_'):
+                padding = int(name[len('pad_'):])
+                loaded[padding] = (archive[name], int(archive[f'checksum_{padding}']))
+    return loaded
+
+
+class JumpPointSearch:
+    """JPS+ engine sharing the flat-index layout and blocked masks of a GridSearch.
+
+    Jump tables are indexed like the bordered grid of the GridSearch, so a table
+    entry is read with the same flat index the search uses. Paths have the same
+    length as GridSearch paths but far fewer nodes are expanded in open areas.
+    """
+
+    def __init__(self, grid_search, stored_tables=None):
+        """
+        Args:
+            grid_search (GridSearch): Engine whose grid and blocked masks are used
+            stored_tables (dict): Optional padding -> (tables, checksum) from load_jump_tables
+        """
+        self.grid = grid_search
+        self._stored = stored_tables or {}
+        self._tables = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        width = grid_search.width
+        self.offsets = tuple(d_row * width + d_col for d_row, d_col in DIRECTIONS)
+        self.costs = tuple(ORTHOGONAL_COST if 0 in d else DIAGONAL_COST for d in DIRECTIONS)
+        self.successors = self._successor_rules()
+
+    def _successor_rules(self):
+        """For each arrival direction, the natural directions and the forced-neighbour checks.
+
+        A forced check is (blocked_offset, free_offset, direction): the direction is
+        explored when the cell at blocked_offset is blocked and the one at free_offset is free.
+        """
+        width = self.grid.width
+        rules = []
+        for d_row, d_col in DIRECTIONS:
+            if d_row == 0 or d_col == 0:
+                natural = [(d_row, d_col)]
+                checks = []
+                for p_row, p_col in ((d_col, d_row), (-d_col, -d_row)):
+                    checks.append(((p_row, p_col), (p_row + d_row, p_col + d_col)))
+            else:
+                natural = [(d_row, 0), (0, d_col), (d_row, d_col)]
+                checks = [((-d_row, 0), (-d_row, d_col)), ((0, -d_col), (d_row, -d_col))]
+            rules.append((
+                tuple(DIRECTION_INDEX[d] for d in natural),
+                tuple((b_row * width + b_col, f_row * width + f_col, DIRECTION_INDEX[(f_row, f_col)])
+                      for (b_row, b_col), (f_row, f_col) in checks),
+            ))
+        rules.append((tuple(range(len(DIRECTIONS))), ()))
+        return tuple(rules)
+
+    def tables(self, padding):
+        """Flat jump tables for a padding level, one array per direction.
+
+        Stored tables are used when their checksum matches the current blocked mask,
+        otherwise the tables are computed from the grid.
+        """
+        blocked = self.grid.blocked(padding)
+        tables = self._tables.get(padding)
+        if tables is not None:
+            return tables
+
+        with self._lock:
+            tables = self._tables.get(padding)
+            if tables is None:
+                shape = (self.grid.rows + 2, self.grid.width)
+                stored = self._stored.get(padding)
+                if stored is not None and stored[1] == mask_checksum(blocked) \
+                        and stored[0].shape[1:] == shape:
+                    # Stored int16 planes are read in place, e.g. from a shared memory block
+                    tables = tuple(shared_table(plane, 'h') for plane in stored[0].astype(np.int16, copy=False))
+                else:
+                    planes = build_jump_tables(np.frombuffer(blocked, dtype=np.uint8).reshape(shape) == 1)
+                    tables = tuple(array('h', plane.astype(np.int16).tobytes()) for plane in planes)
+                self._tables[padding] = tables
+        return tables
+
+    def search(self, start, goal, padding=0):
+        """Find the shortest 8-connected path from start to goal with JPS+.
+
+        Args:
+            start (tuple): (row, col) of the start cell
+            goal (tuple): (row, col) of the goal cell
+            padding (int): Cells within this chessboard distance of an obstacle are blocked
+
+        Returns:
+            SearchResult, with nodes_expanded counting jump points
+        """
+        grid = self.grid
+        blocked = grid.blocked(padding)
+        source = grid.index(*start)
+        target = grid.index(*goal)
+        if blocked[source] or blocked[target]:
+            return NO_PATH
+
+        tables = self.tables(padding)
+        g, parent, arrival, closed = self._buffers()
+
+        width = grid.width
+        row_of, col_of, octile = grid.row_of, grid.col_of, grid.octile
+        goal_row, goal_col = row_of[target], col_of[target]
+        h_row = [abs(row - goal_row) * width for row in range(grid.rows + 2)]
+        h_col = [abs(col - goal_col) for col in range(width)]
+        offsets, costs, successors = self.offsets, self.costs, self.successors
+        shift, mask = grid._shift, grid._mask
+
+        g[source] = 0
+        arrival[source] = START
+        open_set = [(octile[h_row[row_of[source]] + h_col[col_of[source]]] << shift) | source]
+        expanded = []  # Cells in the order they were closed
+        expand = expanded.append
+        peak = 1
+
+        while open_set:
+            current = heappop(open_set) & mask
+            if closed[current]:
+                continue
+            if current == target:
+                result = SearchResult(self._trace(parent, source, target), g[target] / ORTHOGONAL_COST,
+                                      len(expanded), peak)
+                grid._release(expanded, open_set, target)
+                return result
+            closed[current] = 1
+            expand(current)
+
+            natural, forced = successors[arrival[current]]
+            directions = natural
+            for blocked_offset, free_offset, direction in forced:
+                if blocked[current + blocked_offset] and not blocked[current + free_offset]:
+                    directions = directions + (direction,)
+
+            g_current = g[current]
+            d_row = goal_row - row_of[current]
+            d_col = goal_col - col_of[current]
+            for direction in directions:
+                jump = tables[direction][current]
+                step_row, step_col = DIRECTIONS[direction]
+                reach = jump if jump > 0 else -jump
+
+                # Stop early when the goal, or the goal's row or column, lies on this jump
+                if step_row == 0 or step_col == 0:
+                    if step_row == 0:
+                        steps = d_col * step_col if d_row == 0 else 0
+                    else:
+                        steps = d_row * step_row if d_col == 0 else 0
+                    if 0 < steps <= reach:
+                        jump = steps
+                    elif jump <= 0:
+                        continue
+                else:
+                    steps = min(d_row * step_row, d_col * step_col)
+                    if 0 < steps <= reach:
+                        jump = steps
+                    elif jump <= 0:
+                        continue
+
+                successor = current + offsets[direction] * jump
+                if closed[successor]:
+                    continue
+                tentative = g_current + costs[direction] * jump
+                if tentative < g[successor]:
+                    g[successor] = tentative
+                    parent[successor] = current
+                    arrival[successor] = direction
+                    f = tentative + octile[h_row[row_of[successor]] + h_col[col_of[successor]]]
+                    heappush(open_set, (f << shift) | successor)
+            if len(open_set) > peak:
+                peak = len(open_set)
+
+        grid._release(expanded, open_set, target)
+        return SearchResult([], None, len(expanded), peak)
+
+    def _trace(self, parent, source, target):
+        """Expand the chain of jump points into every cell along the path."""
+        jump_points = [target]
+        while jump_points[-1] != source:
+            jump_points.append(parent[jump_points[-1]])
+        jump_points.reverse()
+
+        cell = self.grid.cell
+        path = [cell(source)]
+        for previous, current in zip(jump_points, jump_points[1:]):
+            (from_row, from_col), (to_row, to_col) = cell(previous), cell(current)
+            step_row = (to_row > from_row) - (to_row < from_row)
+            step_col = (to_col > from_col) - (to_col < from_col)
+            for i in range(1, max(abs(to_row - from_row), abs(to_col - from_col)) + 1):
+                path.append((from_row + i * step_row, from_col + i * step_col))
+        return path
+
+    def _buffers(self):
+        # The grid's buffers, which searches hand back with GridSearch._release, plus the
+        # direction each cell was reached from, only read where g is set
+        local = self._local
+        if not hasattr(local, 'arrival'):
+            local.arrival = bytearray(self.grid.size)
+        g, parent, closed = self.grid._buffers()
+        return g, parent, local.arrival, closed
+
+
+def main():
+    """Precompute JPS+ tables for a grid config and store them alongside it."""
+    from routing_engine.distance_transform import obstacle_distance
+    from routing_engine.map_bundle import load_config
+    from routing_engine.search import GridSearch
+
+    parser = argparse.ArgumentParser(description="Precompute JPS+ jump tables for a grid config.")
+    parser.add_argument("grid_config", help="Path to grid_config.json or a map bundle")
+    parser.add_argument("--padding", type=int, action='append',
+                        help="Padding level to precompute, may be repeated (default: 2 and 0)")
+    parser.add_argument("--output", help="Output .npz path (default: <grid_config>.jps.npz)")
+    args = parser.parse_args()
+
+    config = load_config(args.grid_config)
+    engine = GridSearch(obstacle_distance(config['grid']))
+    shape = (engine.rows + 2, engine.width)
+
+    tables, checksums = {}, {}
+    for padding in args.padding or [2, 0]:
+        blocked = engine.blocked(padding)
+        tables[padding] = build_jump_tables(np.frombuffer(blocked, dtype=np.uint8).reshape(shape) == 1)
+        checksums[padding] = mask_checksum(blocked)
+
+    output = args.output or args.grid_config.rsplit('.', 1)[0] + '.jps.npz'
+    save_jump_tables(output, tables, checksums)
+    print(f"Saved jump tables for padding {sorted(tables)} to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""
+A* with landmark (ALT) lower bounds from precomputed distance tables
+"""
+import argparse
+import io
+import logging
+import threading
+from array import array
+from heapq import heappop, heappush
+
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+
+from routing_engine.components import component_labels
+from routing_engine.hpa import grid_graph
+from routing_engine.jps import mask_checksum
+from routing_engine.search import ORTHOGONAL_COST, SearchResult, NO_PATH
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LANDMARKS = 16
+# Landmarks used by a single query, picked for the best bound between its start and goal
+ACTIVE_LANDMARKS = 2
+# Table value of cells a landmark cannot reach
+UNREACHABLE = np.iinfo(np.uint16).max
+
+
+def build_landmark_tables(blocked, count=DEFAULT_LANDMARKS):
+    """Pick landmarks by farthest-point selection and tabulate their exact distances.
+
+    Landmarks are spread over the largest walkable region: each new one is the
+    cell farthest from all landmarks picked so far, which puts them on the
+    edges of the map where the triangle inequality gives the tightest bounds.
+
+    Args:
+        blocked (np.ndarray): 2D bool array, True for cells that cannot be entered
+        count (int): Number of landmarks
+
+    Returns:
+        tuple: (landmarks, tables, scale) where landmarks is an int32 (count, 2)
+            array of cells, tables a uint16 (count, rows, cols) array of distances
+            in units of scale search-cost units, UNREACHABLE where there is no path
+    """
+    free = ~np.asarray(blocked, dtype=bool)
+    rows, cols = free.shape
+    labels = component_labels(~free)
+    if not labels.any():
+        return np.zeros((0, 2), dtype=np.int32), np.zeros((0, rows, cols), dtype=np.uint16), 1
+    largest = np.argmax(np.bincount(labels.ravel())[1:]) + 1
+
+    graph = grid_graph(free)
+    seed = int(np.flatnonzero(labels.ravel() == largest)[0])
+    nearest = dijkstra(graph, directed=False, indices=seed)
+    landmarks, distances = [], []
+    for _ in range(count):
+        candidates = np.where(np.isfinite(nearest), nearest, -1)
+        landmark = int(np.argmax(candidates))
+        if candidates[landmark] <= 0 and landmarks:
+            break  # Every cell of the region already is a landmark
+        row_distances = dijkstra(graph, directed=False, indices=landmark)
+        landmarks.append(divmod(landmark, cols))
+        distances.append(row_distances)
+        nearest = row_distances if len(landmarks) == 1 else np.minimum(nearest, row_distances)
+
+    distances = np.array(distances)
+    finite = np.isfinite(distances)
+    scale = max(1, int(np.ceil(distances[finite].max() / (UNREACHABLE - 1)))) if finite.any() else 1
+    tables = np.full(distances.shape, UNREACHABLE, dtype=np.uint16)
+    tables[finite] = np.round(distances[finite] / scale).astype(np.uint16)
+    return np.array(landmarks, dtype=np.int32), tables.reshape(-1, rows, cols), scale
+
+
+def save_landmark_tables(file, tables_by_padding, checksums):
+    """Write landmark tables for several padding levels to an .npz file or file object."""
+    arrays = {}
+    for padding, (landmarks, tables, scale) in tables_by_padding.items():
+        arrays[f'landmarks_{padding}'] = landmarks
+        arrays[f'tables_{padding}'] = tables
+        arrays[f'scale_{padding}'] = np.array(scale, dtype=np.int64)
+        arrays[f'checksum_{padding}'] = np.array(checksums[padding], dtype=np.uint32)
+    np.savez_compressed(file, **arrays)
+
+
+def load_landmark_tables(data):
+    """Read landmark tables written by save_landmark_tables.
+
+    Returns:
+        dict: padding -> ((landmarks, tables, scale), checksum)
+    """
+    loaded = {}
+    with np.load(io.BytesIO(data)) as archive:
+        for name in archive.files:
+            if name.startswith('tables_'):
+                padding = int(name[len('tables_'):])
+                loaded[padding] = ((archive[f'landmarks_{padding}'], archive[name], int(archive[f'scale_{padding}'])),
+                                   int(archive[f'checksum_{padding}']))
+    return loaded
+
+
+class LandmarkSearch:
+    """A* over a GridSearch grid with the ALT heuristic.
+
+    For a landmark L the triangle inequality gives |d(L, goal) - d(L, n)| as a
+    lower bound on d(n, goal). Around long buildings this is far tighter than
+    the octile distance, so detour-heavy routes expand far fewer nodes. Each
+    query uses the few landmarks with the best bound between its start and
+    goal, together with the octile distance.
+
+    Tables are stored as uint16 multiples of a scale, so bounds are lowered by
+    one scale step to stay admissible. Nodes are reopened when a cheaper path
+    reaches them, which keeps paths shortest despite that rounding.
+    """
+
+    def __init__(self, grid_search, stored_tables=None, count=DEFAULT_LANDMARKS):
+        """
+        Args:
+            grid_search (GridSearch): Engine whose grid, blocked masks and buffers are used
+            stored_tables (dict): Optional padding -> ((landmarks, tables, scale), checksum)
+                from load_landmark_tables
+            count (int): Number of landmarks when tables are built here
+        """
+        self.grid = grid_search
+        self.count = count
+        self._stored = stored_tables or {}
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def tables(self, padding):
+        """Landmark cells, flat distance tables and scale for a padding level.
+
+        Stored tables are used when their checksum matches the current blocked
+        mask, otherwise they are computed from the grid, which takes a few seconds.
+        """
+        entry = self._tables.get(padding)
+        if entry is not None:
+            return entry
+
+        with self._lock:
+            entry = self._tables.get(padding)
+            if entry is None:
+                grid = self.grid
+                blocked = grid.blocked(padding)
+                stored = self._stored.get(padding)
+                if stored is not None and stored[1] == mask_checksum(blocked) \
+                        and stored[0][1].shape[1:] == (grid.rows, grid.cols):
+                    landmarks, tables, scale = stored[0]
+                else:
+                    logger.warning("Building landmark tables for padding %s; precompute them with "
+                                   "python -m routing_engine.landmarks to avoid this", padding)
+                    shape = (grid.rows + 2, grid.width)
+                    mask = np.frombuffer(blocked, dtype=np.uint8).reshape(shape)[1:-1, 1:-1] == 1
+                    landmarks, tables, scale = build_landmark_tables(mask, self.count)
+
+                # Re-index the tables like the bordered grid so they are read with search indices
+                flat = []
+                for table in tables:
+                    bordered = np.full((grid.rows + 2, grid.width), UNREACHABLE, dtype=np.uint16)
+                    bordered[1:-1, 1:-1] = table
+                    flat.append(array('H', bordered.tobytes()))
+                entry = ([tuple(cell) for cell in np.asarray(landmarks).tolist()], flat, int(scale))
+                self._tables[padding] = entry
+        return entry
+
+    def search(self, start, goal, padding=0):
+        """Find the shortest 8-connected path from start to goal.
+
+        Args:
+            start (tuple): (row, col) of the start cell
+            goal (tuple): (row, col) of the goal cell
+            padding (int): Cells within this chessboard distance of an obstacle are blocked
+
+        Returns:
+            SearchResult
+        """
+        grid = self.grid
+        blocked = grid.blocked(padding)
+        source = grid.index(*start)
+        target = grid.index(*goal)
+        if blocked[source] or blocked[target]:
+            return NO_PATH
+
+        _, tables, scale = self.tables(padding)
+        active = self._active(tables, source, target)
+
+        g, parent, closed = grid._buffers()
+
+        row_of, col_of, octile = grid.row_of, grid.col_of, grid.octile
+        goal_row, goal_col = row_of[target], col_of[target]
+        width = grid.width
+        h_row = [abs(row - goal_row) * width for row in range(grid.rows + 2)]
+        h_col = [abs(col - goal_col) for col in range(width)]
+        steps = grid.steps
+        shift, mask = grid._shift, grid._mask
+
+        def heuristic(cell):
+            bound = octile[h_row[row_of[cell]] + h_col[col_of[cell]]]
+            for table, to_goal in active:
+                landmark_bound = (abs(to_goal - table[cell]) - 1) * scale
+                if landmark_bound > bound:
+                    bound = landmark_bound
+            return bound
+
+        g[source] = 0
+        open_set = [(heuristic(source) << shift) | source]
+        expanded = []  # Cells in the order they were closed
+        expand = expanded.append
+        peak = 1
+
+        while open_set:
+            current = heappop(open_set) & mask
+            if closed[current]:
+                continue  # Stale entry superseded by a cheaper one
+            if current == target:
+                result = SearchResult(grid._trace(parent, source, target), g[target] / ORTHOGONAL_COST,
+                                      len(expanded), peak)
+                grid._release(expanded, open_set, target)
+                return result
+            closed[current] = 1
+            expand(current)
+
+            g_current = g[current]
+            for offset, step in steps:
+                neighbor = current + offset
+                if blocked[neighbor]:
+                    continue
+                tentative = g_current + step
+                if tentative < g[neighbor]:
+                    g[neighbor] = tentative
+                    parent[neighbor] = current
+                    closed[neighbor] = 0
+                    heappush(open_set, ((tentative + heuristic(neighbor)) << shift) | neighbor)
+            if len(open_set) > peak:
+                peak = len(open_set)
+
+        grid._release(expanded, open_set, target)
+        return SearchResult([], None, len(expanded), peak)
+
+    def _active(self, tables, source, target):
+        """The landmarks with the best lower bound between source and target."""
+        bounds = []
+        for table in tables:
+            from_source, to_goal = table[source], table[target]
+            if from_source != UNREACHABLE and to_goal != UNREACHABLE:
+                bounds.append((abs(to_goal - from_source), table, to_goal))
+        bounds.sort(key=lambda bound: bound[0], reverse=True)
+        return [(table, to_goal) for _, table, to_goal in bounds[:ACTIVE_LANDMARKS]]
+
+
+def main():
+    """Precompute landmark tables for a grid config and store them alongside it."""
+    from routing_engine.distance_transform import obstacle_distance
+    from routing_engine.map_bundle import load_config
+    from routing_engine.search import GridSearch
+
+    parser = argparse.ArgumentParser(description="Precompute ALT landmark tables for a grid config.")
+    parser.add_argument("grid_config", help="Path to grid_config.json or a map bundle")
+    parser.add_argument("--padding", type=int, action='append',
+                        help="Padding level to precompute, may be repeated (default: 2 and 0)")
+    parser.add_argument("--landmarks", type=int, default=DEFAULT_LANDMARKS,
+                        help=f"Number of landmarks (default: {DEFAULT_LANDMARKS})")
+    parser.add_argument("--output", help="Output .npz path (default: <grid_config>.alt.npz)")
+    args = parser.parse_args()
+
+    config = load_config(args.grid_config)
+    engine = GridSearch(obstacle_distance(config['grid']))
+    shape = (engine.rows + 2, engine.width)
+
+    tables, checksums = {}, {}
+    for padding in args.padding or [2, 0]:
+        blocked = engine.blocked(padding)
+        mask = np.frombuffer(blocked, dtype=np.uint8).reshape(shape)[1:-1, 1:-1] == 1
+        tables[padding] = build_landmark_tables(mask, args.landmarks)
+        checksums[padding] = mask_checksum(blocked)
+
+    output = args.output or args.grid_config.rsplit('.', 1)[0] + '.alt.npz'
+    save_landmark_tables(output, tables, checksums)
+    print(f"Saved {args.landmarks} landmarks for padding {sorted(tables)} to {output}")
+
+
+if __name__ == '__main__':
+    main()
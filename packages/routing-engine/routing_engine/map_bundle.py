@@ -0,0 +1,224 @@
+"""
+Versioned binary map bundle: the grid and its layers as memory-mappable arrays
+"""
+import argparse
+import json
+import mmap
+import struct
+import zlib
+
+import numpy as np
+
+from routing_engine.estimates import cell_size
+
+MAGIC = b'CNMB'
+FORMAT_VERSION = 2
+
+# magic, format version, layer count, rows, cols, lat_min, lat_max, lng_min, lng_max,
+# cell size in metres, crc32 of the rest of the header and everything after it
+_HEADER = struct.Struct('<4sHHIIdddddI')
+_CHECKSUM = struct.Struct('<I')
+# name, numpy dtype string, byte offset from the start of the file, byte length
+_LAYER = struct.Struct('<16s4sQQ')
+# Layer payloads start on cache-line boundaries
+_ALIGNMENT = 64
+
+# Layers a bundle may carry, with their widest dtype. Only obstacles is required.
+# A layer whose values all fit in a byte is stored as uint8.
+LAYER_DTYPES = {
+    'obstacles': '|u1',  # 1 for cells inside a building
+    'entrances': '|u1',  # 1 for entrance cells
+    'hallways': '|u1',   # 1 for hallway cells
+    'cost': '|u1',       # Relative cost of walking through a cell
+    'distance': '<u2',   # Chessboard distance to the nearest obstacle (see obstacle_distance)
+}
+# Grid config keys of the layers that have a different name in a bundle
+_CONFIG_KEYS = {'obstacles': 'grid'}
+
+
+def encode_bundle(rows, cols, bounds, cell_meters, layers):
+    """Serialize a map into the bundle format.
+
+    Args:
+        rows (int): Grid rows
+        cols (int): Grid columns
+        bounds (tuple): (lat_min, lat_max, lng_min, lng_max)
+        cell_meters (float): Cell edge length in metres
+        layers (dict): Layer name -> 2D array of shape (rows, cols)
+
+    Returns:
+        bytes
+
+    Raises:
+        ValueError: If a layer is unknown, obstacles is missing, or a layer is not rows x cols
+    """
+    if 'obstacles' not in layers:
+        raise ValueError("A map bundle needs an obstacles layer")
+    arrays = []
+    for name, layer in layers.items():
+        if name not in LAYER_DTYPES:
+            raise ValueError(f"Unknown layer {name!r}; choose from {sorted(LAYER_DTYPES)}")
+        values = np.asarray(layer)
+        if values.shape != (rows, cols):
+            raise ValueError(f"Layer {name!r} is {values.shape[0]}x{values.shape[1]} but the map is {rows}x{cols}")
+        dtype = np.dtype(LAYER_DTYPES[name])
+        low, high = (int(values.min()), int(values.max())) if values.size else (0, 0)
+        if low < 0 or high > np.iinfo(dtype).max:
+            raise ValueError(f"Layer {name!r} holds values from {low} to {high}, which do not fit {dtype.name}")
+        if high <= np.iinfo(np.uint8).max:
+            dtype = np.dtype('|u1')
+        arrays.append((name, np.ascontiguousarray(values, dtype=dtype)))
+
+    offset = _HEADER.size + _LAYER.size * len(arrays)
+    table, payload = bytearray(), bytearray()
+    for name, array in arrays:
+        start = -(-(offset + len(payload)) // _ALIGNMENT) * _ALIGNMENT
+        payload.extend(bytes(start - offset - len(payload)))
+        table.extend(_LAYER.pack(name.encode('ascii'), array.dtype.str.encode('ascii'), start, array.nbytes))
+        payload.extend(array.tobytes())
+
+    body = bytes(table + payload)
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, len(arrays), rows, cols, *bounds, cell_meters, 0)
+    return header[:-_CHECKSUM.size] + _CHECKSUM.pack(_checksum(header, body)) + body
+
+
+def _checksum(header, body):
+    # Covers the header up to its checksum field, then everything after the header
+    return zlib.crc32(body, zlib.crc32(header[:_HEADER.size - _CHECKSUM.size]))
+
+
+def bundle_from_config(config, crop=False, distance=None):
+    """Convert a grid_config.json dict into a bundle.
+
+    Args:
+        config (dict): Parsed grid config with rows, cols, bounds, grid and optional layers
+        crop (bool): Trim layers that are larger than rows x cols instead of rejecting them
+        distance (np.ndarray): Optional obstacle distance transform to store with the grid
+
+    Returns:
+        bytes
+    """
+    rows, cols = config['rows'], config['cols']
+    layers = {}
+    for name in LAYER_DTYPES:
+        key = _CONFIG_KEYS.get(name, name)
+        if key in config:
+            layers[name] = np.asarray(config[key])
+    if distance is not None:
+        layers['distance'] = distance
+    if crop:
+        layers = {name: layer[:rows, :cols] for name, layer in layers.items()}
+
+    bounds = (config['lat_min'], config['lat_max'], config['lng_min'], config['lng_max'])
+    return encode_bundle(rows, cols, bounds, cell_size(config), layers)
+
+
+def read_bundle(source):
+    """Open a bundle from a file path (memory-mapped) or from bytes.
+
+    Returns:
+        MapBundle
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as file:
+            return MapBundle(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+    return MapBundle(source)
+
+
+def load_config(path):
+    """Read a grid config from a map bundle or a grid_config.json file."""
+    with open(path, 'rb') as file:
+        if is_bundle(file.read(len(MAGIC))):
+            return read_bundle(path).config()
+        file.seek(0)
+        return json.loads(file.read())
+
+
+def is_bundle(data):
+    """Whether bytes start like a map bundle."""
+    return data[:len(MAGIC)] == MAGIC
+
+
+class MapBundle:
+    """A map bundle whose layers are numpy views of the underlying buffer.
+
+    Reading a memory-mapped bundle copies nothing: layers are paged in from
+    the file as they are used and shared between processes.
+    """
+
+    def __init__(self, buffer):
+        """
+        Args:
+            buffer: bytes or mmap holding a bundle written by encode_bundle
+
+        Raises:
+            ValueError: If the buffer is not a bundle of this version, is
+                truncated or corrupted, or a layer does not match the map's dimensions
+        """
+        if len(buffer) < _HEADER.size:
+            raise ValueError("Map bundle is truncated")
+        magic, version, count, rows, cols, lat_min, lat_max, lng_min, lng_max, cell_meters, checksum = \
+            _HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError("Not a map bundle")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Map bundle format {version} is not supported (expected {FORMAT_VERSION})")
+        view = memoryview(buffer)
+        if _checksum(view[:_HEADER.size], view[_HEADER.size:]) != checksum:
+            raise ValueError("Map bundle checksum does not match its contents")
+
+        self.buffer = buffer
+        self.rows = rows
+        self.cols = cols
+        self.bounds = (lat_min, lat_max, lng_min, lng_max)
+        self.cell_size = cell_meters
+        self.layers = {}
+        for i in range(count):
+            name, dtype, offset, nbytes = _LAYER.unpack_from(buffer, _HEADER.size + i * _LAYER.size)
+            name, dtype = name.rstrip(b'\0').decode('ascii'), np.dtype(dtype.rstrip(b'\0').decode('ascii'))
+            if nbytes != rows * cols * dtype.itemsize or offset + nbytes > len(buffer):
+                raise ValueError(f"Layer {name!r} holds {nbytes} bytes, which does not fit a {rows}x{cols} map")
+            self.layers[name] = np.frombuffer(buffer, dtype=dtype, count=rows * cols, offset=offset).reshape(rows, cols)
+        if 'obstacles' not in self.layers:
+            raise ValueError("Map bundle has no obstacles layer")
+
+    def config(self):
+        """The bundle as a grid config dict, with layers as read-only arrays instead of lists."""
+        lat_min, lat_max, lng_min, lng_max = self.bounds
+        config = {'rows': self.rows, 'cols': self.cols, 'lat_min': lat_min, 'lat_max': lat_max,
+                  'lng_min': lng_min, 'lng_max': lng_max, 'cell_size': self.cell_size}
+        for name, layer in self.layers.items():
+            config[_CONFIG_KEYS.get(name, name)] = layer
+        return config
+
+
+def main():
+    """Convert a grid_config.json into a map bundle."""
+    from routing_engine.distance_transform import obstacle_distance
+
+    parser = argparse.ArgumentParser(description="Convert a grid config to a binary map bundle.")
+    parser.add_argument("grid_config", help="Path to grid_config.json")
+    parser.add_argument("--crop", action='store_true',
+                        help="Trim layers larger than rows x cols instead of failing")
+    parser.add_argument("--distance", action='store_true',
+                        help="Store the obstacle distance transform too, instead of computing it on load")
+    parser.add_argument("--output", help="Output path (default: <grid_config>.bundle)")
+    args = parser.parse_args()
+
+    with open(args.grid_config, 'r', encoding='utf-8') as file:
+        config = json.load(file)
+    grid = np.asarray(config['grid'], dtype=np.uint8)
+    if grid.shape != (config['rows'], config['cols']) and not args.crop:
+        parser.error(f"grid is {grid.shape[0]}x{grid.shape[1]} but rows/cols say "
+                     f"{config['rows']}x{config['cols']}; fix the config or pass --crop")
+    distance = obstacle_distance(grid[:config['rows'], :config['cols']]) if args.distance else None
+
+    data = bundle_from_config(config, crop=args.crop, distance=distance)
+    output = args.output or args.grid_config.rsplit('.', 1)[0] + '.bundle'
+    with open(output, 'wb') as file:
+        file.write(data)
+    print(f"Saved {config['rows']}x{config['cols']} map bundle ({len(data) / 1e3:.0f} KB) to {output}")
+
+
+if __name__ == '__main__':
+    main()
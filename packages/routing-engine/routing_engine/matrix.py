@@ -0,0 +1,76 @@
+"""
+Many-to-many walking distances with one Dijkstra search per source
+"""
+import threading
+
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+
+from routing_engine.hpa import grid_graph
+from routing_engine.search import ORTHOGONAL_COST
+
+class DistanceMatrix:
+    """Shortest walking distances between sets of cells of one map version.
+
+    Each source runs a single Dijkstra search that reaches every other cell at
+    once, instead of one A* search per pair. The searches run in scipy's
+    compiled csgraph code over a sparse graph of the grid, built once per
+    padding level, with the same step costs as GridSearch.
+    """
+
+    def __init__(self, obstacle_distance, components):
+        """
+        Args:
+            obstacle_distance (np.ndarray): Obstacle distance transform of the grid
+            components (ComponentIndex): Reachability labels, used to pick each pair's padding level
+        """
+        self.obstacle_distance = obstacle_distance
+        self.components = components
+        self._graphs = {}
+        self._lock = threading.Lock()
+
+    def graph(self, padding):
+        """Sparse step-cost graph of the cells walkable at a padding level."""
+        graph = self._graphs.get(padding)
+        if graph is None:
+            with self._lock:
+                graph = self._graphs.get(padding)
+                if graph is None:
+                    graph = grid_graph(self.obstacle_distance > padding)
+                    self._graphs[padding] = graph
+        return graph
+
+    def lengths(self, cells, paddings):
+        """Path lengths between every pair of cells.
+
+        Each pair is measured at the first padding level in paddings at which
+        its cells are connected, like single routes. Since paths are symmetric,
+        only the sources that still have a pair left at a padding level are searched.
+
+        Args:
+            cells (list): (row, col) cells
+            paddings (tuple): Padding levels in order of preference
+
+        Returns:
+            list: N x N nested lists of path lengths in cells, None where no path exists
+        """
+        count = len(cells)
+        lengths = [[None] * count for _ in range(count)]
+        cols = self.obstacle_distance.shape[1]
+        ids = [row * cols + col for row, col in cells]
+
+        pending = {}
+        for i in range(count):
+            lengths[i][i] = 0.0
+            for j in range(i + 1, count):
+                padding = self.components.first_connected_padding(cells[i], cells[j], paddings)
+                if padding is not None:
+                    pending.setdefault(padding, {}).setdefault(i, []).append(j)
+
+        for padding, pairs in pending.items():
+            sources = sorted(pairs)
+            costs = dijkstra(self.graph(padding), directed=False, indices=[ids[i] for i in sources])
+            for source_costs, i in zip(costs, sources):
+                for j in pairs[i]:
+                    lengths[i][j] = lengths[j][i] = float(source_costs[ids[j]]) / ORTHOGONAL_COST
+        return lengths
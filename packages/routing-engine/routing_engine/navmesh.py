@@ -0,0 +1,243 @@
+"""
+Any-angle routing on a navigation mesh of the free space between buildings
+"""
+import io
+import math
+from heapq import heappop, heappush
+
+import numpy as np
+
+# Tolerance of the point-in-triangle test, in metres
+_EPSILON = 1e-7
+
+
+def load_navmesh(data):
+    """Read a mesh written by data-processing/build_navmesh.py.
+
+    Returns:
+        NavMesh: With the grid_checksum of the grid it was built for, None for older meshes
+    """
+    with np.load(io.BytesIO(data)) as archive:
+        checksum = int(archive['grid_checksum']) if 'grid_checksum' in archive.files else None
+        return NavMesh(archive['vertices'], archive['triangles'], archive['neighbors'],
+                       archive['to_utm'], archive['to_lat_lng'], checksum)
+
+
+def _cross(origin, a, b):
+    """Twice the signed area of (origin, a, b); positive when b is left of origin -> a."""
+    return (a[0] - origin[0]) * (b[1] - origin[1]) - (b[0] - origin[0]) * (a[1] - origin[1])
+
+
+def string_pull(start, goal, portals):
+    """Shortest path through a channel of portals (the simple stupid funnel algorithm).
+
+    Args:
+        start (tuple): (x, y) of the start point
+        goal (tuple): (x, y) of the goal point
+        portals (list): (left, right) point pairs of the edges crossed, in order
+
+    Returns:
+        list: (x, y) points from start to goal, turning only at portal endpoints
+    """
+    portals = [(start, start)] + list(portals) + [(goal, goal)]
+    path = [start]
+    apex = left = right = start
+    apex_index = left_index = right_index = 0
+
+    i = 1
+    while i < len(portals):
+        new_left, new_right = portals[i]
+
+        # Narrow the funnel from the right, unless that crosses over the left side
+        if _cross(apex, right, new_right) >= 0:
+            if apex in (left, right) or _cross(apex, left, new_right) < 0:
+                right, right_index = new_right, i
+            else:
+                path.append(left)
+                apex, apex_index = left, left_index
+                right, right_index = apex, apex_index
+                i = apex_index + 1
+                continue
+
+        # Narrow the funnel from the left, unless that crosses over the right side
+        if _cross(apex, left, new_left) <= 0:
+            if apex in (left, right) or _cross(apex, right, new_left) > 0:
+                left, left_index = new_left, i
+            else:
+                path.append(right)
+                apex, apex_index = right, right_index
+                left, left_index = apex, apex_index
+                i = apex_index + 1
+                continue
+
+        i += 1
+
+    if path[-1] != goal:
+        path.append(goal)
+    return path
+
+
+class NavMesh:
+    """Triangulated free space in UTM metres, with lat/lng conversion.
+
+    Queries locate the triangles of both points, run A* over triangle
+    adjacency (entering each triangle at the midpoint of the crossed edge),
+    and pull the path taut through the crossed edges. The result is an
+    any-angle polyline whose size does not depend on any grid resolution.
+    It is the shortest path within the chosen channel of triangles, which is
+    near-shortest overall since A* only estimates the cost of each triangle.
+    """
+
+    def __init__(self, vertices, triangles, neighbors, to_utm, to_lat_lng, grid_checksum=None):
+        """
+        Args:
+            vertices (np.ndarray): (n, 2) UTM x/y of the mesh vertices
+            triangles (np.ndarray): (m, 3) vertex indices of each triangle
+            neighbors (np.ndarray): (m, 3) triangle across from each vertex, -1 at walls
+            to_utm (np.ndarray): (2, 3) affine map from (lng, lat, 1) to UTM (x, y)
+            to_lat_lng (np.ndarray): (2, 3) affine map from (x, y, 1) to (lng, lat)
+            grid_checksum (int): grid_checksum of the grid config the mesh was built for
+        """
+        self.grid_checksum = grid_checksum
+        self.vertices = np.asarray(vertices, dtype=np.float64)
+        self.triangles = np.asarray(triangles, dtype=np.int64)
+        self.neighbors = np.asarray(neighbors, dtype=np.int64)
+        self.to_utm = np.asarray(to_utm, dtype=np.float64)
+        self.to_lat_lng = np.asarray(to_lat_lng, dtype=np.float64)
+
+        corners = self.vertices[self.triangles]
+        self._origin = corners[:, 0]
+        self._edge_b = corners[:, 1] - corners[:, 0]
+        self._edge_c = corners[:, 2] - corners[:, 0]
+        self._determinant = self._edge_b[:, 0] * self._edge_c[:, 1] - self._edge_c[:, 0] * self._edge_b[:, 1]
+        self._centroids = corners.mean(axis=1)
+
+        # Walls are the edges opposite a vertex with no neighbour across it
+        wall_triangles, wall_sides = np.nonzero(self.neighbors < 0)
+        self._wall_triangles = wall_triangles
+        self._wall_a = corners[wall_triangles, (wall_sides + 1) % 3]
+        self._wall_b = corners[wall_triangles, (wall_sides + 2) % 3]
+
+        # Plain lists are faster than array indexing in the search loop
+        self._points = [tuple(point) for point in self.vertices.tolist()]
+        self._triangle_list = self.triangles.tolist()
+        self._neighbor_list = self.neighbors.tolist()
+
+    def __len__(self):
+        return len(self.triangles)
+
+    def lat_lng_to_utm(self, lat, lng):
+        x, y = self.to_utm @ (lng, lat, 1.0)
+        return float(x), float(y)
+
+    def utm_to_lat_lng(self, x, y):
+        lng, lat = self.to_lat_lng @ (x, y, 1.0)
+        return float(lat), float(lng)
+
+    def locate(self, point):
+        """Index of a triangle containing point, or -1 if it lies outside the mesh."""
+        offset = np.asarray(point, dtype=np.float64) - self._origin
+        with np.errstate(divide='ignore', invalid='ignore'):
+            u = (offset[:, 0] * self._edge_c[:, 1] - self._edge_c[:, 0] * offset[:, 1]) / self._determinant
+            v = (self._edge_b[:, 0] * offset[:, 1] - offset[:, 0] * self._edge_b[:, 1]) / self._determinant
+        inside = np.flatnonzero((u >= -_EPSILON) & (v >= -_EPSILON) & (u + v <= 1 + _EPSILON))
+        return int(inside[0]) if len(inside) else -1
+
+    def nearest(self, point):
+        """The closest point of the mesh to point and its triangle.
+
+        Returns:
+            tuple: ((x, y), triangle), the point itself when it is on the mesh,
+                or (None, -1) for an empty mesh
+        """
+        triangle = self.locate(point)
+        if triangle >= 0:
+            return tuple(point), triangle
+        if not len(self._wall_triangles):
+            return None, -1
+
+        point = np.asarray(point, dtype=np.float64)
+        wall = self._wall_b - self._wall_a
+        length = np.einsum('ij,ij->i', wall, wall)
+        t = np.clip(np.einsum('ij,ij->i', point - self._wall_a, wall) / np.maximum(length, _EPSILON), 0, 1)
+        closest = self._wall_a + t[:, None] * wall
+        i = int(np.argmin(np.einsum('ij,ij->i', closest - point, closest - point)))
+        return (float(closest[i, 0]), float(closest[i, 1])), int(self._wall_triangles[i])
+
+    def find_path(self, start, goal, start_triangle=None, goal_triangle=None):
+        """Any-angle path between two points on the mesh.
+
+        Args:
+            start (tuple): UTM (x, y) of the start point
+            goal (tuple): UTM (x, y) of the goal point
+            start_triangle (int): Triangle containing start, located if not given
+            goal_triangle (int): Triangle containing goal, located if not given
+
+        Returns:
+            list: UTM (x, y) points from start to goal, empty if they are not connected
+        """
+        start_triangle = self.locate(start) if start_triangle is None else start_triangle
+        goal_triangle = self.locate(goal) if goal_triangle is None else goal_triangle
+        if start_triangle < 0 or goal_triangle < 0:
+            return []
+        start, goal = tuple(start), tuple(goal)
+        if start_triangle == goal_triangle:
+            return [start, goal]
+
+        corridor = self._triangle_path(start, goal, start_triangle, goal_triangle)
+        if corridor is None:
+            return []
+        return string_pull(start, goal, self._portals(corridor))
+
+    def _triangle_path(self, start, goal, start_triangle, goal_triangle):
+        """A* over triangle adjacency; returns the triangles crossed or None."""
+        points, triangles, neighbors = self._points, self._triangle_list, self._neighbor_list
+        goal_x, goal_y = goal
+
+        g = {start_triangle: 0.0}
+        position = {start_triangle: start}
+        parent = {start_triangle: None}
+        closed = set()
+        open_set = [(math.hypot(start[0] - goal_x, start[1] - goal_y), start_triangle)]
+        while open_set:
+            _, current = heappop(open_set)
+            if current in closed:
+                continue
+            if current == goal_triangle:
+                corridor = []
+                while current is not None:
+                    corridor.append(current)
+                    current = parent[current]
+                corridor.reverse()
+                return corridor
+            closed.add(current)
+
+            x, y = position[current]
+            vertex = triangles[current]
+            for side, neighbor in enumerate(neighbors[current]):
+                if neighbor < 0 or neighbor in closed:
+                    continue
+                a, b = points[vertex[(side + 1) % 3]], points[vertex[(side + 2) % 3]]
+                entry = ((a[0] + b[0]) / 2, (a[1] + b[1]) / 2)
+                tentative = g[current] + math.hypot(entry[0] - x, entry[1] - y)
+                if neighbor == goal_triangle:
+                    tentative += math.hypot(goal_x - entry[0], goal_y - entry[1])
+                if tentative < g.get(neighbor, math.inf):
+                    g[neighbor] = tentative
+                    position[neighbor] = entry
+                    parent[neighbor] = current
+                    heappush(open_set, (tentative + math.hypot(goal_x - entry[0], goal_y - entry[1]), neighbor))
+        return None
+
+    def _portals(self, corridor):
+        """(left, right) endpoints of the edges between consecutive triangles."""
+        points, triangles, neighbors = self._points, self._triangle_list, self._neighbor_list
+        portals = []
+        for current, following in zip(corridor, corridor[1:]):
+            side = neighbors[current].index(following)
+            vertex = triangles[current]
+            a, b = points[vertex[(side + 1) % 3]], points[vertex[(side + 2) % 3]]
+            # Seen from inside the current triangle, the vertex on its side is behind the edge
+            behind = points[vertex[side]]
+            portals.append((a, b) if _cross(behind, b, a) > 0 else (b, a))
+        return portals
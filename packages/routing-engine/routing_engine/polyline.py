@@ -0,0 +1,96 @@
+"""
+Turn-point simplification of grid paths and encoded polyline output
+"""
+
+# Decimal places kept by encoded polylines: 5 is about 1 m, finer than a 2 m grid cell
+DEFAULT_PRECISION = 5
+
+
+def simplify_path(grid_search, path, padding):
+    """Keep only the cells of a path where it has to turn (line-of-sight string pulling).
+
+    From each kept cell the path jumps to the farthest later cell that can be
+    reached in a straight line through free cells, so the result is never
+    longer than the input and stays clear of obstacles at the same padding.
+    Only cells where the grid path changes direction are tried, since a
+    straight run between them adds nothing.
+
+    Args:
+        grid_search (GridSearch): Engine whose blocked masks are checked
+        path (list): (row, col) cells from a search
+        padding (int): Padding level the path was found at
+
+    Returns:
+        list: (row, col) cells, the first and last cell of path included
+    """
+    if len(path) <= 2:
+        return list(path)
+
+    # The grid path's own corners, which are the only candidates for a turn
+    corners = [path[0]]
+    for previous, current, following in zip(path, path[1:], path[2:]):
+        if (current[0] - previous[0], current[1] - previous[1]) != \
+                (following[0] - current[0], following[1] - current[1]):
+            corners.append(current)
+    corners.append(path[-1])
+
+    blocked = grid_search.blocked(padding)
+    kept = [corners[0]]
+    anchor = 0
+    while anchor < len(corners) - 1:
+        # Neighbouring corners are always connected by a straight run of the path
+        following = anchor + 1
+        while following + 1 < len(corners) and \
+                grid_search.line_of_sight(blocked, corners[anchor], corners[following + 1]):
+            following += 1
+        kept.append(corners[following])
+        anchor = following
+    return kept
+
+
+def encode_polyline(points, precision=DEFAULT_PRECISION):
+    """Encode (lat, lng) points with Google's encoded polyline algorithm.
+
+    Args:
+        points (list): (lat, lng) pairs
+        precision (int): Decimal places kept, 5 for the common polyline format
+
+    Returns:
+        str
+    """
+    factor = 10 ** precision
+    chunks = []
+    previous_lat = previous_lng = 0
+    for lat, lng in points:
+        lat, lng = int(round(lat * factor)), int(round(lng * factor))
+        for delta in (lat - previous_lat, lng - previous_lng):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        previous_lat, previous_lng = lat, lng
+    return ''.join(chunks)
+
+
+def decode_polyline(encoded, precision=DEFAULT_PRECISION):
+    """Decode a string written by encode_polyline back into (lat, lng) points."""
+    factor = 10 ** precision
+    points = []
+    index = lat = lng = 0
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            shift = value = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                value |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(value >> 1) if value & 1 else value >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append((lat / factor, lng / factor))
+    return points
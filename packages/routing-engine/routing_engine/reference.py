@@ -0,0 +1,70 @@
+"""
+Reference A* over a 2D grid, the ground truth for every optimized engine
+"""
+import heapq
+import math
+
+from routing_engine.distance_transform import obstacle_distance
+
+# Padding used when none is given, the one the API serves by default
+DEFAULT_PADDING = 2
+
+
+def euclidean_distance(a, b):
+    """Calculate Euclidean distance between two points."""
+    return math.sqrt((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2)
+
+
+def a_star(grid, start, end, custom_padding=None, distance=None):
+    """Performs A* pathfinding algorithm to find the shortest path from start to end.
+
+    distance is the obstacle distance transform of grid as a list of rows. Passing
+    the per-map copy makes padding a threshold check instead of a padded grid rebuild.
+
+    Kept as the reference implementation that the engines are checked against
+    (see GridSearch in search.py, which returns paths of the same length).
+    """
+    # A cell is inside the padding when its distance to an obstacle is <= pad_value
+    pad_value = max(custom_padding if custom_padding is not None else DEFAULT_PADDING, 0)
+    if distance is None:
+        distance = obstacle_distance(grid).tolist()
+    
+    rows, cols = len(distance), len(distance[0])
+    
+    # Ensure start and end positions are not within padded areas
+    if distance[start[0]][start[1]] <= pad_value or distance[end[0]][end[1]] <= pad_value:
+        return []  # Start or end position is not traversable
+    
+    open_set = []  # Priority queue for A* search
+    heapq.heappush(open_set, (0, start))  # (cost, (x, y))
+    
+    came_from = {}  # Stores the path
+    g_score = {start: 0}  # Cost from start to current node
+    f_score = {start: euclidean_distance(start, end)}  # Estimated cost from start to end
+    
+    directions = [(-1, 0), (1, 0), (0, -1), (0, 1), (1, 1), (1, -1), (-1, 1), (-1, -1)]  # Up, Down, Left, Right, Diagonals
+    
+    while open_set:
+        _, current = heapq.heappop(open_set)
+        
+        if current == end:
+            path = []
+            while current in came_from:
+                path.append(current)
+                current = came_from[current]
+            path.append(start)
+            return path[::-1]  # Return reversed path
+        
+        for dx, dy in directions:
+            neighbor = (current[0] + dx, current[1] + dy)
+            
+            if 0 <= neighbor[0] < rows and 0 <= neighbor[1] < cols and distance[neighbor[0]][neighbor[1]] > pad_value:
+                tentative_g_score = g_score[current] + euclidean_distance(current, neighbor)
+                
+                if neighbor not in g_score or tentative_g_score < g_score[neighbor]:
+                    came_from[neighbor] = current
+                    g_score[neighbor] = tentative_g_score
+                    f_score[neighbor] = tentative_g_score + euclidean_distance(neighbor, end)
+                    heapq.heappush(open_set, (f_score[neighbor], neighbor))
+    
+    return []  # No path found
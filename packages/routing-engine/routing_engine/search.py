@@ -0,0 +1,429 @@
+"""
+Array-backed A* search over flat cell indices
+"""
+import threading
+from array import array
+from collections import namedtuple
+from heapq import heappop, heappush
+
+import numpy as np
+
+# Step costs are integers so g-scores, heuristics and heap keys stay plain ints.
+# One orthogonal step is ORTHOGONAL_COST, so a cost divided by it is a length in cells.
+ORTHOGONAL_COST = 10000
+DIAGONAL_COST = 14142
+
+# g-score of cells no search has reached
+UNREACHED = np.iinfo(np.int64).max
+
+SearchResult = namedtuple('SearchResult', ['path', 'cost', 'nodes_expanded', 'open_peak'])
+SearchResult.__doc__ = """Outcome of a search.
+
+path is a list of (row, col) cells from start to goal, empty if there is none.
+cost is the path length in cells, None when no path was found.
+"""
+
+NO_PATH = SearchResult([], None, 0, 0)
+
+
+class GridSearch:
+    """8-connected A* over one map version.
+
+    The grid is stored with a one-cell blocked border so neighbours never need a
+    bounds check, and every cell is addressed by its flat index in that bordered grid.
+    g-scores, parents and the closed set live in preallocated per-thread buffers
+    that a search hands back clean by resetting only the cells it wrote. Open-set entries are single ints
+    with the f-score in the high bits and the cell index in the low bits, which also
+    breaks ties in row-major order like the tuple heap it replaces.
+    """
+
+    def __init__(self, distance, tables=None):
+        """
+        Args:
+            distance (np.ndarray): Obstacle distance transform of the grid (see obstacle_distance)
+            tables (dict): Optional arrays from tables() to read in place instead of building
+                private copies, e.g. views of a shared memory block
+        """
+        rows, cols = distance.shape
+        self.rows = rows
+        self.cols = cols
+        self.width = cols + 2
+        self.size = (rows + 2) * self.width
+
+        width = self.width
+        self.steps = (
+            (-width, ORTHOGONAL_COST), (width, ORTHOGONAL_COST),
+            (-1, ORTHOGONAL_COST), (1, ORTHOGONAL_COST),
+            (width + 1, DIAGONAL_COST), (width - 1, DIAGONAL_COST),
+            (-width + 1, DIAGONAL_COST), (-width - 1, DIAGONAL_COST),
+        )
+
+        if tables is not None:
+            self._distance = tables['distance']
+            self.row_of = shared_table(tables['row_of'], 'i')
+            self.col_of = shared_table(tables['col_of'], 'i')
+            self.octile = shared_table(tables['octile'], 'q')
+            self._blocked = {int(key[len('blocked_'):]): shared_table(value, 'B')
+                             for key, value in tables.items() if key.startswith('blocked_')}
+        else:
+            # Border cells get distance -1 so they are blocked at every padding level
+            bordered = np.full((rows + 2, cols + 2), -1, dtype=np.int32)
+            bordered[1:-1, 1:-1] = distance
+            self._distance = bordered
+            self._blocked = {}
+
+            flat = np.arange(self.size, dtype=np.int32)
+            self.row_of = array('i', (flat // width).tobytes())
+            self.col_of = array('i', (flat % width).tobytes())
+
+            # Octile distance for every (|d_row|, |d_col|), flattened as d_row * width + d_col
+            d_row, d_col = np.divmod(np.arange(self.size, dtype=np.int64), width)
+            octile = ORTHOGONAL_COST * np.maximum(d_row, d_col) + \
+                (DIAGONAL_COST - ORTHOGONAL_COST) * np.minimum(d_row, d_col)
+            self.octile = array('q', octile.tobytes())
+        self._max_distance = int(self._distance.max())
+
+        self._shift = self.size.bit_length()
+        self._mask = (1 << self._shift) - 1
+        self._unreached = array('q', [UNREACHED]) * self.size
+        self._open = bytes(self.size)
+        # Resetting one cell takes about as long as copying 250 cells of the whole buffers
+        self._reset_cells = self.size // 250
+        self._local = threading.local()
+
+    def index(self, row, col):
+        """Flat index of grid cell (row, col)."""
+        return (row + 1) * self.width + col + 1
+
+    def cell(self, index):
+        """Grid cell (row, col) of a flat index."""
+        row, col = divmod(index, self.width)
+        return row - 1, col - 1
+
+    def blocked(self, padding):
+        """Blocked-cell mask for a padding radius, built once per radius.
+
+        Returns:
+            bytearray: 1 for cells inside the padding (or the border), indexed by flat index
+        """
+        padding = min(max(padding, 0), self._max_distance)
+        mask = self._blocked.get(padding)
+        if mask is None:
+            mask = bytearray((self._distance <= padding).astype(np.uint8).tobytes())
+            self._blocked[padding] = mask
+        return mask
+
+    def tables(self, paddings=()):
+        """The lookup tables of the engine as numpy arrays, to hand to another GridSearch.
+
+        Args:
+            paddings (iterable): Padding levels whose blocked masks are included
+
+        Returns:
+            dict: Bordered 'distance' transform, flat 'row_of', 'col_of' and 'octile' tables
+                and a 'blocked_<padding>' mask per padding level, viewing this engine's buffers
+        """
+        tables = {
+            'distance': self._distance,
+            'row_of': np.frombuffer(self.row_of, dtype=np.int32),
+            'col_of': np.frombuffer(self.col_of, dtype=np.int32),
+            'octile': np.frombuffer(self.octile, dtype=np.int64),
+        }
+        for padding in paddings:
+            padding = min(max(padding, 0), self._max_distance)
+            tables[f'blocked_{padding}'] = np.frombuffer(self.blocked(padding), dtype=np.uint8)
+        return tables
+
+    def is_traversable(self, row, col, padding):
+        return not self.blocked(padding)[self.index(row, col)]
+
+    def search(self, start, goal, padding=0):
+        """Find the shortest 8-connected path from start to goal.
+
+        Args:
+            start (tuple): (row, col) of the start cell
+            goal (tuple): (row, col) of the goal cell
+            padding (int): Cells within this chessboard distance of an obstacle are blocked
+
+        Returns:
+            SearchResult
+        """
+        return self.search_mask(self.blocked(padding), start, goal)
+
+    def cost_layer(self, costs, weight=1):
+        """Convert per-cell extra costs into the flat layer search_mask takes.
+
+        Args:
+            costs (np.ndarray): Non-negative (rows, cols) array, in cells, added to every step into a cell
+                (e.g. padding_costs)
+            weight (float): Factor applied to every cost
+
+        Returns:
+            array: Integer step costs indexed by flat index, 0 on the border
+        """
+        bordered = np.zeros((self.rows + 2, self.cols + 2), dtype=np.int64)
+        bordered[1:-1, 1:-1] = np.rint(np.asarray(costs, dtype=float) * weight * ORTHOGONAL_COST)
+        if bordered.min() < 0:
+            raise ValueError("Cell costs must not be negative")
+        return array('q', bordered.tobytes())
+
+    def search_mask(self, blocked, start, goal, costs=None):
+        """Find the shortest path like search, over a caller-supplied blocked mask.
+
+        Args:
+            blocked (bytearray): Mask indexed like blocked(), whose border cells must be blocked
+            start (tuple): (row, col) of the start cell
+            goal (tuple): (row, col) of the goal cell
+            costs (array): Optional cost layer from cost_layer(), added to every step into a cell.
+                The result's cost then includes it.
+
+        Returns:
+            SearchResult
+        """
+        source = self.index(*start)
+        target = self.index(*goal)
+        if blocked[source] or blocked[target]:
+            return NO_PATH
+        if costs is not None:
+            return self._search_weighted(blocked, costs, source, target)
+
+        g, parent, closed = self._buffers()
+
+        row_of, col_of, octile = self.row_of, self.col_of, self.octile
+        goal_row, goal_col = row_of[target], col_of[target]
+        width = self.width
+        h_row = [abs(row - goal_row) * width for row in range(self.rows + 2)]
+        h_col = [abs(col - goal_col) for col in range(width)]
+        steps = self.steps
+        shift, mask = self._shift, self._mask
+
+        g[source] = 0
+        open_set = [(octile[h_row[row_of[source]] + h_col[col_of[source]]] << shift) | source]
+        expanded = 0
+        peak = 1
+
+        while open_set:
+            current = heappop(open_set) & mask
+            if closed[current]:
+                continue  # Stale entry superseded by a cheaper one
+            if current == target:
+                result = SearchResult(self._trace(parent, source, target), g[target] / ORTHOGONAL_COST,
+                                      expanded, peak)
+                self._release_near(source, target, g[target])
+                return result
+            closed[current] = 1
+            expanded += 1
+
+            g_current = g[current]
+            for offset, step in steps:
+                neighbor = current + offset
+                if blocked[neighbor] or closed[neighbor]:
+                    continue
+                tentative = g_current + step
+                if tentative < g[neighbor]:
+                    g[neighbor] = tentative
+                    parent[neighbor] = current
+                    f = tentative + octile[h_row[row_of[neighbor]] + h_col[col_of[neighbor]]]
+                    heappush(open_set, (f << shift) | neighbor)
+            if len(open_set) > peak:
+                peak = len(open_set)
+
+        self._reset()
+        return SearchResult([], None, expanded, peak)
+
+    def _search_weighted(self, blocked, costs, source, target):
+        # The loop of search_mask with the cost layer added to every step. It is kept
+        # separate so unweighted searches, which serve requests, pay nothing for it.
+        # The octile heuristic stays admissible since layer costs are never negative.
+        g, parent, closed = self._buffers()
+
+        row_of, col_of, octile = self.row_of, self.col_of, self.octile
+        goal_row, goal_col = row_of[target], col_of[target]
+        width = self.width
+        h_row = [abs(row - goal_row) * width for row in range(self.rows + 2)]
+        h_col = [abs(col - goal_col) for col in range(width)]
+        steps = self.steps
+        shift, mask = self._shift, self._mask
+
+        g[source] = 0
+        open_set = [(octile[h_row[row_of[source]] + h_col[col_of[source]]] << shift) | source]
+        expanded = 0
+        peak = 1
+
+        while open_set:
+            current = heappop(open_set) & mask
+            if closed[current]:
+                continue
+            if current == target:
+                result = SearchResult(self._trace(parent, source, target), g[target] / ORTHOGONAL_COST,
+                                      expanded, peak)
+                self._release_near(source, target, g[target])
+                return result
+            closed[current] = 1
+            expanded += 1
+
+            g_current = g[current]
+            for offset, step in steps:
+                neighbor = current + offset
+                if blocked[neighbor] or closed[neighbor]:
+                    continue
+                tentative = g_current + step + costs[neighbor]
+                if tentative < g[neighbor]:
+                    g[neighbor] = tentative
+                    parent[neighbor] = current
+                    f = tentative + octile[h_row[row_of[neighbor]] + h_col[col_of[neighbor]]]
+                    heappush(open_set, (f << shift) | neighbor)
+            if len(open_set) > peak:
+                peak = len(open_set)
+
+        self._reset()
+        return SearchResult([], None, expanded, peak)
+
+    def line_of_sight(self, blocked, start, end):
+        """Whether the straight segment between two cell centres only crosses free cells.
+
+        Every cell the segment touches is checked. Where it passes exactly
+        through a corner, both cells beside the corner must be free, so a
+        straight line never squeezes between two obstacles.
+
+        Args:
+            blocked (bytearray): Mask indexed like blocked()
+            start (tuple): (row, col) of the first cell
+            end (tuple): (row, col) of the last cell
+
+        Returns:
+            bool
+        """
+        return self.line_cost(blocked, self.index(*start), self.index(*end)) is not None
+
+    def line_cost(self, blocked, source, target, costs=None):
+        """Walk the straight segment between two flat indices like line_of_sight.
+
+        Args:
+            blocked (bytearray): Mask indexed like blocked()
+            source (int): Flat index of the first cell
+            target (int): Flat index of the last cell
+            costs (array): Optional cost layer from cost_layer()
+
+        Returns:
+            int or None: Sum of the layer costs of every cell entered after source
+                (0 without a layer), or None if the segment is blocked
+        """
+        if blocked[source]:
+            return None
+        width = self.width
+        start_row, start_col = divmod(source, width)
+        end_row, end_col = divmod(target, width)
+        d_row, d_col = abs(end_row - start_row), abs(end_col - start_col)
+        row_step = width if end_row > start_row else -width
+        col_step = 1 if end_col > start_col else -1
+
+        current = source
+        total = 0
+        # The sign of error says whether the segment next crosses a column or a row border
+        error = d_col - d_row
+        while current != target:
+            if error > 0:
+                current += col_step
+                error -= 2 * d_row
+            elif error < 0:
+                current += row_step
+                error += 2 * d_col
+            else:
+                if blocked[current + col_step] or blocked[current + row_step]:
+                    return None
+                current += col_step + row_step
+                error += 2 * (d_col - d_row)
+            if blocked[current]:
+                return None
+            if costs is not None:
+                total += costs[current]
+        return total
+
+    def _trace(self, parent, source, target):
+        path = []
+        current = target
+        while current != source:
+            path.append(self.cell(current))
+            current = parent[current]
+        path.append(self.cell(source))
+        path.reverse()
+        return path
+
+    def _buffers(self):
+        # Each thread gets its own buffers so concurrent requests never share state.
+        # A search hands them back clean with _release, _release_near or _reset;
+        # parents are only read where g is set.
+        local = self._local
+        if not hasattr(local, 'g'):
+            local.g = array('q', self._unreached)
+            local.parent = array('i', bytes(4 * self.size))
+            local.closed = bytearray(self.size)
+        elif local.dirty:
+            # The previous search raised before it released them
+            self._reset()
+        local.dirty = True
+        return local.g, local.parent, local.closed
+
+    def _release(self, expanded, open_set, target):
+        # Reset what a search wrote: g and closed of the cells it expanded, g of the cells
+        # still queued, and g of the target, which is popped without being expanded.
+        # Past _reset_cells cells, copying the whole buffers is the cheaper way.
+        if len(expanded) + len(open_set) > self._reset_cells:
+            self._reset()
+            return
+        local = self._local
+        g, closed = local.g, local.closed
+        unreached, mask = UNREACHED, self._mask
+        for cell in expanded:
+            g[cell] = unreached
+            closed[cell] = 0
+        for entry in open_set:
+            g[entry & mask] = unreached
+        g[target] = unreached
+        local.dirty = False
+
+    def _release_near(self, source, target, cost):
+        # Reset what an A* search of this class wrote without having listed the cells.
+        # Every expanded cell has a g-score and an octile distance to the target of at
+        # most the path cost, and a step costs at least ORTHOGONAL_COST, so it lies within
+        # cost // ORTHOGONAL_COST rows and columns of both ends. Every other cell written
+        # neighbours one of them, so only the box one cell further out is reset.
+        row_of, col_of = self.row_of, self.col_of
+        reach = cost // ORTHOGONAL_COST + 1
+        top = max(row_of[source], row_of[target]) - reach
+        bottom = min(row_of[source], row_of[target]) + reach
+        left = max(col_of[source], col_of[target]) - reach
+        right = min(col_of[source], col_of[target]) + reach
+        top, bottom = max(top, 0), min(bottom, self.rows + 1)
+        left, right = max(left, 0), min(right, self.width - 1) + 1
+        if (bottom - top + 1) * (right - left) > self.size // 2:
+            self._reset()
+            return
+        local = self._local
+        g, closed = local.g, local.closed
+        unreached, opened, width = self._unreached, self._open, self.width
+        for row in range(top, bottom + 1):
+            first, last = row * width + left, row * width + right
+            g[first:last] = unreached[first:last]
+            closed[first:last] = opened[first:last]
+        local.dirty = False
+
+    def _reset(self):
+        local = self._local
+        local.g[:] = self._unreached
+        local.closed[:] = self._open
+        local.dirty = False
+
+
+def shared_table(values, typecode):
+    """Flat view of a contiguous numpy array that indexes to plain ints like an array of typecode.
+
+    Args:
+        values (np.ndarray): Table to read in place, e.g. a view of shared memory
+        typecode (str): array typecode of the same item size as values' dtype
+
+    Returns:
+        memoryview
+    """
+    return memoryview(values).cast('B').cast(typecode)
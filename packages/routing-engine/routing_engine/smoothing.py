@@ -0,0 +1,245 @@
+"""
+Smoothing of grid paths for display: corner cutting or splines, resampled by length
+"""
+import logging
+
+import numpy as np
+from scipy.interpolate import splev, splprep
+
+logger = logging.getLogger(__name__)
+
+SMOOTHING_METHODS = ('chaikin', 'spline')
+# Path length, in cells, between output points, so short hops get a few points and long routes many
+POINT_SPACING = 1.0
+# Rounds of corner cutting; each doubles the points and rounds the corners further
+CHAIKIN_ITERATIONS = 3
+# Distance, in cells, between the samples of a smoothed path that are checked against the obstacles
+CHECK_SPACING = 0.25
+
+
+def smooth_paths(paths, blocked=None, method='chaikin', spacing=POINT_SPACING, iterations=CHAIKIN_ITERATIONS,
+                 smoothing_factor=0.5):
+    """Smooth a batch of grid paths and resample each one evenly along its length.
+
+    Chaikin corner cutting runs on all paths of the batch at once, as a few
+    array operations over their concatenated points. The spline is fitted per
+    path and is slower; paths it cannot fit fall back to corner cutting.
+
+    With blocked, every smoothed path is checked against the obstacles. A corner
+    whose rounding would cross a blocked cell is kept sharp and the path is cut
+    again, and a spline that crosses one is replaced by corner cutting, so a
+    path that avoided the obstacles still avoids them once smoothed.
+
+    Args:
+        paths: (row, col) cells or waypoints of each path, as lists or (n, 2) arrays
+        blocked (np.ndarray): Optional 2D mask of the grid, nonzero where paths may not go
+        method (str): 'chaikin' or 'spline'
+        spacing (float): Path length, in cells, between output points
+        iterations (int): Rounds of corner cutting
+        smoothing_factor (float): How far the spline may stray from the points (0 to 1)
+
+    Returns:
+        list: One (m, 2) float array of (row, col) points per path, where m grows with the
+            path's length; empty paths stay empty
+    """
+    if method not in SMOOTHING_METHODS:
+        raise ValueError(f"Unknown smoothing method {method!r}; choose from {list(SMOOTHING_METHODS)}")
+    paths = [np.asarray(path, dtype=float).reshape(-1, 2) for path in paths]
+    if blocked is not None:
+        blocked = np.asarray(blocked) != 0
+
+    smoothed = [path if not len(path) else None for path in paths]
+    if method == 'spline':
+        for index, path in enumerate(paths):
+            if len(path):
+                smoothed[index] = _spline(path, smoothing_factor, _point_count(_length(path), spacing))
+        if blocked is not None:
+            fitted = [index for index, curve in enumerate(smoothed) if curve is not None and len(curve)]
+            if fitted:
+                curves, starts = _pack([smoothed[index] for index in fitted])
+                _, owners = _collisions(curves, starts, blocked)
+                for owner in np.unique(owners):
+                    smoothed[fitted[owner]] = None
+
+    pending = [index for index, curve in enumerate(smoothed) if curve is None]
+    if pending:
+        points, starts = _pack([paths[index] for index in pending])
+        curves, curve_starts = _chaikin_until_clear(points, starts, blocked, spacing, iterations)
+        for owner, index in enumerate(pending):
+            smoothed[index] = curves[curve_starts[owner]:curve_starts[owner + 1]]
+    return smoothed
+
+
+def smooth_path(path_points, smoothing_factor=0.5, num_points=None):
+    """
+    Smooth a path using B-splines.
+
+    Args:
+        path_points: List or array of (x, y) points representing the path
+        smoothing_factor: Controls how closely the spline follows the original points (0 to 1)
+        num_points: Number of points to generate along the smoothed path, defaults to one
+            per unit of path length
+
+    Returns:
+        Tuple of (x_smooth, y_smooth) arrays; the original points if there are fewer than
+        four or the fit fails
+    """
+    points = np.asarray(path_points, dtype=float).reshape(-1, 2)
+    curve = _spline(points, smoothing_factor, num_points or _point_count(_length(points), POINT_SPACING))
+    if curve is None:
+        curve = points
+    return curve[:, 0], curve[:, 1]
+
+
+def path_points(path, cell_size):
+    """
+    Convert grid cells to the (x, y) coordinates of their centres, e.g. canvas pixels.
+
+    Args:
+        path: List or array of (row, col) grid coordinates
+        cell_size: Size of each grid cell
+
+    Returns:
+        List of (x, y) points
+    """
+    points = np.asarray(path, dtype=float).reshape(-1, 2)[:, ::-1] * cell_size + cell_size / 2
+    return list(map(tuple, points.tolist()))
+
+
+def get_smooth_path_points(path, cell_size, smoothing_factor=0.5, method='chaikin', blocked=None,
+                           spacing=POINT_SPACING):
+    """
+    Convert grid path to smooth path points.
+
+    Args:
+        path: List of (row, col) grid coordinates
+        cell_size: Size of each grid cell
+        smoothing_factor: Controls spline smoothness (0 to 1)
+        method: 'chaikin' or 'spline', see smooth_paths
+        blocked: Optional 2D mask of the grid that the smoothed path must not cross
+        spacing: Path length, in cells, between output points
+
+    Returns:
+        List of (x, y) points representing the smoothed path
+    """
+    curve, = smooth_paths([path], blocked, method, spacing, smoothing_factor=smoothing_factor)
+    return path_points(curve, cell_size)
+
+
+def _chaikin_until_clear(points, starts, blocked, spacing, iterations):
+    # Corners are kept sharp by doubling them, which makes corner cutting leave them in place.
+    # Each round pins the corners nearest to the samples that cross an obstacle; once every
+    # corner involved is pinned, the path is back to its own straight segments.
+    pinned = np.zeros(len(points), dtype=bool)
+    while True:
+        repeats = 1 + pinned
+        shifted = np.concatenate([[0], np.cumsum(repeats)])[starts]
+        curves, curve_starts = _resample(*_chaikin(np.repeat(points, repeats, axis=0), shifted, iterations),
+                                         spacing)
+        if blocked is None:
+            return curves, curve_starts
+        hits, owners = _collisions(curves, curve_starts, blocked)
+        corners = _nearest_corners(points, starts, hits, owners) & ~pinned
+        if not corners.any():
+            return curves, curve_starts
+        pinned |= corners
+
+
+def _chaikin(points, starts, iterations):
+    # Every point of a path but its ends is replaced by the points a quarter and three
+    # quarters of the way along the segments next to it, so each path doubles in length
+    for _ in range(iterations):
+        first, last = starts[:-1], starts[1:] - 1
+        inner = np.ones(len(points), dtype=bool)
+        inner[last] = False
+        segment = np.flatnonzero(inner)
+        here, there = points[segment], points[segment + 1]
+        cut = np.empty((2 * len(points), 2))
+        cut[2 * first] = points[first]
+        cut[2 * segment + 1] = 0.75 * here + 0.25 * there
+        cut[2 * segment + 2] = 0.25 * here + 0.75 * there
+        cut[2 * last + 1] = points[last]
+        points, starts = cut, 2 * starts
+    return points, starts
+
+
+def _resample(points, starts, spacing):
+    # Distance along the concatenated paths, with a gap between paths so none share a distance
+    along = np.concatenate([[0], np.cumsum(np.hypot(*np.diff(points, axis=0).T))])
+    gaps = np.zeros(len(points))
+    gaps[starts[1:-1]] = along[starts[1:-1]] - along[starts[1:-1] - 1] - 1
+    along -= np.cumsum(gaps)
+
+    begin, end = along[starts[:-1]], along[starts[1:] - 1]
+    counts = _point_count(end - begin, spacing)
+    resampled_starts = np.concatenate([[0], np.cumsum(counts)])
+    owner = np.repeat(np.arange(len(counts)), counts)
+    position = np.arange(resampled_starts[-1]) - resampled_starts[owner]
+    targets = begin[owner] + (end - begin)[owner] * position / np.maximum(counts - 1, 1)[owner]
+    targets[resampled_starts[1:] - 1] = end
+    resampled = np.column_stack([np.interp(targets, along, points[:, 0]), np.interp(targets, along, points[:, 1])])
+    return resampled, resampled_starts
+
+
+def _collisions(points, starts, blocked):
+    """Samples of the paths that lie in blocked cells or off the grid, and the path each belongs to."""
+    owner = np.repeat(np.arange(len(starts) - 1), np.diff(starts))
+    inner = np.ones(len(points), dtype=bool)
+    inner[starts[1:] - 1] = False
+    segment = np.flatnonzero(inner)
+    delta = points[segment + 1] - points[segment]
+    counts = np.ceil(np.hypot(delta[:, 0], delta[:, 1]) / CHECK_SPACING).astype(np.int64)
+    sampled = np.repeat(np.arange(len(segment)), counts)
+    fraction = (np.arange(len(sampled)) - np.repeat(np.cumsum(counts) - counts, counts)) / counts[sampled]
+
+    samples = np.concatenate([points, points[segment[sampled]] + fraction[:, None] * delta[sampled]])
+    owners = np.concatenate([owner, owner[segment[sampled]]])
+    cells = np.rint(samples).astype(np.int64)
+    rows, cols = blocked.shape
+    inside = (cells[:, 0] >= 0) & (cells[:, 0] < rows) & (cells[:, 1] >= 0) & (cells[:, 1] < cols)
+    hit = ~inside
+    hit[inside] = blocked[cells[inside, 0], cells[inside, 1]]
+    return samples[hit], owners[hit]
+
+
+def _nearest_corners(points, starts, hits, owners):
+    """Mask of the corners (points other than path ends) nearest to each hit of their path."""
+    corners = np.zeros(len(points), dtype=bool)
+    for owner in np.unique(owners):
+        first, last = starts[owner] + 1, starts[owner + 1] - 1
+        if first >= last:
+            continue
+        offsets = hits[owners == owner][:, None, :] - points[first:last][None, :, :]
+        corners[first + np.unique(np.einsum('ijk,ijk->ij', offsets, offsets).argmin(axis=1))] = True
+    return corners
+
+
+def _spline(points, smoothing_factor, count):
+    # splprep rejects repeated points, which pinned or duplicated cells would otherwise bring
+    distinct = np.ones(len(points), dtype=bool)
+    distinct[1:] = np.any(np.diff(points, axis=0) != 0, axis=1)
+    points = points[distinct]
+    if len(points) < 4:  # Need at least 4 points for a cubic spline
+        return None
+    try:
+        tck, _ = splprep(points.T, s=len(points) * smoothing_factor, k=3)
+    except (ValueError, TypeError) as error:
+        logger.debug("Could not fit a spline through %d points: %s", len(points), error)
+        return None
+    return np.column_stack(splev(np.linspace(0, 1, count), tck))
+
+
+def _pack(paths):
+    """Concatenate non-empty (n, 2) arrays, with the offset of each one and the total at the end."""
+    starts = np.concatenate([[0], np.cumsum([len(path) for path in paths])]).astype(np.int64)
+    return np.concatenate(paths), starts
+
+
+def _length(points):
+    return float(np.hypot(*np.diff(points, axis=0).T).sum()) if len(points) > 1 else 0.0
+
+
+def _point_count(length, spacing):
+    """Points to place along a path of this length: both ends and one per spacing, or one for a single point."""
+    counts = np.where(np.asarray(length) > 0, np.maximum(2, np.ceil(np.asarray(length) / spacing) + 1), 1)
+    return counts.astype(np.int64) if counts.ndim else int(counts)
@@ -0,0 +1,34 @@
+"""
+Nearest-cell lookup used to snap points onto walkable, entrance or hallway cells
+"""
+from array import array
+
+import numpy as np
+from scipy import ndimage
+
+
+class SnapIndex:
+    """Nearest target cell for every cell of the grid.
+
+    Built once per map version from a Euclidean feature transform, so snapping
+    a point is a single array read however far it is from the nearest target.
+    """
+
+    def __init__(self, targets):
+        """
+        Args:
+            targets (np.ndarray): 2D bool array, True for cells a point may be snapped to
+        """
+        targets = np.asarray(targets, dtype=bool)
+        self.rows, self.cols = targets.shape
+        self._nearest = None
+        if targets.any():
+            # For every cell, the indices of the closest cell where targets is True
+            indices = ndimage.distance_transform_edt(~targets, return_distances=False, return_indices=True)
+            self._nearest = array('i', (indices[0] * self.cols + indices[1]).astype(np.int32).tobytes())
+
+    def nearest(self, row, col):
+        """Return the (row, col) of the nearest target cell, or (None, None) if there is none."""
+        if self._nearest is None or not (0 <= row < self.rows and 0 <= col < self.cols):
+            return None, None
+        return divmod(self._nearest[row * self.cols + col], self.cols)
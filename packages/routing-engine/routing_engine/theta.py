@@ -0,0 +1,227 @@
+"""
+Any-angle Lazy Theta* over the grid, whose paths need no smoothing
+"""
+import threading
+from array import array
+from heapq import heappop, heappush
+from math import ceil, floor
+
+import numpy as np
+
+from routing_engine.search import ORTHOGONAL_COST, SearchResult, NO_PATH, shared_table
+
+# Length in cells of the pieces whose bounding boxes are checked before walking a segment
+PIECE_CELLS = 16
+
+
+class ThetaStarSearch:
+    """Lazy Theta*: A* whose paths run in any direction between cells that see each other.
+
+    A successor takes its parent's parent as its own parent whenever the
+    straight segment between them is clear, so paths only bend at obstacle
+    corners and come back as a few waypoints instead of every cell. The lazy
+    variant assumes the segment is clear when a cell is generated and checks
+    it with a single line-of-sight test when the cell is expanded, falling back
+    to the best expanded neighbour if it is blocked, so there is one check per
+    expansion rather than one per neighbour.
+
+    Segments use the same corner rule as GridSearch.line_of_sight, so they
+    never cross a blocked cell at the search's padding. A cell whose assumed
+    segment turns out blocked (or dearer, with a cost layer) is queued again at
+    its true cost, so paths are never longer than the 8-connected shortest path
+    and usually a few percent shorter, though not always the shortest any-angle path.
+
+    Most segments checked are clear, so before walking one cell by cell the
+    search splits it into pieces of PIECE_CELLS cells and looks up whether the
+    bounding box of each piece holds any blocked cell, in a summed-area table
+    built once per padding level. A clear segment then costs a few lookups
+    instead of a walk over every cell it crosses.
+    """
+
+    def __init__(self, grid_search, tables=None):
+        """
+        Args:
+            grid_search (GridSearch): Engine whose blocked masks, buffers and line-of-sight checks are used
+            tables (dict): Optional arrays from tables() to read in place instead of building
+                private copies, e.g. views of a shared memory block
+        """
+        self.grid = grid_search
+        if tables is not None:
+            self.euclid = shared_table(tables['euclid'], 'q')
+            self._sums = {int(key[len('sums_'):]): shared_table(value, 'q')
+                          for key, value in tables.items() if key.startswith('sums_')}
+        else:
+            # Straight-line distance for every (|d_row|, |d_col|), flattened like GridSearch.octile
+            d_row, d_col = np.divmod(np.arange(grid_search.size, dtype=np.int64), grid_search.width)
+            self.euclid = array('q', np.rint(np.hypot(d_row, d_col) * ORTHOGONAL_COST).astype(np.int64).tobytes())
+            self._sums = {}
+        self._lock = threading.Lock()
+
+    def tables(self, paddings=()):
+        """The lookup tables of the engine as numpy arrays, to hand to another ThetaStarSearch.
+
+        Args:
+            paddings (iterable): Padding levels whose blocked_sums() tables are included
+
+        Returns:
+            dict: Flat 'euclid' table and a 'sums_<padding>' table per padding level
+        """
+        tables = {'euclid': np.frombuffer(self.euclid, dtype=np.int64)}
+        for padding in paddings:
+            tables[f'sums_{padding}'] = np.frombuffer(self.blocked_sums(padding), dtype=np.int64)
+        return tables
+
+    def blocked_sums(self, padding):
+        """Summed-area table of the blocked mask for a padding level, built once per level.
+
+        Returns:
+            array: Flat table with rows + 3 rows of width + 1 entries, where entry
+                (row, col) counts the blocked cells above and left of bordered cell (row, col)
+        """
+        sums = self._sums.get(padding)
+        if sums is None:
+            with self._lock:
+                sums = self._sums.get(padding)
+                if sums is None:
+                    sums = self._sums[padding] = _summed_area(self.grid.blocked(padding), self.grid.width)
+        return sums
+
+    def search(self, start, goal, padding=0):
+        """Find an any-angle path from start to goal.
+
+        Args:
+            start (tuple): (row, col) of the start cell
+            goal (tuple): (row, col) of the goal cell
+            padding (int): Cells within this chessboard distance of an obstacle are blocked
+
+        Returns:
+            SearchResult: path holds only the start, the turns and the goal
+        """
+        return self._search(self.grid.blocked(padding), start, goal, None, self.blocked_sums(padding))
+
+    def search_mask(self, blocked, start, goal, costs=None):
+        """Find an any-angle path like search, over a caller-supplied blocked mask.
+
+        Args:
+            blocked (bytearray): Mask indexed like GridSearch.blocked(), whose border cells must be blocked
+            start (tuple): (row, col) of the start cell
+            goal (tuple): (row, col) of the goal cell
+            costs (array): Optional cost layer from GridSearch.cost_layer(); a segment then
+                costs its length plus the layer cost of every cell it enters
+
+        Returns:
+            SearchResult
+        """
+        return self._search(blocked, start, goal, costs, None)
+
+    def _search(self, blocked, start, goal, costs, sums):
+        grid = self.grid
+        source = grid.index(*start)
+        target = grid.index(*goal)
+        if blocked[source] or blocked[target]:
+            return NO_PATH
+
+        g, parent, closed = grid._buffers()
+
+        width = grid.width
+        row_of, col_of, euclid = grid.row_of, grid.col_of, self.euclid
+        goal_row, goal_col = row_of[target], col_of[target]
+        h_row = [abs(row - goal_row) * width for row in range(grid.rows + 2)]
+        h_col = [abs(col - goal_col) for col in range(width)]
+        steps = grid.steps
+        shift, mask = grid._shift, grid._mask
+        line_cost = grid.line_cost
+        sums_width = width + 1
+
+        def length(a, b):
+            return euclid[abs(row_of[a] - row_of[b]) * width + abs(col_of[a] - col_of[b])]
+
+        def clear_boxes(a, b):
+            # Whether the bounding boxes of the pieces of segment a-b, which cover every cell
+            # it touches, are free of blocked cells. Cell centres lie on integer coordinates.
+            a_row, a_col = row_of[a], col_of[a]
+            d_row, d_col = row_of[b] - a_row, col_of[b] - a_col
+            pieces = max(abs(d_row), abs(d_col)) // PIECE_CELLS + 1
+            row, col = a_row, a_col
+            for piece in range(1, pieces + 1):
+                next_row, next_col = a_row + d_row * piece / pieces, a_col + d_col * piece / pieces
+                top = ceil(min(row, next_row) - 0.5 - 1e-9) * sums_width
+                bottom = (floor(max(row, next_row) + 0.5 + 1e-9) + 1) * sums_width
+                left = ceil(min(col, next_col) - 0.5 - 1e-9)
+                right = floor(max(col, next_col) + 0.5 + 1e-9) + 1
+                if sums[bottom + right] - sums[top + right] - sums[bottom + left] + sums[top + left]:
+                    return False
+                row, col = next_row, next_col
+            return True
+
+        g[source] = 0
+        parent[source] = source
+        open_set = [(euclid[h_row[row_of[source]] + h_col[col_of[source]]] << shift) | source]
+        expanded = []  # Cells in the order they were closed
+        expand = expanded.append
+        peak = 1
+
+        while open_set:
+            entry = heappop(open_set)
+            current = entry & mask
+            if closed[current]:
+                continue  # Stale entry superseded by a cheaper one
+
+            # Check the segment from the parent that was assumed to be clear when current was generated
+            ancestor = parent[current]
+            if ancestor != current and (sums is None or not clear_boxes(ancestor, current)):
+                segment = line_cost(blocked, ancestor, current, costs)
+                if segment is None or segment:
+                    best = g[ancestor] + length(ancestor, current) + segment if segment is not None else None
+                    extra = costs[current] if costs is not None else 0
+                    for offset, step in steps:
+                        neighbor = current - offset
+                        if closed[neighbor]:
+                            tentative = g[neighbor] + step + extra
+                            if best is None or tentative < best:
+                                best = tentative
+                                ancestor = neighbor
+                    g[current] = best
+                    parent[current] = ancestor
+                    # The assumed segment was too cheap: queue current again at its true cost,
+                    # in case other cells are now closer to the goal than it is
+                    f = best + euclid[h_row[row_of[current]] + h_col[col_of[current]]]
+                    if f > entry >> shift:
+                        heappush(open_set, (f << shift) | current)
+                        continue
+
+            if current == target:
+                result = SearchResult(grid._trace(parent, source, target), g[target] / ORTHOGONAL_COST,
+                                      len(expanded), peak)
+                grid._release(expanded, open_set, target)
+                return result
+            closed[current] = 1
+            expand(current)
+
+            # Every successor is first assumed to see the grandparent
+            ancestor = parent[current]
+            g_ancestor = g[ancestor]
+            ancestor_row, ancestor_col = row_of[ancestor], col_of[ancestor]
+            for offset, _ in steps:
+                neighbor = current + offset
+                if blocked[neighbor] or closed[neighbor]:
+                    continue
+                tentative = g_ancestor + euclid[abs(row_of[neighbor] - ancestor_row) * width +
+                                                abs(col_of[neighbor] - ancestor_col)]
+                if tentative < g[neighbor]:
+                    g[neighbor] = tentative
+                    parent[neighbor] = ancestor
+                    f = tentative + euclid[h_row[row_of[neighbor]] + h_col[col_of[neighbor]]]
+                    heappush(open_set, (f << shift) | neighbor)
+            if len(open_set) > peak:
+                peak = len(open_set)
+
+        grid._release(expanded, open_set, target)
+        return SearchResult([], None, len(expanded), peak)
+
+
+def _summed_area(blocked, width):
+    mask = np.frombuffer(blocked, dtype=np.uint8).reshape(-1, width)
+    sums = np.zeros((mask.shape[0] + 1, width + 1), dtype=np.int64)
+    sums[1:, 1:] = mask.cumsum(axis=0).cumsum(axis=1)
+    return array('q', sums.tobytes())
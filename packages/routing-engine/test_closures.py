@@ -0,0 +1,81 @@
+import numpy as np
+
+from routing_engine import (ClosureOverlay, ComponentIndex, DStarLite, GeoReference, GridSearch, obstacle_distance,
+                            polygon_cells)
+
+
+def random_grid(rng, rows=40, cols=50, density=0.2):
+    grid = (rng.random((rows, cols)) < density).astype(np.uint8)
+    return grid, GridSearch(obstacle_distance(grid))
+
+
+def test_dstar_lite_replans_like_a_fresh_search():
+    rng = np.random.default_rng(3)
+    for _ in range(20):
+        grid, engine = random_grid(rng)
+        free = np.argwhere(grid == 0)
+        start, goal = (tuple(cell) for cell in free[rng.choice(len(free), 2, replace=False)].tolist())
+        blocked = engine.blocked(0)
+        planner = DStarLite(engine, blocked, start, goal)
+        for step in range(5):
+            if step:
+                # Close or open a random block, keeping the border and both ends as they were
+                mask = np.frombuffer(blocked, dtype=np.uint8).reshape(engine.rows + 2, engine.width).copy()
+                row, col = rng.integers(1, engine.rows - 3), rng.integers(1, engine.cols - 3)
+                mask[row:row + 4, col:col + 4] = rng.integers(0, 2)
+                mask[start[0] + 1, start[1] + 1] = mask[goal[0] + 1, goal[1] + 1] = 0
+                mask[0, :] = mask[-1, :] = mask[:, 0] = mask[:, -1] = 1
+                blocked = bytearray(mask.tobytes())
+                planner.update(blocked)
+            path = planner.plan()
+            expected = engine.search_mask(blocked, start, goal)
+            if expected.cost is None:
+                assert path == [] and planner.cost is None
+            else:
+                assert np.isclose(planner.cost, expected.cost)
+                assert path[0] == start and path[-1] == goal
+                assert not any(blocked[engine.index(*cell)] for cell in path)
+                assert np.isclose(np.hypot(*np.diff(np.array(path), axis=0).T).sum(), expected.cost, rtol=1e-4)
+
+
+def test_overlay_matches_a_rebuilt_grid():
+    rng = np.random.default_rng(5)
+    for _ in range(40):
+        grid, engine = random_grid(rng, 60, 70, rng.uniform(0, 0.1))
+        components = ComponentIndex(engine, (2, 0))
+        closures = []
+        for _ in range(rng.integers(1, 4)):
+            row, col = rng.integers(0, 55), rng.integers(0, 65)
+            height, width = rng.integers(1, 6, 2)
+            closures.append(np.argwhere(np.ones((height, width))) + (row, col))
+        overlay = ClosureOverlay(engine, obstacle_distance(grid), components, closures)
+
+        closed = grid.copy()
+        for cells in closures:
+            closed[cells[:, 0], cells[:, 1]] = 1
+        rebuilt = GridSearch(obstacle_distance(closed))
+        assert (overlay.obstacle_distance == obstacle_distance(closed)).all()
+        for padding in (2, 0):
+            assert overlay.blocked(padding) == rebuilt.blocked(padding)
+            # The same partition into components, whatever the labels
+            labels = np.frombuffer(overlay.components.labels(padding), dtype=np.int32)
+            expected = np.frombuffer(ComponentIndex(rebuilt, (padding,)).labels(padding), dtype=np.int32)
+            assert ((labels == 0) == (expected == 0)).all()
+            pairs = set(zip(labels[expected > 0].tolist(), expected[expected > 0].tolist()))
+            assert len(pairs) == len({label for label, _ in pairs}) == len({label for _, label in pairs})
+
+
+def test_polygon_cells_and_nearest_open():
+    georeference = GeoReference(20, 20, (47.0, 47.2, -117.2, -117.0))
+    polygon = georeference.cells_to_lat_lng([(5, 5), (5, 9), (9, 9), (9, 5)])
+    cells = polygon_cells(georeference, polygon)
+    assert sorted(map(tuple, cells.tolist())) == [(row, col) for row in range(5, 10) for col in range(5, 10)]
+    # A sliver thinner than a cell still closes the cells its outline crosses
+    assert len(polygon_cells(georeference, georeference.cells_to_lat_lng([(2, 2), (2.1, 12), (2.2, 2)]))) >= 11
+
+    grid = np.zeros((20, 20), dtype=np.uint8)
+    engine = GridSearch(obstacle_distance(grid))
+    overlay = ClosureOverlay(engine, obstacle_distance(grid), ComponentIndex(engine, (0,)), [cells])
+    assert overlay.nearest_open(7, 7, grid == 0) in {(4, 7), (10, 7), (7, 4), (7, 10)}
+    assert overlay.nearest_open(1, 1, grid == 0) == (1, 1)
+    assert overlay.crosses([(4, 4), (10, 10)], 0) and not overlay.crosses([(4, 4), (4, 10)], 0)
@@ -0,0 +1,42 @@
+import numpy as np
+
+from routing_engine import (GridSearch, obstacle_distance, padding_cost_table, padding_costs, path_length,
+                            walking_minutes)
+
+
+def test_padding_costs_fall_off_with_distance():
+    assert padding_cost_table(2) == [1, 2 / 3, 1 / 3, 0]
+    grid = np.zeros((5, 9), dtype=np.uint8)
+    grid[:, 0] = 1
+    costs = padding_costs(obstacle_distance(grid), 2)
+    assert costs[2].tolist() == [1, 2 / 3, 1 / 3, 0, 0, 0, 0, 0, 0]
+
+
+def test_cost_layer_pulls_routes_away_from_obstacles():
+    # A wall along the top row: the shortest route hugs it, the weighted one keeps its distance
+    grid = np.zeros((8, 20), dtype=np.uint8)
+    grid[0, :] = 1
+    distance = obstacle_distance(grid)
+    engine = GridSearch(distance)
+    blocked = engine.blocked(0)
+    start, goal = (1, 1), (1, 18)
+
+    plain = engine.search_mask(blocked, start, goal)
+    assert all(row == 1 for row, _ in plain.path)
+    assert plain.cost == 17
+
+    weighted = engine.search_mask(blocked, start, goal, engine.cost_layer(padding_costs(distance, 2), weight=2))
+    assert weighted.path[0] == start and weighted.path[-1] == goal
+    assert max(row for row, _ in weighted.path) == 3
+    assert weighted.cost > path_length(weighted.path) >= plain.cost
+
+    # The unweighted search must not see the layer of an earlier weighted one on the same thread
+    assert engine.search_mask(blocked, start, goal).cost == 17
+
+
+def test_time_estimates():
+    assert path_length([(0, 0), (3, 4), (3, 10)]) == 11
+    assert path_length([(0, 0)]) == 0
+    # 840 m at 1.4 m/s is 10 minutes
+    assert walking_minutes(420, 2.0) == 10.0
+
@@ -0,0 +1,29 @@
+import numpy as np
+
+from routing_engine import GeoReference
+
+
+def test_cells_and_lat_lng_round_trip():
+    georeference = GeoReference(4, 5, (47.0, 47.4, -117.5, -117.0))
+    assert np.allclose(georeference.affine, (0.1, 0.0, -117.5, 0.0, -0.1, 47.4))
+    assert np.allclose(georeference.cell_to_lat_lng(0, 0), (47.35, -117.45))
+
+    cells = np.array([(row, col) for row in range(4) for col in range(5)])
+    lat_lng = georeference.cells_to_lat_lng(cells)
+    assert lat_lng.shape == (20, 2)
+    assert (georeference.lat_lng_to_cells(lat_lng) == cells).all()
+
+    # Points beyond the bounds map off the grid unless clipped
+    outside = [(47.45, -117.55), (46.95, -116.95)]
+    assert georeference.lat_lng_to_cells(outside).tolist() == [[-1, -1], [4, 5]]
+    assert georeference.lat_lng_to_cells(outside, clip=True).tolist() == [[0, 0], [3, 4]]
+    assert not georeference.contains(georeference.lat_lng_to_cells(outside)).any()
+    assert georeference.cells_to_lat_lng([]).shape == (0, 2)
+
+
+def test_from_bounds_matches_config():
+    bounds = (47.66194303535639, 47.67058157261991, -117.40947993580977, -117.39665975563432)
+    georeference = GeoReference.from_bounds(bounds, 2.0)
+    assert georeference.shape == (480, 480)
+    config = georeference.config()
+    assert GeoReference.from_config(config).affine == georeference.affine
@@ -0,0 +1,34 @@
+import math
+import random
+
+from routing_engine.distance_transform import obstacle_distance
+from routing_engine.polyline import decode_polyline, encode_polyline, simplify_path
+from routing_engine.search import GridSearch
+
+
+def test_encode_polyline_matches_reference_encoding():
+    points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+    assert encode_polyline(points) == '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+    assert decode_polyline(encode_polyline(points)) == points
+
+
+def test_simplified_paths_keep_clear_of_obstacles():
+    rng = random.Random(21)
+    for _ in range(30):
+        grid = [[1 if rng.random() < 0.2 else 0 for _ in range(40)] for _ in range(30)]
+        engine = GridSearch(obstacle_distance(grid))
+        free = [(row, col) for row in range(30) for col in range(40) if not grid[row][col]]
+        path = engine.search(rng.choice(free), rng.choice(free)).path
+        if not path:
+            continue
+
+        simplified = simplify_path(engine, path, 0)
+        assert simplified[0] == path[0] and simplified[-1] == path[-1]
+        assert set(simplified) <= set(path)
+        for a, b in zip(simplified, simplified[1:]):
+            # Segments that squeeze between obstacles must be straight runs of the original path
+            run = path[path.index(a):path.index(b) + 1]
+            steps = {(q[0] - p[0], q[1] - p[1]) for p, q in zip(run, run[1:])}
+            assert engine.line_of_sight(engine.blocked(0), a, b) or len(steps) == 1
+        length = sum(math.dist(a, b) for a, b in zip(path, path[1:]))
+        assert sum(math.dist(a, b) for a, b in zip(simplified, simplified[1:])) <= length + 1e-9
@@ -0,0 +1,35 @@
+import numpy as np
+
+from routing_engine import get_smooth_path_points, path_length, smooth_paths
+
+
+def test_smoothing_keeps_short_paths_and_resamples_by_length():
+    assert get_smooth_path_points([(0, 0), (0, 1)], cell_size=2) == [(1.0, 1.0), (3.0, 1.0)]
+    path = [(0, col) for col in range(10)] + [(row, 9) for row in range(1, 10)]
+    long_path = [(0, col) for col in range(100)]
+    short, long, single, empty = smooth_paths([path, long_path, [(3, 4)], []])
+    # One point per cell of length, and the ends stay where they were
+    assert len(short) == 19 and len(long) == 100
+    assert np.allclose(short[0], (0, 0)) and np.allclose(short[-1], (9, 9))
+    assert single.tolist() == [[3, 4]] and empty.shape == (0, 2)
+    assert np.allclose(np.diff(long[:, 1]), 1)
+
+    points = get_smooth_path_points(path, cell_size=2, method='spline')
+    assert len(points) == 19
+    assert np.allclose(points[0], (1, 1), atol=1)
+
+
+def test_smoothing_keeps_corners_that_would_cross_obstacles():
+    path = [(0, 0), (0, 9), (9, 9)]
+    blocked = np.zeros((12, 12), dtype=bool)
+    rounded, = smooth_paths([path], blocked)
+    assert path_length(rounded) < 18
+    assert not any(np.allclose(point, (0, 9)) for point in rounded)
+
+    # Buildings inside the bend: the corner stays sharp, for the spline as well
+    blocked[1:, :9] = True
+    for method in ('chaikin', 'spline'):
+        kept, = smooth_paths([path], blocked, method=method)
+        assert any(np.allclose(point, (0, 9)) for point in kept)
+        cells = np.rint(kept).astype(int)
+        assert not blocked[cells[:, 0], cells[:, 1]].any()
@@ -0,0 +1,56 @@
+import math
+import random
+
+import numpy as np
+
+from routing_engine import GridSearch, ThetaStarSearch, obstacle_distance, padding_costs, path_length
+
+
+def test_theta_paths_are_short_and_clear_of_obstacles():
+    rng = random.Random(22)
+    for _ in range(40):
+        rows, cols = rng.randint(8, 30), rng.randint(8, 30)
+        grid = [[1 if rng.random() < 0.25 else 0 for _ in range(cols)] for _ in range(rows)]
+        engine = GridSearch(obstacle_distance(grid))
+        theta = ThetaStarSearch(engine)
+        for padding in (0, 1):
+            free = [(row, col) for row in range(rows) for col in range(cols) if engine.is_traversable(row, col, padding)]
+            if len(free) < 2:
+                continue
+            start, goal = rng.sample(free, 2)
+            grid_result = engine.search(start, goal, padding)
+            result = theta.search(start, goal, padding)
+            assert bool(result.path) == bool(grid_result.path)
+            if not result.path:
+                continue
+            assert result.path[0] == start and result.path[-1] == goal
+            assert math.isclose(result.cost, path_length(result.path), rel_tol=1e-4)
+            assert math.dist(start, goal) * (1 - 1e-4) <= result.cost <= grid_result.cost * (1 + 1e-4)
+            blocked = engine.blocked(padding)
+            for a, b in zip(result.path, result.path[1:]):
+                assert max(abs(a[0] - b[0]), abs(a[1] - b[1])) == 1 or engine.line_of_sight(blocked, a, b)
+            # The bounding-box shortcut of search() must not change the result
+            assert theta.search_mask(blocked, start, goal).path == result.path
+
+
+def test_theta_returns_only_the_turns():
+    grid = np.zeros((40, 60), dtype=np.uint8)
+    grid[5:35, 30] = 1
+    engine = GridSearch(obstacle_distance(grid))
+    result = ThetaStarSearch(engine).search((20, 2), (20, 57), padding=1)
+    # Around one end of the padded wall: start, its two corners and the goal
+    assert result.path == [(20, 2), (36, 29), (36, 31), (20, 57)]
+    assert result.cost < engine.search((20, 2), (20, 57), padding=1).cost
+
+
+def test_theta_with_cost_layer_keeps_away_from_obstacles():
+    grid = np.zeros((12, 40), dtype=np.uint8)
+    grid[0, :] = 1
+    distance = obstacle_distance(grid)
+    engine = GridSearch(distance)
+    theta = ThetaStarSearch(engine)
+    costs = engine.cost_layer(padding_costs(distance, 3), weight=2)
+    result = theta.search_mask(engine.blocked(0), (1, 1), (1, 38), costs)
+    # Hugging the wall would cost 1.5 extra per cell; the path dips away from it instead
+    assert max(row for row, _ in result.path) >= 3
+    assert result.cost < engine.search_mask(engine.blocked(0), (1, 1), (1, 38), costs).cost + 1e-6